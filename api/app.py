@@ -0,0 +1,336 @@
+import base64
+import gzip
+import json
+import zlib
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+
+from api import db, export, result_cache
+from writers import compare, deals, ingest, search, units
+
+# Rows returned when a request does not ask for a limit, and the most it may ask for
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Query parameter -> (column, comparison, type) for the flower filters
+FILTERS = {
+    'location': ('Location', '=', str),
+    'brand': ('Brand', '=', str),
+    'strain': ('StrainType', '=', str),
+    'weight': ('Weight', '=', float),
+    'min_price': ('Price', '>=', float),
+    'max_price': ('Price', '<=', float),
+}
+
+# Sort parameter -> indexed column; a leading '-' sorts descending, id breaks ties
+SORT_KEYS = {
+    'price': 'Price',
+    'price_per_gram': 'PricePerGram',
+    'potency': 'Potency',
+    'id': 'id',
+}
+
+# Columns a client may ask for with fields=, returned by default when it does not
+FIELDS = ('id', 'Product', 'Brand', 'Potency', 'Weight', 'Price', 'PricePerGram', 'StrainType', 'Location', 'RunId')
+
+# Content codings bodies are precompressed with, in order of preference; gzip's timestamp
+# is fixed so a body always compresses to the same bytes
+COMPRESSORS = {
+    'gzip': lambda body: gzip.compress(body, mtime=0),
+    'deflate': zlib.compress,
+}
+
+class BadRequest(ValueError):
+    pass
+
+def parse_filters(args):
+    """ Turn query parameters into WHERE clauses and their parameters.
+
+    Only the filters present are added, in a fixed order, so every combination maps to the
+    same SQL text and reuses its cached statement.
+    """
+    clauses = []
+    params = []
+    for name, (column, comparison, kind) in FILTERS.items():
+        value = args.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            params.append(kind(value))
+        except ValueError:
+            raise BadRequest(f"{name} must be a number, got {value!r}")
+        clauses.append(f'{column} {comparison} ?')
+    return clauses, params
+
+def parse_limit(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest(f"limit must be an integer, got {args.get('limit')!r}")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f"limit must be between 1 and {MAX_LIMIT}")
+    return limit
+
+def parse_number(args, name, required=False):
+    """ Return a float query parameter, or None when it is optional and absent. """
+    value = args.get(name)
+    if value is None or value == '':
+        if required:
+            raise BadRequest(f"{name} is required")
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number, got {value!r}")
+
+def parse_band(args):
+    """ Return (weight bucket, strain type, min potency, max potency) for the comparison endpoints. """
+    bucket = units.weight_bucket(parse_number(args, 'weight', required=True))
+    return bucket, args.get('strain') or None, parse_number(args, 'min_potency'), parse_number(args, 'max_potency')
+
+def parse_sort(args):
+    """ Return (column, descending) for the sort parameter. """
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    column = SORT_KEYS.get(sort.lstrip('-'))
+    if column is None:
+        raise BadRequest(f"sort must be one of {', '.join(SORT_KEYS)}, optionally prefixed with '-'")
+    return column, descending
+
+def parse_fields(args):
+    """ Return the columns to send, in FIELDS order; names are matched case-insensitively. """
+    value = args.get('fields')
+    if not value:
+        return list(FIELDS)
+    lookup = {field.lower(): field for field in FIELDS}
+    wanted = set()
+    for name in value.split(','):
+        field = lookup.get(name.strip().lower())
+        if field is None:
+            raise BadRequest(f"unknown field {name.strip()!r}, expected some of {', '.join(FIELDS)}")
+        wanted.add(field)
+    return [field for field in FIELDS if field in wanted]
+
+def encode_cursor(sort_value, row_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+def decode_cursor(token):
+    """ Return the (sort value, id) of the last row of the previous page. """
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise BadRequest("cursor is not a cursor returned by this API")
+    return sort_value, row_id
+
+def keyset_query(clauses, params, column, descending, token, select, limit):
+    """ Build a keyset-paginated query over flower.
+
+    Rows after the cursor are found by seeking the (column, id) index rather than skipping
+    an OFFSET, so every page costs the same. Rows whose sort key is NULL have no place in
+    the order and are left out when sorting by anything but id.
+    """
+    clauses = list(clauses)
+    params = list(params)
+    if column != 'id':
+        clauses.append(f'{column} IS NOT NULL')
+    if token:
+        sort_value, row_id = decode_cursor(token)
+        comparison = '<' if descending else '>'
+        if column == 'id':
+            clauses.append(f'id {comparison} ?')
+            params.append(row_id)
+        else:
+            clauses.append(f'({column}, id) {comparison} (?, ?)')
+            params.extend((sort_value, row_id))
+
+    direction = 'DESC' if descending else 'ASC'
+    order = 'id' if column == 'id' else f'{column} {direction}, id'
+    sql = (f"SELECT {', '.join(select)} FROM flower"
+           f"{' WHERE ' + ' AND '.join(clauses) if clauses else ''} ORDER BY {order} {direction} LIMIT ?")
+    return sql, (*params, limit)
+
+def not_modified(etag, published_at):
+    """ Whether the client's copy is current according to If-None-Match, or If-Modified-Since
+    when the request has no If-None-Match.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and published_at is not None:
+        return int(published_at) <= request.if_modified_since.timestamp()
+    return False
+
+def validated(response, etag, published_at):
+    """ Add the headers clients revalidate with on their next poll. """
+    response.set_etag(etag)
+    if published_at is not None:
+        response.last_modified = int(published_at)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def create_app(db_path=ingest.DB_PATH, disk_cache=None):
+    """ Build the read-only price API over db_path, optionally keeping its query cache on disk too. """
+    app = Flask(__name__)
+
+    def cached_json(sql, params, render, *key_parts):
+        """ Return the JSON body render(columns, rows) makes of a query, reusing it until the next publish.
+
+        The ETag is the published version plus the query, so a client polling between scrapes
+        gets a 304 without the query or the cache being touched. Compressed bodies are cached
+        alongside the plain one and so are only compressed once per publish.
+        """
+        coding = request.accept_encodings.best_match(COMPRESSORS)
+        with db.reader(db_path) as conn:
+            version, published_at = db.published_version(conn)
+            key = result_cache.cache_key(db_path, sql, tuple(params), *key_parts)
+            etag = f"{version}-{key[:16]}" + (f"-{coding}" if coding else '')
+            if not_modified(etag, published_at):
+                return validated(Response(status=304), etag, published_at)
+
+            body = result_cache.lookup(key, version, disk_cache, db_path)
+            if body is None:
+                cursor = conn.execute(sql, params)
+                columns = [column[0] for column in cursor.description]
+                body = app.json.dumps(render(columns, cursor.fetchall())).encode('utf-8')
+                result_cache.store(key, version, body, disk_cache, db_path)
+
+            if coding:
+                compressed = result_cache.lookup(f"{key}.{coding}", version, disk_cache, db_path)
+                if compressed is None:
+                    compressed = COMPRESSORS[coding](body)
+                    result_cache.store(f"{key}.{coding}", version, compressed, disk_cache, db_path)
+                body = compressed
+
+        response = Response(body, mimetype='application/json')
+        if coding:
+            response.content_encoding = coding
+        return validated(response, etag, published_at)
+
+    @app.errorhandler(BadRequest)
+    def bad_request(e):
+        return jsonify(error=str(e)), 400
+
+    @app.get('/flower')
+    def flower():
+        clauses, params = parse_filters(request.args)
+        limit = parse_limit(request.args)
+        column, descending = parse_sort(request.args)
+        fields = parse_fields(request.args)
+
+        # Only the requested columns are read, plus the keys the next cursor is built from
+        select = fields + [key for key in (column, 'id') if key not in fields]
+        sql, params = keyset_query(clauses, params, column, descending, request.args.get('cursor'), select, limit)
+
+        def render(_, rows):
+            results = [dict(zip(fields, row)) for row in rows]
+            next_cursor = None
+            if len(rows) == limit:
+                last = dict(zip(select, rows[-1]))
+                next_cursor = encode_cursor(last[column], last['id'])
+            return {'count': len(results), 'results': results, 'next_cursor': next_cursor}
+
+        # The same SQL serves different fields= projections, so they are part of the key
+        return cached_json(sql, params, render, tuple(fields))
+
+    @app.get('/export')
+    def export_flower():
+        export_format = request.args.get('format', 'csv')
+        run_id = request.args.get('run')
+        try:
+            run_id = int(run_id) if run_id else None
+        except ValueError:
+            raise BadRequest(f"run must be an integer, got {run_id!r}")
+
+        try:
+            export.text_encoder(export_format)
+            sql, params = export.export_query(request.args.get('location'), run_id,
+                                              request.args.get('since'), request.args.get('until'))
+        except ValueError as e:
+            raise BadRequest(str(e))
+
+        with db.reader(db_path) as conn:
+            version, published_at = db.published_version(conn)
+        etag = f"{version}-{result_cache.cache_key(db_path, sql, tuple(params), export_format)[:16]}"
+        if not_modified(etag, published_at):
+            return validated(Response(status=304), etag, published_at)
+
+        def stream():
+            # The connection stays checked out until the last chunk has been sent
+            with db.reader(db_path) as conn:
+                yield from export.export(conn, export_format, sql, params)
+
+        response = Response(stream_with_context(stream()), mimetype='application/gzip', headers={
+            'Content-Disposition': f'attachment; filename=flower.{export_format}.gz',
+        })
+        return validated(response, etag, published_at)
+
+    @app.get('/compare/top')
+    def compare_top():
+        bucket, strain_type, min_potency, max_potency = parse_band(request.args)
+        sql, params = compare.top_query(bucket, strain_type, min_potency, max_potency, parse_limit(request.args))
+        return cached_json(sql, params, lambda columns, rows: {
+            'bucket': bucket,
+            'results': [dict(zip(columns, row)) for row in rows],
+        })
+
+    @app.get('/compare/percentile')
+    def compare_percentile():
+        bucket, strain_type, min_potency, max_potency = parse_band(request.args)
+        percentile = parse_number(request.args, 'p', required=True)
+        if not 0 <= percentile <= 100:
+            raise BadRequest("p must be between 0 and 100")
+        sql, params = compare.percentile_query(bucket, percentile, strain_type, min_potency, max_potency)
+        return cached_json(sql, params, lambda columns, rows: {
+            'bucket': bucket,
+            'percentile': percentile,
+            'result': dict(zip(columns, rows[0])) if rows else None,
+        })
+
+    @app.get('/products/<int:canonical_id>')
+    def product(canonical_id):
+        with db.reader(db_path) as conn:
+            matched = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'product_identity'").fetchone()
+        if not matched:
+            # Product matching has not run against this database yet
+            return jsonify(canonical_id=canonical_id, results=[])
+
+        # Every store's listing of one matched product, cheapest per gram first
+        return cached_json('''
+            SELECT f.id, f.Product, f.Brand, f.Potency, f.Weight, f.Price, f.PricePerGram, f.StrainType, f.Location
+            FROM product_identity p JOIN flower f ON f.Product = p.Product AND COALESCE(f.Brand, '') = p.Brand
+            WHERE p.CanonicalId = ? ORDER BY f.PricePerGram, f.id
+        ''', (canonical_id,), lambda columns, rows: {
+            'canonical_id': canonical_id,
+            'results': [dict(zip(columns, row)) for row in rows],
+        })
+
+    @app.get('/search')
+    def search_flower():
+        text = request.args.get('q', '')
+        if search.match_expression(text) is None:
+            raise BadRequest("q must contain at least one word")
+        sql, params = search.search_query(text, parse_limit(request.args))
+        return cached_json(sql, params, lambda columns, rows: {'results': [dict(zip(columns, row)) for row in rows]})
+
+    @app.get('/autocomplete')
+    def autocomplete():
+        text = request.args.get('q', '')
+        if search.match_expression(text) is None:
+            raise BadRequest("q must contain at least one word")
+        sql, params = search.autocomplete_query(text, min(parse_limit(request.args), 50))
+        return cached_json(sql, params, lambda columns, rows: {'results': [dict(zip(columns, row)) for row in rows]})
+
+    @app.get('/deals')
+    def current_deals():
+        # Variants priced well below their location's recent prices for the same size and strain type
+        sql, params = deals.deals_query(request.args.get('location'), parse_limit(request.args))
+        return cached_json(sql, params, lambda columns, rows: {'results': [dict(zip(columns, row)) for row in rows]})
+
+    @app.get('/locations')
+    def locations():
+        return cached_json('''
+            SELECT Location, COUNT(*) AS Variants, MIN(Price) AS MinPrice, AVG(Price) AS AvgPrice, MAX(RunId) AS RunId
+            FROM flower GROUP BY Location ORDER BY Location
+        ''', (), lambda columns, rows: {'results': [dict(zip(columns, row)) for row in rows]})
+
+    return app
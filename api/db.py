@@ -0,0 +1,102 @@
+import queue
+import sqlite3
+from contextlib import contextmanager
+
+from writers import ingest
+
+# Statements kept compiled per connection; the API only builds a few dozen distinct queries
+CACHED_STATEMENTS = 256
+
+# Seconds a reader waits on a locked database before giving up
+BUSY_TIMEOUT = 5.0
+
+# Idle connections kept open per database
+POOL_SIZE = 16
+
+# Idle read-only connections per database path. Werkzeug starts a thread per request, so
+# connections are checked out for the length of a request rather than tied to one thread
+_pools = {}
+
+class ReadConnection(sqlite3.Connection):
+    """ Read-only connection that remembers the published version it last saw. """
+    data_version = None
+    published = None
+
+def connect(db_path=ingest.DB_PATH):
+    """ Open a read-only connection that can never write, even by mistake. """
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, timeout=BUSY_TIMEOUT,
+                           cached_statements=CACHED_STATEMENTS, check_same_thread=False,
+                           factory=ReadConnection)
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+@contextmanager
+def reader(db_path=ingest.DB_PATH):
+    """ Check a read-only connection out of the pool for the calling thread. """
+    pool = _pools.setdefault(db_path, queue.LifoQueue(maxsize=POOL_SIZE))
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = connect(db_path)
+    try:
+        yield conn
+    finally:
+        # A connection must not go back to the pool in the middle of a read
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def published_version(conn):
+    """ Return (token, published_at): a token that changes whenever a location is published, a run
+    finishes or products are matched, and the time of the last of those, or None when none has
+    happened yet.
+
+    PRAGMA data_version only changes after another connection has committed, so the run
+    tables are read again only after a write and most requests cost a single PRAGMA.
+    """
+    data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+    if data_version != conn.data_version:
+        # A run's comparison index is rebuilt when it finishes, without a publish
+        run = conn.execute('''
+            SELECT RunId, Published, FinishedAt FROM scrape_runs ORDER BY RunId DESC LIMIT 1
+        ''').fetchone() or (0, 0, None)
+        # Rows published outside a run still raise the highest row id, or lower the row count
+        # when a publish only removed rows; a migration changes the schema version
+        last_row, row_count = conn.execute('SELECT MAX(id), COUNT(*) FROM flower_rows').fetchone()
+        schema = conn.execute('PRAGMA schema_version').fetchone()[0]
+        try:
+            published_at = conn.execute('SELECT MAX(PublishedAt) FROM scrape_runs').fetchone()[0]
+        except sqlite3.OperationalError:
+            # Databases not yet opened by this version of ingest have no PublishedAt column
+            published_at = None
+        # Product matching runs after a run is finished and changes /products without a publish
+        try:
+            matched_at, matched = conn.execute('SELECT MAX(MatchedAt), COUNT(*) FROM product_identity').fetchone()
+        except sqlite3.OperationalError:
+            # Nothing has been matched in this database yet
+            matched_at, matched = 0, 0
+        for changed_at in (run[2], matched_at):
+            if changed_at and (published_at is None or changed_at > published_at):
+                published_at = changed_at
+        conn.published = (f"{run[0]}.{run[1]}.{run[2] or 0}.{last_row or 0}.{row_count}.{schema}."
+                          f"{matched_at or 0}.{matched}", published_at)
+        conn.data_version = data_version
+    return conn.published
+
+def query(sql, params=(), db_path=ingest.DB_PATH):
+    """ Run a read query on a pooled connection and return (column names, rows). """
+    with reader(db_path) as conn:
+        cursor = conn.execute(sql, params)
+        return [column[0] for column in cursor.description], cursor.fetchall()
+
+def close():
+    """ Close every idle pooled connection. """
+    for pool in _pools.values():
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
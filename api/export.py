@@ -0,0 +1,111 @@
+import csv
+import io
+import zlib
+from datetime import date, datetime, time as clock, timedelta
+
+# Columns written by an export, in order
+EXPORT_COLUMNS = ('id', 'Product', 'Brand', 'Potency', 'Weight', 'Price', 'PricePerGram',
+                  'StrainType', 'Location', 'RunId')
+
+# Rows pulled from SQLite per fetchmany call; memory use is bounded by this, not the table size
+CHUNK_ROWS = 5000
+
+# zlib level for the gzip stream; level 1 compresses CSV about 3x faster than the default
+# level 6 for output roughly a third larger (about 4:1 instead of 5.5:1)
+COMPRESS_LEVEL = 1
+
+FORMATS = ('csv', 'ndjson')
+
+def parse_day(value):
+    """ 'YYYY-MM-DD' -> epoch seconds at local midnight of that day. """
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"dates must be YYYY-MM-DD, got {value!r}")
+    return datetime.combine(day, clock()).timestamp()
+
+def export_query(location=None, run_id=None, since=None, until=None):
+    """ Build the export query for the given filters and return (sql, params).
+
+    since and until are 'YYYY-MM-DD' days, both inclusive, matched against the time the run
+    that published a row finished. Rows without a finished run are left out of date filtered
+    exports.
+    """
+    clauses = []
+    params = []
+    if location:
+        clauses.append('f.Location = ?')
+        params.append(location)
+    if run_id is not None:
+        clauses.append('f.RunId = ?')
+        params.append(run_id)
+    if since:
+        clauses.append('r.FinishedAt >= ?')
+        params.append(parse_day(since))
+    if until:
+        clauses.append('r.FinishedAt < ?')
+        params.append(parse_day(until) + timedelta(days=1).total_seconds())
+
+    join = ' JOIN scrape_runs r ON r.RunId = f.RunId' if since or until else ''
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+    columns = ', '.join(f'f.{column}' for column in EXPORT_COLUMNS)
+    return f'SELECT {columns} FROM flower f{join}{where} ORDER BY f.id', params
+
+def fetch_chunks(conn, sql, params, chunk_rows=CHUNK_ROWS):
+    """ Yield lists of at most chunk_rows rows until the query is exhausted. """
+    cursor = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+def csv_text(chunks):
+    """ Yield CSV text, a header and then one block per chunk of rows. """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def ndjson_query(sql):
+    """ Wrap an export_query() so SQLite builds each row's JSON object, about 3x faster than
+    json.dumps on a dict per row. Reals are written with 15 significant digits.
+    """
+    pairs = ', '.join(f"'{column}', {column}" for column in EXPORT_COLUMNS)
+    return f'SELECT json_object({pairs}) || char(10) FROM ({sql}) ORDER BY id'
+
+def ndjson_text(chunks):
+    """ Yield newline-delimited JSON text from ndjson_query() rows, one block per chunk. """
+    for rows in chunks:
+        yield ''.join([row[0] for row in rows])
+
+def gzip_stream(text_blocks, level=COMPRESS_LEVEL):
+    """ Compress blocks of text into a single gzip stream, yielding bytes as they are ready. """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for text in text_blocks:
+        data = compressor.compress(text.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def text_encoder(export_format):
+    """ Return the function turning row chunks into text for an export format. """
+    if export_format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}, got {export_format!r}")
+    return csv_text if export_format == 'csv' else ndjson_text
+
+def export(conn, export_format, sql, params):
+    """ Yield a gzip-compressed CSV or NDJSON export of an export_query(), reading it in chunks. """
+    encode = text_encoder(export_format)
+    if encode is ndjson_text:
+        sql = ndjson_query(sql)
+    return gzip_stream(encode(fetch_chunks(conn, sql, params)))
@@ -0,0 +1,147 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from writers import ingest
+
+# Upper bound on the response bodies held in memory, least recently used ones are evicted past it
+MAX_MEMORY_BYTES = 32 * 1024 * 1024
+
+# Upper bound on the optional on-disk cache, which survives restarts of the API
+MAX_DISK_BYTES = 256 * 1024 * 1024
+
+# Hits in memory, hits on disk and misses for this process
+stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+# (scope, query key) -> response body, computed against the version in _versions of its scope;
+# the scope is normally the database path, so APIs over different databases do not share versions
+_entries = OrderedDict()
+_versions = {}
+_size = 0
+_lock = threading.Lock()
+
+# Create the table of response bodies keyed by the hash of their query
+def create_cache_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS query_cache (
+            Hash TEXT PRIMARY KEY,
+            Version TEXT,
+            Body BLOB,
+            Size INTEGER,
+            LastUsed REAL
+        )
+    ''')
+    ingest.add_missing_columns(cursor, 'query_cache', {'Scope': 'TEXT'})
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_cache_last_used ON query_cache (LastUsed)')
+
+def cache_key(*parts):
+    """ Key of a response built from parts, normally the database, the SQL and its parameters.
+
+    The SQL is built from the parsed query parameters in a fixed order, so requests that
+    differ only in parameter order, spelling or blank values share a key.
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+def _reset(scope, version):
+    global _size
+    if _versions.get(scope, version) != version:
+        for entry in [entry for entry in _entries if entry[0] == scope]:
+            _size -= len(_entries.pop(entry))
+    _versions[scope] = version
+
+def lookup(key, version, disk_path=None, scope=None):
+    """ Return the cached body of a query against the given published version of scope, or None on a miss. """
+    with _lock:
+        # A new publish invalidates everything computed before it from the same database
+        _reset(scope, version)
+        body = _entries.get((scope, key))
+        if body is not None:
+            _entries.move_to_end((scope, key))
+            stats['memory_hits'] += 1
+            return body
+
+    if disk_path:
+        body = _disk_lookup(key, version, disk_path)
+        if body is not None:
+            stats['disk_hits'] += 1
+            _remember(key, version, body, scope)
+            return body
+
+    stats['misses'] += 1
+    return None
+
+def store(key, version, body, disk_path=None, scope=None):
+    """ Cache the body of a query computed against the given published version of scope. """
+    _remember(key, version, body, scope)
+    if disk_path:
+        _disk_store(key, version, body, disk_path, scope)
+
+def _remember(key, version, body, scope=None, max_bytes=MAX_MEMORY_BYTES):
+    global _size
+    if len(body) > max_bytes:
+        return
+    with _lock:
+        _reset(scope, version)
+        previous = _entries.pop((scope, key), None)
+        if previous is not None:
+            _size -= len(previous)
+        _entries[(scope, key)] = body
+        _size += len(body)
+        while _size > max_bytes:
+            _, expired = _entries.popitem(last=False)
+            _size -= len(expired)
+
+def _disk_lookup(key, version, disk_path):
+    try:
+        conn = sqlite3.connect(disk_path)
+        cursor = conn.cursor()
+        create_cache_table(cursor)
+
+        row = cursor.execute('SELECT Body FROM query_cache WHERE Hash = ? AND Version = ?',
+                             (key, version)).fetchone()
+        if row is None:
+            return None
+        cursor.execute('UPDATE query_cache SET LastUsed = ? WHERE Hash = ?', (time.time(), key))
+        conn.commit()
+        return row[0]
+    finally:
+        conn.close()
+
+def _disk_store(key, version, body, disk_path, scope=None):
+    try:
+        conn = sqlite3.connect(disk_path)
+        cursor = conn.cursor()
+        create_cache_table(cursor)
+
+        cursor.execute('DELETE FROM query_cache WHERE Scope IS ? AND Version != ?', (scope, version))
+        cursor.execute('''
+            INSERT OR REPLACE INTO query_cache (Hash, Version, Body, Size, LastUsed, Scope) VALUES (?, ?, ?, ?, ?, ?)
+        ''', (key, version, body, len(body), time.time(), scope))
+        evict(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+def evict(cursor, max_bytes=MAX_DISK_BYTES):
+    """ Delete least recently used bodies until the on-disk cache fits in max_bytes. """
+    total = cursor.execute('SELECT COALESCE(SUM(Size), 0) FROM query_cache').fetchone()[0]
+    if total <= max_bytes:
+        return
+
+    expired = []
+    for key, size in cursor.execute('SELECT Hash, Size FROM query_cache ORDER BY LastUsed'):
+        if total <= max_bytes:
+            break
+        expired.append((key,))
+        total -= size
+    cursor.executemany('DELETE FROM query_cache WHERE Hash = ?', expired)
+
+def report():
+    """ Print the query cache hit rate of this process. """
+    requests = sum(stats.values())
+    if requests:
+        hits = stats['memory_hits'] + stats['disk_hits']
+        print(f"Query cache: {hits}/{requests} responses reused ({stats['disk_hits']} from disk, "
+              f"{100 * hits / requests:.0f}% hit rate).")
@@ -0,0 +1,72 @@
+import random
+import sys
+import time
+
+sys.path.insert(0, '..')
+
+from writers import alerts
+from bench_encoding import BRANDS, LOCATIONS, STRAIN_TYPES, WEIGHTS
+
+WATCHES = 100000
+# Roughly what one run publishes as new or changed variants across every store
+CHANGES = 5000
+
+# Function to build watches that each name a random subset of location, brand, strain type and weight
+def synthetic_watches(count):
+    random.seed(0)
+    for watch_id in range(count):
+        metric = random.choice(alerts.METRICS)
+        threshold = random.uniform(2, 8) if metric == 'price_per_gram' else random.uniform(10, 40)
+        yield (watch_id, random.choice(LOCATIONS + [None] * 2), random.choice(BRANDS + [None] * 20),
+               random.choice(STRAIN_TYPES + [None] * 2), random.choice(WEIGHTS + [None] * 2), None,
+               metric, threshold, 'file', f'/tmp/user{watch_id % 1000}.ndjson')
+
+def synthetic_changes(count):
+    random.seed(1)
+    for _ in range(count):
+        weight = random.choice(WEIGHTS)
+        price = float(random.randrange(10, 200))
+        yield (price, alerts.units.price_per_gram(price, weight),
+               alerts.watch_dimensions(random.choice(LOCATIONS), random.choice(BRANDS), random.choice(STRAIN_TYPES),
+                                       weight, None))
+
+# The same matching without an index: every watch is checked against every change
+def scan_matches(watches, metric, value, dimensions):
+    for watch_id, *fields, watch_metric, threshold, sink, target in watches:
+        if watch_metric == metric and value <= threshold and all(
+                field is None or field == wanted for field, wanted in zip(fields, dimensions)):
+            yield watch_id, sink, target
+
+if __name__ == '__main__':
+    watches = [(watch_id, *alerts.watch_dimensions(location, brand, strain_type, weight, canonical_id), metric,
+                threshold, sink, target)
+               for watch_id, location, brand, strain_type, weight, canonical_id, metric, threshold, sink, target
+               in synthetic_watches(WATCHES)]
+    changes = list(synthetic_changes(CHANGES))
+
+    started = time.perf_counter()
+    index = alerts.WatchIndex(synthetic_watches(WATCHES))
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    indexed = sum(1 for price, unit_price, dimensions in changes
+                  for metric, value in (('price', price), ('price_per_gram', unit_price))
+                  for _ in index.matches(metric, value, dimensions))
+    index_seconds = time.perf_counter() - started
+
+    # A full scan of every change takes minutes, so it is timed over a sample and scaled up
+    sample = changes[:50]
+    started = time.perf_counter()
+    scanned = sum(1 for price, unit_price, dimensions in sample
+                  for metric, value in (('price', price), ('price_per_gram', unit_price))
+                  for _ in scan_matches(watches, metric, value, dimensions))
+    scan_seconds = (time.perf_counter() - started) * len(changes) / len(sample)
+
+    sampled = sum(1 for price, unit_price, dimensions in sample
+                  for metric, value in (('price', price), ('price_per_gram', unit_price))
+                  for _ in index.matches(metric, value, dimensions))
+    assert sampled == scanned, (sampled, scanned)
+
+    print(f"{WATCHES} watches indexed in {build_seconds:.2f}s, {CHANGES} changes -> {indexed} notifications")
+    print(f"indexed: {index_seconds:.2f}s, full scan: {scan_seconds:.0f}s (estimated from {len(sample)} changes), "
+          f"{scan_seconds / index_seconds:.0f}x faster")
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '..')
+
+from writers import compare
+from bench_encoding import ROWS, STRAIN_TYPES, WEIGHTS, build_encoded
+
+TOP_K = 10
+
+# The query a comparison needs without the index: every row of the weight and strain type is
+# read and its price per gram worked out before it can be sorted
+ADHOC_TOP = '''
+    SELECT Location, Product, StrainType, Potency, Price,
+           Price / Weight AS PricePerGram
+    FROM flower WHERE Weight = ? AND StrainType = ?
+    ORDER BY PricePerGram LIMIT ?
+'''
+ADHOC_MEDIAN = '''
+    SELECT Location, Product, StrainType, Potency, Price,
+           Price / Weight AS PricePerGram
+    FROM flower WHERE Weight = ? AND StrainType = ?
+    ORDER BY PricePerGram LIMIT 1
+    OFFSET (SELECT (COUNT(*) + 1) / 2 - 1 FROM flower WHERE Weight = ? AND StrainType = ?)
+'''
+
+# Function to run every (weight, strain type) comparison once and return the seconds taken
+def run_all(conn, query):
+    started = time.perf_counter()
+    for weight in WEIGHTS:
+        for strain_type in STRAIN_TYPES:
+            sql, params = query(weight, strain_type)
+            conn.execute(sql, params).fetchall()
+    return time.perf_counter() - started
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'encoded.db')
+        build_encoded(path)
+        conn = sqlite3.connect(path)
+
+        started = time.perf_counter()
+        indexed = compare.rebuild_index(conn.cursor())
+        conn.commit()
+        build_seconds = time.perf_counter() - started
+
+        groups = len(WEIGHTS) * len(STRAIN_TYPES)
+        queries = {
+            f'top {TOP_K}': (
+                lambda weight, strain_type: (ADHOC_TOP, (weight, strain_type, TOP_K)),
+                lambda weight, strain_type: compare.top_query(
+                    compare.weight_bucket(weight), strain_type, k=TOP_K)),
+            'median': (
+                lambda weight, strain_type: (ADHOC_MEDIAN, (weight, strain_type) * 2),
+                lambda weight, strain_type: compare.percentile_query(
+                    compare.weight_bucket(weight), 50, strain_type)),
+        }
+
+        print(f"{ROWS} rows, {indexed} indexed in {build_seconds:.1f}s at publish time")
+        for name, (adhoc, index) in queries.items():
+            adhoc_seconds = run_all(conn, adhoc)
+            index_seconds = run_all(conn, index)
+            print(f"{name:>6} over {groups} groups: ad-hoc SQL {1000 * adhoc_seconds / groups:.1f}ms, "
+                  f"comparison index {1000 * index_seconds / groups:.2f}ms per query "
+                  f"({adhoc_seconds / index_seconds:.0f}x faster)")
+        conn.close()
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, '..')
+
+from writers import db_writer, ingest, records
+from bench_encoding import BRANDS, STRAIN_TYPES, WEIGHTS
+
+SCRAPERS = 8
+PAGES = 100
+ROWS_PER_PAGE = 200
+# Partway through, a publish holds the write lock this long, as rebuilding the comparison index
+# and search names on a large database does
+PUBLISH_SECONDS = 6
+
+def page(scraper, page_number):
+    return [records.ProductVariant(f"Product {page_number}-{i}", BRANDS[i % len(BRANDS)],
+                                   STRAIN_TYPES[i % len(STRAIN_TYPES)], 20.0, WEIGHTS[i % len(WEIGHTS)],
+                                   float(10 + i % 90), f"Store {scraper}")
+            for i in range(ROWS_PER_PAGE)]
+
+def create(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    ingest.create_checkpoint_table(conn.cursor())
+    conn.commit()
+    conn.close()
+
+# How writers stored pages before: a connection and a commit per page, with sqlite3's 5s lock timeout
+def own_connection(path, scraper, errors):
+    seen_keys = set()
+    for page_number in range(1, PAGES + 1):
+        products = page(scraper, page_number)
+        conn = sqlite3.connect(path)
+        try:
+            ingest.write_page(conn.cursor(), products, f"Store {scraper}", page_number, seen_keys)
+            conn.commit()
+        except sqlite3.OperationalError:
+            errors.append(page_number)
+        finally:
+            conn.close()
+
+def writer_thread(path, scraper, errors):
+    seen_keys = set()
+    for page_number in range(1, PAGES + 1):
+        db_writer.write_page(page(scraper, page_number), f"Store {scraper}", page_number, seen_keys, path)
+
+def publish(path):
+    time.sleep(0.5)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('BEGIN IMMEDIATE')
+    time.sleep(PUBLISH_SECONDS)
+    conn.execute('COMMIT')
+    conn.close()
+
+# Function to run every scraper in its own thread next to one long publish and return
+# (seconds, pages that failed to store)
+def run(path, store):
+    errors = []
+    threads = [threading.Thread(target=store, args=(path, scraper, errors)) for scraper in range(SCRAPERS)]
+    threads.append(threading.Thread(target=publish, args=(path,)))
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, errors
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        rows = SCRAPERS * PAGES * ROWS_PER_PAGE
+        print(f"{SCRAPERS} scrapers storing {PAGES} pages of {ROWS_PER_PAGE} rows each, "
+              f"one {PUBLISH_SECONDS}s publish")
+        for name, store in (('connection per page', own_connection), ('single writer thread', writer_thread)):
+            path = os.path.join(directory, f"{store.__name__}.db")
+            create(path)
+            seconds, errors = run(path, store)
+            print(f"{name}: {seconds:.2f}s, {rows / seconds:,.0f} rows/s, {len(errors)} pages lost to locking")
+        db_writer.close()
+        db_writer.report()
@@ -0,0 +1,63 @@
+import random
+import sys
+import statistics
+import time
+from bisect import bisect_left
+
+sys.path.insert(0, '..')
+
+from writers import deals
+from bench_encoding import LOCATIONS, STRAIN_TYPES, WEIGHTS
+
+# Price-per-gram history already in every window, and the new variants a run scores against it
+HISTORY = 200000
+NEW_VARIANTS = 20000
+
+GROUPS = [(location, weight, strain_type) for location in LOCATIONS for weight in WEIGHTS for strain_type in STRAIN_TYPES]
+
+def synthetic_prices(count, seed):
+    random.seed(seed)
+    for _ in range(count):
+        yield random.choice(GROUPS), random.lognormvariate(2.3, 0.3)
+
+# Without the sorted windows every variant re-sorts its group's recent history to rank it
+def rescan(history, new):
+    found = 0
+    for group, value in new:
+        window = sorted(history[group][-deals.WINDOW_SIZE:])
+        rank = 100 * bisect_left(window, value) / len(window)
+        if rank <= deals.DEAL_PERCENTILE and value <= statistics.median(window) * (1 - deals.MIN_DISCOUNT):
+            found += 1
+        history[group].append(value)
+    return found
+
+def rolling(windows, new):
+    found = 0
+    for row_id, (group, value) in enumerate(new):
+        window = windows[group]
+        if window.percentile_rank(value) <= deals.DEAL_PERCENTILE and \
+                value <= window.median() * (1 - deals.MIN_DISCOUNT):
+            found += 1
+        window.add(row_id, value)
+    return found
+
+if __name__ == '__main__':
+    history = {group: [] for group in GROUPS}
+    windows = {group: deals.PriceWindow() for group in GROUPS}
+    for row_id, (group, value) in enumerate(synthetic_prices(HISTORY, 0)):
+        history[group].append(value)
+        windows[group].add(row_id, value)
+    new = list(synthetic_prices(NEW_VARIANTS, 1))
+
+    started = time.perf_counter()
+    rescan_found = rescan(history, new)
+    rescan_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rolling_found = rolling(windows, new)
+    rolling_seconds = time.perf_counter() - started
+
+    assert rescan_found == rolling_found, (rescan_found, rolling_found)
+    print(f"{len(GROUPS)} windows of {deals.WINDOW_SIZE}, {NEW_VARIANTS} new variants, {rolling_found} deals")
+    print(f"re-sorting each window: {rescan_seconds:.2f}s, rolling sorted windows: {rolling_seconds:.2f}s "
+          f"({rescan_seconds / rolling_seconds:.0f}x faster)")
@@ -0,0 +1,105 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '..')
+
+from writers import encoding
+
+ROWS = 1000000
+
+BRANDS = ['Greenlight', 'ILLICIT', 'Flora Farms', 'Vivid', 'Proper', 'Clovr', 'Amend', 'Codes',
+          'Good Day Farm', 'Root 66', 'Blue Arrow', 'Heartland Labs']
+STRAIN_TYPES = ['Indica', 'Sativa', 'Hybrid', 'Indica-Hybrid', 'Sativa-Hybrid']
+LOCATIONS = ['Greenlight', 'CODES', 'Good Day Farm', 'High Profile', 'Elevate', 'Flora Farms Springfield',
+             'Flora Farms Neosho', 'Flora Farms Joplin', 'Flora Farms Kansas City', 'Key Cannabis']
+WEIGHTS = [3.5, 7.0, 14.0, 28.0]
+
+# Function to build a synthetic history of many runs of the flower table
+def synthetic_rows(count):
+    random.seed(0)
+    for i in range(count):
+        yield (
+            f"Product {i % 5000}",
+            random.choice(BRANDS),
+            round(random.uniform(15, 35), 2),
+            WEIGHTS[i % 4],
+            float(random.randrange(10, 200)),
+            random.choice(STRAIN_TYPES),
+            random.choice(LOCATIONS),
+            i // 20000
+        )
+
+def build_plain(path):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE flower (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Product TEXT, Brand TEXT, Potency REAL, Weight REAL, Price REAL,
+            StrainType TEXT, Location TEXT, RunId INTEGER
+        )
+    ''')
+    conn.executemany('''
+        INSERT INTO flower (Product, Brand, Potency, Weight, Price, StrainType, Location, RunId)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', synthetic_rows(ROWS))
+    conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+
+def build_encoded(path):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    encoding.create_encoded_tables(cursor)
+    encoded = [(product, encoding.encode(cursor, 'Brand', brand), potency, weight, price,
+                encoding.encode(cursor, 'StrainType', strain_type), encoding.encode(cursor, 'Location', location),
+                run_id)
+               for product, brand, potency, weight, price, strain_type, location, run_id in synthetic_rows(ROWS)]
+    cursor.executemany('''
+        INSERT INTO flower_rows (Product, BrandId, Potency, Weight, Price, StrainTypeId, LocationId, RunId)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', encoded)
+    conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+
+# Function to time the best of a few runs of fn
+def best_time(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def plain_average(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('''
+            SELECT Location, StrainType, AVG(Price), COUNT(*) FROM flower GROUP BY Location, StrainType
+        ''').fetchall()
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        plain_path = os.path.join(directory, 'plain.db')
+        encoded_path = os.path.join(directory, 'encoded.db')
+        build_plain(plain_path)
+        build_encoded(encoded_path)
+
+        plain_size = os.path.getsize(plain_path)
+        encoded_size = os.path.getsize(encoded_path)
+        plain_seconds = best_time(lambda: plain_average(plain_path))
+        encoded_seconds = best_time(lambda: encoding.average_price_by_location(encoded_path))
+
+        assert sorted(plain_average(plain_path)) == sorted(encoding.average_price_by_location(encoded_path))
+
+        print(f"{ROWS} rows")
+        print(f"plain text columns: {plain_size / 1024 / 1024:.1f} MiB, GROUP BY in {plain_seconds * 1000:.0f}ms")
+        print(f"dictionary codes:   {encoded_size / 1024 / 1024:.1f} MiB, GROUP BY in {encoded_seconds * 1000:.0f}ms "
+              f"({100 * (1 - encoded_size / plain_size):.0f}% smaller, "
+              f"{plain_seconds / encoded_seconds:.1f}x faster)")
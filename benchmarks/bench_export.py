@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+
+try:
+    import resource
+except ImportError:
+    # Peak memory is only reported where the resource module exists, i.e. not on Windows
+    resource = None
+
+sys.path.insert(0, '..')
+
+from api import db, export
+from bench_encoding import ROWS, build_encoded
+
+# Function to export the whole table in a format and return (seconds, compressed bytes)
+def measure(path, export_format):
+    conn = db.connect(path)
+    started = time.perf_counter()
+    written = 0
+    sql, params = export.export_query()
+    for data in export.export(conn, export_format, sql, params):
+        written += len(data)
+    conn.close()
+    return time.perf_counter() - started, written
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'encoded.db')
+        # Built in a child process so the rows it generates do not count towards this one's peak memory
+        builder = Process(target=build_encoded, args=(path,))
+        builder.start()
+        builder.join()
+
+        print(f"{ROWS} rows, {os.path.getsize(path) / 1024 / 1024:.1f} MiB database")
+        for export_format in export.FORMATS:
+            seconds, written = measure(path, export_format)
+            peak = f", {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB peak process RSS" \
+                if resource else ''
+            print(f"{export_format:>6}: {seconds:.1f}s, {written / 1024 / 1024:.1f} MiB gzipped{peak}")
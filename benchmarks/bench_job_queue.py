@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, '..')
+
+from writers import job_queue
+
+JOBS = 200
+# Each job loads this many menu pages from the fixture server, which takes PAGE_SECONDS per page
+PAGES = 5
+PAGE_SECONDS = 0.02
+WORKER_COUNTS = (1, 2, 4, 8)
+
+class FixtureMenu(BaseHTTPRequestHandler):
+    """ Stands in for a store's menu: every page answers after PAGE_SECONDS with a small product list. """
+    def do_GET(self):
+        time.sleep(PAGE_SECONDS)
+        body = ''.join(f'<div data-testid="product-list-item">Product {i}</div>' for i in range(50)).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def fetch_menu(base_url, job):
+    size = 0
+    for page in range(1, PAGES + 1):
+        with urllib.request.urlopen(f"{base_url}/{job['location']}?page={page}") as response:
+            size += len(response.read())
+    return {'bytes': size}
+
+def worker(base_url, path):
+    job_queue.work(lambda job: fetch_menu(base_url, job), path, until_empty=True)
+
+# Function to drain a fresh queue of JOBS jobs with the given number of worker processes
+def drain(base_url, directory, workers):
+    path = os.path.join(directory, f'queue_{workers}.db')
+    conn = job_queue.connect(path)
+    for i in range(JOBS):
+        job_queue.enqueue(conn, f'store{i}')
+
+    started = time.perf_counter()
+    processes = [multiprocessing.Process(target=worker, args=(base_url, path)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    seconds = time.perf_counter() - started
+
+    # Every job done exactly once: no job was leased twice or lost
+    done, attempts = conn.execute("SELECT COUNT(*), SUM(Attempts) FROM jobs WHERE Status = 'done'").fetchone()
+    assert done == JOBS and attempts == JOBS, (done, attempts)
+    conn.close()
+    return seconds
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureMenu)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}/menu'
+
+    print(f"{JOBS} jobs of {PAGES} fixture pages at {1000 * PAGE_SECONDS:.0f}ms each")
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = None
+        for workers in WORKER_COUNTS:
+            seconds = drain(base_url, directory, workers)
+            baseline = baseline or JOBS / seconds
+            print(f"{workers} workers: {seconds:.2f}s, {JOBS / seconds:.1f} jobs/s "
+                  f"({JOBS / seconds / baseline:.2f}x one worker)")
+    server.shutdown()
@@ -0,0 +1,24 @@
+import sys
+
+sys.path.insert(0, '..')
+
+from writers import quality
+from bench_encoding import best_time, synthetic_rows
+
+# Variants in the largest single menu seen so far; a publish screens one location at a time
+MENU_ROWS = 500
+
+def synthetic_columns(count):
+    rows = list(synthetic_rows(count))
+    columns = dict(zip(('Product', 'Brand', 'Potency', 'Weight', 'Price', 'StrainType', 'Location'),
+                       map(list, list(zip(*rows))[:7])))
+    columns['id'] = list(range(count))
+    return columns
+
+if __name__ == '__main__':
+    for count in (MENU_ROWS, 100 * MENU_ROWS, 2000 * MENU_ROWS):
+        columns = synthetic_columns(count)
+        seconds = best_time(lambda: quality.screen(columns))
+        reasons, _ = quality.screen(columns)
+        print(f"screened {count} rows in {seconds * 1000:.1f}ms ({len(reasons)} flagged), "
+              f"{seconds / count * 1e6:.2f}us per row")
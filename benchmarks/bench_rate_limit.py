@@ -0,0 +1,87 @@
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, '..')
+
+from writers import rate_limit
+
+CLIENTS = 8
+REQUESTS = 40
+# The fixture server answers 429 once requests come faster than this
+SERVER_RATE = 10
+# What the limiter is configured to, deliberately more than the server takes, so it has to adapt
+CLIENT_RATE = 40
+
+class ThrottlingServer(BaseHTTPRequestHandler):
+    """ Serves pages from its own token bucket and answers 429 with Retry-After when it is empty. """
+    lock = threading.Lock()
+    tokens = SERVER_RATE
+    updated = time.monotonic()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            now = time.monotonic()
+            cls.tokens = min(SERVER_RATE, cls.tokens + (now - cls.updated) * SERVER_RATE)
+            cls.updated = now
+            allowed = cls.tokens >= 1
+            if allowed:
+                cls.tokens -= 1
+        self.send_response(200 if allowed else 429)
+        if not allowed:
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+# Without a limiter a client just retries a throttled request a second later
+def unlimited(url, throttled):
+    for _ in range(REQUESTS):
+        while True:
+            try:
+                urllib.request.urlopen(url).read()
+                break
+            except urllib.error.HTTPError:
+                throttled.append(1)
+                time.sleep(1)
+
+def limited(url, throttled):
+    for _ in range(REQUESTS):
+        while True:
+            try:
+                rate_limit.urlopen(url).read()
+                break
+            except urllib.error.HTTPError:
+                throttled.append(1)
+
+def run(url, client):
+    throttled = []
+    threads = [threading.Thread(target=client, args=(url, throttled)) for _ in range(CLIENTS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, len(throttled)
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/menu'
+    rate_limit.configure({}, rate=CLIENT_RATE, burst=5)
+
+    pages = CLIENTS * REQUESTS
+    print(f"{CLIENTS} clients fetching {pages} pages from a server allowing {SERVER_RATE}/s")
+    for name, client in (('no limiter, retry on 429', unlimited), (f'token bucket from {CLIENT_RATE}/s', limited)):
+        ThrottlingServer.tokens, ThrottlingServer.updated = SERVER_RATE, time.monotonic()
+        seconds, throttled = run(url, client)
+        print(f"{name}: {seconds:.1f}s, {pages / seconds:.1f} pages/s, {throttled} requests throttled")
+    rate_limit.report()
+    server.shutdown()
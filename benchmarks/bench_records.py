@@ -0,0 +1,61 @@
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, '..')
+
+from writers.records import ProductVariant
+
+VARIANTS = 50000
+
+BRANDS = ['Greenlight', 'ILLICIT', 'Flora Farms', 'Vivid', 'Proper', 'Clovr', 'Amend', 'Codes']
+STRAIN_TYPES = ['Indica', 'Sativa', 'Hybrid', 'Indica-Hybrid', 'Sativa-Hybrid']
+LOCATIONS = ['Greenlight', 'CODES', 'Good Day Farm', 'High Profile', 'Elevate']
+WEIGHTS = [3.5, 7.0, 14.0, 28.0]
+
+# Function to build the raw fields of a synthetic menu; the joins copy each string per row the way a parser does
+def synthetic_fields(count):
+    random.seed(0)
+    fields = []
+    for i in range(count):
+        fields.append((
+            f"Product {i // 4}",
+            ''.join(random.choice(BRANDS)),
+            ''.join(random.choice(STRAIN_TYPES)),
+            round(random.uniform(15, 35), 2),
+            WEIGHTS[i % 4],
+            float(random.randrange(10, 200)),
+            ''.join(random.choice(LOCATIONS))
+        ))
+    return fields
+
+def as_dict(name, brand, strain_type, potency, weight, price, location):
+    return {
+        'name': name,
+        'brand': brand,
+        'strain_type': strain_type,
+        'potency': potency,
+        'weight': weight,
+        'price': price,
+        'location': location
+    }
+
+# Function to measure the peak memory of building every variant with make
+def peak_memory(make, fields):
+    tracemalloc.start()
+    variants = [make(*row) for row in fields]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del variants
+    return peak
+
+if __name__ == '__main__':
+    fields = synthetic_fields(VARIANTS)
+
+    dict_peak = peak_memory(as_dict, fields)
+    record_peak = peak_memory(ProductVariant, fields)
+
+    print(f"{VARIANTS} variants")
+    print(f"dict records:           {dict_peak / 1024 / 1024:.2f} MiB peak")
+    print(f"ProductVariant records: {record_peak / 1024 / 1024:.2f} MiB peak "
+          f"({100 * (1 - record_peak / dict_peak):.0f}% less)")
@@ -0,0 +1,86 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, '..')
+
+from writers import encoding, search
+from bench_encoding import BRANDS, LOCATIONS, STRAIN_TYPES, WEIGHTS
+
+ROWS = 1000000
+
+FIRST_WORDS = ['Blue', 'Gelato', 'Wedding', 'Tropicana', 'Sour', 'Lemon', 'Grape', 'Cherry', 'Apple', 'Garlic',
+               'Purple', 'Candy', 'Sherb', 'Runtz', 'Zkittlez', 'Mimosa', 'Biscotti', 'Kush', 'Jealousy', 'Oreoz']
+SECOND_WORDS = ['Dream', 'Cake', 'Mints', 'Cookies', 'Diesel', 'Haze', 'Pie', 'Fritter', 'Breath', 'Punch',
+                'Gas', 'Cobbler', 'Sorbet', 'Glue', 'Zushi', 'Pave', 'Butter', 'Crasher', 'Runtz', 'Paint']
+
+# Search terms and the partial words typed while autocompleting them
+SEARCHES = ['gelato cake', 'cherry', 'sour diesel', 'codes mints', 'purple punch']
+# Terms only a few rows match, where an unranked LIKE ... LIMIT cannot stop early
+RARE_SEARCHES = ['zushi 7 amend', 'oreoz paint 13 vivid', 'jealousy glue 2 proper']
+PREFIXES = ['g', 'ge', 'gel', 'tro', 'sour d', 'wedding c']
+
+# Function to build a synthetic history of many runs with menu-like product names
+def synthetic_rows(count):
+    random.seed(0)
+    for i in range(count):
+        name = f"{random.choice(FIRST_WORDS)} {random.choice(SECOND_WORDS)}"
+        if i % 3 == 0:
+            name += f" #{random.randrange(1, 20)}"
+        yield (name, random.choice(BRANDS), round(random.uniform(15, 35), 2), random.choice(WEIGHTS),
+               float(random.randrange(10, 200)), random.choice(STRAIN_TYPES), random.choice(LOCATIONS), i // 20000)
+
+def build(path):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    encoding.create_encoded_tables(cursor)
+    cursor.executemany('''
+        INSERT INTO flower_rows (Product, BrandId, Potency, Weight, Price, StrainTypeId, LocationId, RunId)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(product, encoding.encode(cursor, 'Brand', brand), potency, weight, price,
+           encoding.encode(cursor, 'StrainType', strain_type), encoding.encode(cursor, 'Location', location), run_id)
+          for product, brand, potency, weight, price, strain_type, location, run_id in synthetic_rows(ROWS)])
+    conn.commit()
+
+    started = time.perf_counter()
+    search.create_search_tables(cursor)
+    conn.commit()
+    return conn, time.perf_counter() - started
+
+# Function to time the average of running sql over every term
+def average_ms(conn, terms, query):
+    started = time.perf_counter()
+    for term in terms:
+        sql, params = query(term)
+        conn.execute(sql, params).fetchall()
+    return 1000 * (time.perf_counter() - started) / len(terms)
+
+def like_search(text):
+    words = text.split()
+    return (f'''
+        SELECT id, Product, Brand FROM flower
+        WHERE {' AND '.join("(Product LIKE ? OR Brand LIKE ?)" for _ in words)} LIMIT 20
+    ''', [f'%{word}%' for word in words for _ in range(2)])
+
+def like_autocomplete(prefix):
+    # Any word of the name may be the one being typed
+    return ('''
+        SELECT Product, Brand, COUNT(*) AS Listings FROM flower
+        WHERE Product LIKE ? OR Product LIKE ? GROUP BY Product, Brand ORDER BY Listings DESC LIMIT 10
+    ''', (f'{prefix}%', f'% {prefix}%'))
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        conn, index_seconds = build(os.path.join(directory, 'search.db'))
+
+        print(f"{ROWS} rows, full-text and name indexes built in {index_seconds:.1f}s")
+        print(f"search:       LIKE {average_ms(conn, SEARCHES, like_search):.1f}ms, "
+              f"FTS5 ranked {average_ms(conn, SEARCHES, search.search_query):.1f}ms per query")
+        print(f"rare search:  LIKE {average_ms(conn, RARE_SEARCHES, like_search):.1f}ms, "
+              f"FTS5 ranked {average_ms(conn, RARE_SEARCHES, search.search_query):.1f}ms per query")
+        print(f"autocomplete: LIKE {average_ms(conn, PREFIXES, like_autocomplete):.1f}ms, "
+              f"FTS5 prefix {average_ms(conn, PREFIXES, search.autocomplete_query):.2f}ms per query")
+        conn.close()
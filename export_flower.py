@@ -0,0 +1,43 @@
+import argparse
+import sys
+import time
+
+from api import db, export
+from writers import ingest
+
+
+# Function to stream a filtered export of flower to a file, or stdout when path is '-'
+def export_flower(path, export_format='csv', location=None, run_id=None, since=None, until=None,
+                  db_path=ingest.DB_PATH):
+    started = time.perf_counter()
+    written = 0
+    sql, params = export.export_query(location, run_id, since, until)
+    conn = db.connect(db_path)
+    try:
+        output = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        try:
+            for data in export.export(conn, export_format, sql, params):
+                output.write(data)
+                written += len(data)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+    finally:
+        conn.close()
+
+    print(f"Exported {written / 1024 / 1024:.1f} MiB of gzipped {export_format} in "
+          f"{time.perf_counter() - started:.1f}s.", file=sys.stderr)
+    return written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export flower rows as gzip-compressed CSV or NDJSON')
+    parser.add_argument('path', help="output file, or '-' for stdout")
+    parser.add_argument('--format', choices=export.FORMATS, default='csv')
+    parser.add_argument('--location', help='only export this location')
+    parser.add_argument('--run', type=int, help='only export rows published by this run')
+    parser.add_argument('--since', help='only export rows from runs finished on or after YYYY-MM-DD')
+    parser.add_argument('--until', help='only export rows from runs finished on or before YYYY-MM-DD')
+    parser.add_argument('--db', default=ingest.DB_PATH, help='database to export from')
+    args = parser.parse_args()
+
+    export_flower(args.path, args.format, args.location, args.run, args.since, args.until, args.db)
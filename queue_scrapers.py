@@ -0,0 +1,79 @@
+import argparse
+import multiprocessing
+import time
+
+from writers import alerts, ingest, job_queue, matching, rate_limit, registry
+
+
+# Function to queue one job per enabled site as a new run
+def enqueue_sites(registry_path=registry.REGISTRY_PATH, queue_path=job_queue.QUEUE_PATH):
+    sites = registry.load_registry(registry_path)
+    run_id = ingest.start_run()
+    conn = job_queue.connect(queue_path)
+    try:
+        for site in sites.enabled():
+            job_queue.enqueue(conn, site.location, site.category, run_id=run_id, domain=site.domain)
+    finally:
+        conn.close()
+    print(f"Queued {len(sites.enabled())} sites as run {run_id}.")
+    return run_id
+
+def scrape_job(job, registry_path=registry.REGISTRY_PATH):
+    """ Scrape the site a job names. A retry resumes from the pages its failed attempt already staged. """
+    sites = registry.load_registry(registry_path)
+    site = {site.location: site for site in sites.sites}.get(job['location'])
+    if site is None:
+        raise KeyError(f"{job['location']} is not in the site registry")
+    # Each worker process has its own token buckets, but claims never lease more of a domain's jobs
+    # than its concurrency, so a worker taking that share of the rate keeps the domain within it
+    share = sites.concurrency(site.domain)
+    limits = sites.domains.get(site.domain, {})
+    domains = {**sites.domains, site.domain: {
+        'rate': limits.get('rate', sites.domain_rate) / share,
+        'burst': max(limits.get('burst', sites.domain_burst) / share, 1),
+    }}
+    rate_limit.configure(domains, sites.domain_rate, sites.domain_burst)
+    started = time.time()
+    registry.scrape_site(site, resume=job['attempts'] > 1)
+    return {'seconds': round(time.time() - started, 1)}
+
+def wrap_up(conn, job):
+    """ After the last job of a run: mark it published, match new names and send alerts. """
+    if job_queue.finish_run(conn, job['run_id']):
+        ingest.finish_run(job['run_id'])
+        matching.match_new_products()
+        alerts.evaluate_changes()
+
+def run_worker(registry_path, queue_path, until_empty):
+    # max_browsers and domain concurrency hold across every worker sharing the queue, checked when a job is claimed
+    limits = registry.load_registry(registry_path).queue_limits()
+    job_queue.work(lambda job: scrape_job(job, registry_path), queue_path, until_empty=until_empty,
+                   on_finished=wrap_up, limits=limits)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrape sites through a durable job queue shared by any number '
+                                                 'of worker processes')
+    parser.add_argument('--sites', default=registry.REGISTRY_PATH, help='site registry to queue and scrape from')
+    parser.add_argument('--queue', default=job_queue.QUEUE_PATH, help='job queue database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('enqueue', help='queue every enabled site as a new run')
+    work = commands.add_parser('work', help='claim and scrape jobs')
+    work.add_argument('--workers', type=int, default=1, help='worker processes to start on this machine; '
+                      'no more than the registry\'s max_browsers scrape at once across all machines')
+    work.add_argument('--until-empty', action='store_true', help='exit once no job is queued or leased')
+    commands.add_parser('status', help='print the number of jobs in each state')
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        enqueue_sites(args.sites, args.queue)
+    elif args.command == 'work':
+        workers = [multiprocessing.Process(target=run_worker, args=(args.sites, args.queue, args.until_empty))
+                   for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        conn = job_queue.connect(args.queue)
+        print(job_queue.counts(conn))
+        conn.close()
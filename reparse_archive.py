@@ -0,0 +1,77 @@
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from writers import archive, ingest
+
+
+# Create the table that receives rebuilt rows, tagged with the run they came from
+def create_rebuild_table(cursor, table):
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Product TEXT,
+            Brand TEXT,
+            Potency REAL,
+            Weight REAL,
+            Price REAL,
+            StrainType TEXT,
+            Location TEXT,
+            RunId INTEGER
+        )
+    ''')
+
+# Function to re-parse every archived page of a run across a process pool
+def reparse_run(run_id, location=None, table='flower_rebuild', workers=None,
+                db_path=ingest.DB_PATH, archive_path=archive.ARCHIVE_PATH):
+    pages = archive.run_pages(run_id, location, archive_path)
+    if not pages:
+        print(f"No archived pages found for run {run_id}.")
+        return 0
+
+    workers = workers or os.cpu_count()
+    print(f"Re-parsing {len(pages)} archived pages of run {run_id} with {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(archive.reparse_page, *zip(*pages), [archive_path] * len(pages),
+                           chunksize=max(1, len(pages) // (4 * workers)))
+
+        try:
+            conn = sqlite3.connect(db_path)
+            cursor = conn.cursor()
+            create_rebuild_table(cursor, table)
+
+            # Replace any earlier rebuild of the same run and locations
+            if location:
+                cursor.execute(f'DELETE FROM {table} WHERE RunId IS ? AND Location = ?', (run_id, location))
+            else:
+                cursor.execute(f'DELETE FROM {table} WHERE RunId IS ?', (run_id,))
+
+            # Pages arrive in index order, so variants repeated on a later page are dropped
+            # the same way the live scrape drops them
+            seen_keys = {}
+            count = 0
+            for page_location, page_number, products in results:
+                unseen = ingest.unseen_products(products, seen_keys.setdefault(page_location, set()))
+                rows = [row + (run_id,) for row in ingest.product_rows(unseen)]
+                cursor.executemany(f'''
+                    INSERT INTO {table} (Product, Brand, Potency, Weight, Price, StrainType, Location, RunId)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                count += len(rows)
+
+            conn.commit()
+            print(f"Rebuilt {count} products for run {run_id} into {table}.")
+            return count
+        finally:
+            conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild flower rows for a past run from archived menu pages')
+    parser.add_argument('run_id', type=int, help='run whose archived pages are re-parsed')
+    parser.add_argument('--location', help='only re-parse this location')
+    parser.add_argument('--table', default='flower_rebuild', help='table that receives the rebuilt rows')
+    parser.add_argument('--workers', type=int, help='worker processes (defaults to the core count)')
+    args = parser.parse_args()
+
+    reparse_run(args.run_id, args.location, args.table, args.workers)
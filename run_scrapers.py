@@ -1,33 +1,44 @@
-from writers import  dutchie_writer, elevate_writer, green_light_writer, high_profile_writers
+import argparse
+import sys
 
+from writers import alerts, db_writer, ingest, matching, page_cache, parse_service, registry
 
-# Function to run both scrapers
-def run_scrapers():
-    print("Running Greenlight scraper...")
-    green_light_writer.truncate_table()  # Optional: truncate before running each scraper
-    green_light_writer.scrape_data('https://greenlightdispensary.com/cape-girardeau-menu/?dtche%5Bcategory%5D=flower', 'Greenlight')
 
-    print("Running Dutchie scrapers...")
-    # List of URLs and their corresponding location names for CodesWriter
-    urls_and_locations = [
-        ('https://codesdispensary.com/location/cape-girardeau-mo/?dtche%5Bcategory%5D=flower', 'CODES'),
-        ('https://gooddayfarmdispensary.com/cape-girardeau-menu/?dtche%5Bcategory%5D=flower', 'Good Day Farm'),
-    ]
-    dutchie_writer.scrape_data(urls_and_locations)
+# Function to scrape every enabled site in the registry
+def run_scrapers(resume=False, registry_path=registry.REGISTRY_PATH):
+    # A bad registry stops the run before a run is started or a browser opened
+    sites = registry.load_registry(registry_path)
+    run_id = ingest.start_run(resume)
 
-    print("Running High Profile scraper...")
-    urls_and_locations = [
-        ('https://highprofilecannabis.com/shop/cape-girardeau/flower', 'High Profile'),
-    ]
-    high_profile_writers.scrape_data(urls_and_locations)
+    # Each location's rows are replaced once its scrape finishes, so the table is no longer
+    # truncated up front and an interrupted run can be resumed with --resume
+    registry.scrape_sites(sites, resume)
+    db_writer.close()
 
+    # Mark the run as published and report skipped menus and reused pages
+    ingest.finish_run(run_id)
 
-    print("Running Elevate scrapers...")
-    # List of URLs and their corresponding location names for CodesWriter
-    urls_and_locations = [
-        ('https://keycannabis.com/shop/cape-girardeau-mo/?dtche%5Bcategory%5D=flower', 'Elevate')
-    ]
-    elevate_writer.scrape_data(urls_and_locations)
+    # Link names listed for the first time to the same product at other stores
+    matching.match_new_products()
+    # Notify watches of the price drops and new listings this run published
+    alerts.evaluate_changes()
+    page_cache.report()
+    parse_service.report()
+    db_writer.report()
 
 if __name__ == '__main__':
-    run_scrapers()
+    parser = argparse.ArgumentParser(description='Scrape dispensary flower menus into dispensary.db')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted run from the first unfinished page of each location')
+    parser.add_argument('--sites', default=registry.REGISTRY_PATH, help='site registry to scrape')
+    parser.add_argument('--check', action='store_true', help='validate the site registry and exit')
+    args = parser.parse_args()
+
+    if args.check:
+        try:
+            sites = registry.load_registry(args.sites)
+        except registry.RegistryError as e:
+            sys.exit(str(e))
+        print(f"{args.sites}: {len(sites.enabled())} of {len(sites.sites)} sites enabled.")
+    else:
+        run_scrapers(resume=args.resume, registry_path=args.sites)
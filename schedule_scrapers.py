@@ -0,0 +1,18 @@
+import argparse
+
+from writers import registry, scheduler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Keep scraping each menu in sites.json as often as it has been seen to change')
+    parser.add_argument('--sites', default=registry.REGISTRY_PATH, help='site registry to schedule')
+    parser.add_argument('--wave', type=int,
+                        help='most due sites scraped per run (default: twice the browser budget)')
+    parser.add_argument('--status', action='store_true', help='print the queue and exit')
+    args = parser.parse_args()
+
+    if args.status:
+        scheduler.print_queue(args.sites)
+    else:
+        scheduler.run_forever(args.sites, args.wave)
@@ -0,0 +1,16 @@
+import argparse
+
+from api.app import create_app
+from writers import ingest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve a read-only JSON API over dispensary.db')
+    parser.add_argument('--db', default=ingest.DB_PATH, help='database to serve')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--disk-cache', help='also keep cached query results in this SQLite file')
+    args = parser.parse_args()
+
+    # Each request runs in its own thread on a pooled read-only connection
+    create_app(args.db, args.disk_cache).run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The writers and api packages are imported from the repository root, as the scripts there do
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -0,0 +1,95 @@
+import json
+import sqlite3
+
+import pytest
+
+from writers import alerts, encoding
+
+
+def watch(watch_id, metric, threshold, location=None, brand=None, strain_type=None, weight=None, canonical_id=None):
+    return watch_id, location, brand, strain_type, weight, canonical_id, metric, threshold, 'print', 'test'
+
+
+def matched(index, metric, value, location='CODES', brand='Codes', strain_type='Hybrid', weight=3.5,
+            canonical_id=None):
+    dimensions = alerts.watch_dimensions(location, brand, strain_type, weight, canonical_id)
+    return sorted(watch_id for watch_id, _, _ in index.matches(metric, value, dimensions))
+
+
+def test_watch_fires_at_or_below_its_threshold():
+    index = alerts.WatchIndex([watch(1, 'price', 30.0), watch(2, 'price', 40.0), watch(3, 'price_per_gram', 10.0)])
+    assert matched(index, 'price', 30.0) == [1, 2]
+    assert matched(index, 'price', 35.0) == [2]
+    assert matched(index, 'price', 45.0) == []
+    assert matched(index, 'price_per_gram', 9.0) == [3]
+    assert matched(index, 'price', None) == []
+
+
+def test_watch_fields_match_exactly_or_as_wildcards():
+    index = alerts.WatchIndex([
+        watch(1, 'price', 50.0, location='CODES'),
+        watch(2, 'price', 50.0, location='Good Day Farm'),
+        watch(3, 'price', 50.0, brand='Proper Cannabis', weight=3.5),
+        watch(4, 'price', 50.0, strain_type='Indica'),
+        watch(5, 'price', 50.0, canonical_id=7),
+    ])
+    assert matched(index, 'price', 30.0) == [1]
+    # Brands, strain types and weights are matched independently of spelling
+    assert matched(index, 'price', 30.0, brand='Proper', strain_type='INDICA') == [1, 3, 4]
+    assert matched(index, 'price', 30.0, brand='Proper', weight=7.0) == [1]
+    assert matched(index, 'price', 30.0, location='Good Day Farm', canonical_id=7) == [2, 5]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'dispensary.db')
+    conn = sqlite3.connect(path)
+    encoding.create_encoded_tables(conn.cursor())
+    alerts.create_alert_tables(conn.cursor())
+    conn.executemany('''
+        INSERT INTO price_changes (RunId, Location, Product, Brand, StrainType, Weight, OldPrice, NewPrice)
+        VALUES (1, 'CODES', ?, 'Codes', 'Hybrid', 3.5, ?, ?)
+    ''', [('Dosilato', 40.0, 30.0), ('Gelato', 30.0, 40.0), ('Kiwi Candy', None, 25.0)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_evaluate_changes_notifies_drops_and_new_variants(db_path, monkeypatch):
+    sent = []
+    monkeypatch.setitem(alerts.SINKS, 'print', lambda target, notifications: sent.extend(notifications))
+    alerts.add_watch('price', 35.0, 'print', 'test', location='CODES', db_path=db_path)
+
+    assert alerts.evaluate_changes(db_path) == 2
+    assert sorted(notification['product'] for notification in sent) == ['Dosilato', 'Kiwi Candy']
+    # Each change is evaluated once
+    assert alerts.evaluate_changes(db_path) == 0
+
+
+def test_failed_deliveries_are_kept_for_retry(db_path, monkeypatch):
+    def failing(target, notifications):
+        raise ConnectionError('refused')
+
+    monkeypatch.setitem(alerts.SINKS, 'print', failing)
+    alerts.add_watch('price', 35.0, 'print', 'test', db_path=db_path)
+    assert alerts.evaluate_changes(db_path) == 0
+
+    conn = sqlite3.connect(db_path)
+    outbox = conn.execute('SELECT Notification, Attempts FROM alert_outbox').fetchall()
+    conn.close()
+    assert sorted(json.loads(notification)['product'] for notification, _ in outbox) == ['Dosilato', 'Kiwi Candy']
+    assert {attempts for _, attempts in outbox} == {1}
+
+    sent = []
+    monkeypatch.setitem(alerts.SINKS, 'print', lambda target, notifications: sent.extend(notifications))
+    assert alerts.evaluate_changes(db_path) == 2
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT COUNT(*) FROM alert_outbox').fetchone()[0] == 0
+    conn.close()
+
+
+def test_add_watch_rejects_unknown_metric_or_sink(db_path):
+    with pytest.raises(ValueError):
+        alerts.add_watch('potency', 30.0, 'print', 'test', db_path=db_path)
+    with pytest.raises(ValueError):
+        alerts.add_watch('price', 30.0, 'pager', 'test', db_path=db_path)
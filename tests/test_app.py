@@ -0,0 +1,140 @@
+import gzip
+import sqlite3
+import zlib
+
+import pytest
+
+from api import app as api_app
+from writers import ingest, matching
+
+ROWS = [
+    ('Codes: Flower | Dosilato | 3.5g', 'Codes', 30.0, 3.5, 35.0, 'Hybrid', 'CODES'),
+    ('Dosilato', 'Codes', 29.0, 3.5, 30.0, 'Hybrid', 'Good Day Farm'),
+    ('Kiwi Candy #5', 'Proper', 25.0, 7.0, 50.0, 'Indica', 'CODES'),
+    ('Gelato', 'Proper', 22.0, 1.0, 12.0, 'Hybrid', 'Good Day Farm'),
+]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'dispensary.db')
+    conn = sqlite3.connect(path)
+    ingest.create_run_tables(conn.cursor())
+    conn.executemany(f'INSERT INTO flower ({ingest.FLOWER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)', ROWS)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def client(db_path):
+    return api_app.create_app(db_path).test_client()
+
+
+def test_products_before_matching_has_run(client):
+    response = client.get('/products/1')
+    assert response.status_code == 200
+    assert response.get_json() == {'canonical_id': 1, 'results': []}
+
+
+def test_products_change_when_matching_runs_without_a_publish(client, db_path):
+    # Matching creates its tables; a poll after that must not be answered with the old ETag
+    conn = sqlite3.connect(db_path)
+    matching.create_matching_tables(conn.cursor())
+    conn.close()
+    before = client.get('/products/1')
+    assert before.get_json()['results'] == []
+
+    matching.match_new_products(db_path)
+    after = client.get('/products/1', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert {row['Location'] for row in after.get_json()['results']} == {'CODES', 'Good Day Farm'}
+    assert client.get('/products/1', headers={'If-None-Match': after.headers['ETag']}).status_code == 304
+
+
+def pages(client, url):
+    """ Follow next_cursor from url and return every page's results. """
+    results = []
+    while url:
+        body = client.get(url).get_json()
+        results.append(body['results'])
+        url = body['next_cursor'] and f"{url.split('&cursor=')[0]}&cursor={body['next_cursor']}"
+    return results
+
+
+def test_keyset_pages_follow_the_sort_without_gaps(client):
+    by_price = pages(client, '/flower?sort=price&limit=3')
+    assert [[row['Price'] for row in page] for page in by_price] == [[12.0, 30.0, 35.0], [50.0]]
+
+    by_price_per_gram = pages(client, '/flower?sort=-price_per_gram&location=CODES&limit=1')
+    assert [row['Product'] for page in by_price_per_gram for row in page] == [
+        'Codes: Flower | Dosilato | 3.5g', 'Kiwi Candy #5']
+
+
+def test_fields_projects_columns_and_keeps_the_cursor(client):
+    first = client.get('/flower?sort=price&limit=2&fields=product,PRICE').get_json()
+    assert first['results'] == [{'Product': 'Gelato', 'Price': 12.0}, {'Product': 'Dosilato', 'Price': 30.0}]
+    rest = client.get(f"/flower?sort=price&limit=2&fields=product,PRICE&cursor={first['next_cursor']}").get_json()
+    assert [row['Price'] for row in rest['results']] == [35.0, 50.0]
+
+    assert client.get('/flower?fields=product,colour').status_code == 400
+    assert client.get('/flower?cursor=not-a-cursor').status_code == 400
+
+
+def test_location_page_is_read_in_index_order(db_path):
+    conn = sqlite3.connect(db_path)
+    for column in ('Price', 'PricePerGram', 'Potency'):
+        sql, params = api_app.keyset_query(['Location = ?'], ['CODES'], column, True,
+                                           api_app.encode_cursor(40.0, 3), ['id'], 10)
+        plan = ' '.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+        assert 'TEMP B-TREE' not in plan
+    conn.close()
+
+
+def test_etag_answers_polls_with_304_until_the_next_publish(client, db_path):
+    first = client.get('/flower?sort=price')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+
+    unchanged = client.get('/flower?sort=price', headers={'If-None-Match': etag})
+    assert unchanged.status_code == 304
+    assert unchanged.data == b''
+    # Another query has its own ETag
+    assert client.get('/flower?sort=-price', headers={'If-None-Match': etag}).status_code == 200
+
+    conn = sqlite3.connect(db_path)
+    conn.execute(f'INSERT INTO flower ({ingest.FLOWER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                 ('Sundae', 'Proper', 24.0, 3.5, 40.0, 'Hybrid', 'CODES'))
+    conn.commit()
+    conn.close()
+    changed = client.get('/flower?sort=price', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.get_json()['count'] == 5
+
+
+def test_if_modified_since_uses_the_last_publish(client, db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('INSERT INTO scrape_runs (StartedAt, PublishedAt) VALUES (?, ?)', (1700000000, 1700000100))
+    conn.commit()
+    conn.close()
+
+    response = client.get('/flower')
+    assert response.headers['Last-Modified'] == 'Tue, 14 Nov 2023 22:15:00 GMT'
+    assert client.get('/flower', headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code == 304
+    assert client.get('/flower', headers={'If-Modified-Since': 'Tue, 14 Nov 2023 22:00:00 GMT'}).status_code == 200
+
+
+@pytest.mark.parametrize('coding, decompress', [('gzip', gzip.decompress), ('deflate', zlib.decompress)])
+def test_compressed_body_matches_the_plain_one(client, coding, decompress):
+    plain = client.get('/flower?sort=price')
+    compressed = client.get('/flower?sort=price', headers={'Accept-Encoding': f'{coding}, br;q=0'})
+    assert compressed.headers['Content-Encoding'] == coding
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert decompress(compressed.data) == plain.data
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+
+    # Each coding is revalidated against its own ETag
+    assert client.get('/flower?sort=price', headers={
+        'Accept-Encoding': coding, 'If-None-Match': compressed.headers['ETag']}).status_code == 304
+    assert 'Content-Encoding' not in client.get('/flower?sort=price', headers={'Accept-Encoding': 'br'}).headers
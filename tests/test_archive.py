@@ -0,0 +1,32 @@
+from writers import archive, high_profile_writers
+
+PAGE = '''<html><head><title>Menu</title></head><body>
+<nav><a href="/deals">Deals</a></nav>
+<div class="shopitem">
+  <p class="shopitem__title">Dosilato</p>
+  <p class="shopitem__strain">Hybrid</p>
+  <p class="shopitem__strain-thc">THC 30%</p>
+  <p class="shopitem__brand">Codes</p>
+  <div class="shopitem__listPrices-productVariants-item">
+    <p class="shopitem__listPrices-productVariants-name">3.5g</p>
+    <p class="shopitem__listPrices-productVariants-price">$35.00</p>
+  </div>
+</div>
+</body></html>'''
+
+
+def test_whole_page_is_archived_once_and_reparsed(tmp_path):
+    path = str(tmp_path / 'menu_archive.db')
+    parse = high_profile_writers.parse_products
+    archive.store_page(PAGE, 7, 'CODES', 1, parse, path)
+    archive.store_page(PAGE, 7, 'CODES', 2, parse, path)
+
+    pages = archive.run_pages(7, archive_path=path)
+    assert [(location, number) for location, number, _, _ in pages] == [('CODES', 1), ('CODES', 2)]
+    assert pages[0][3] == pages[1][3]
+    assert archive.load_page(pages[0][3], path) == PAGE
+
+    # The parser picks the cards out of the whole page itself
+    location, page_number, products = archive.reparse_page(*pages[0], path)
+    assert (location, page_number) == ('CODES', 1)
+    assert [(product.name, product.price) for product in products] == [('Dosilato', 35.0)]
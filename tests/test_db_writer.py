@@ -0,0 +1,87 @@
+import sqlite3
+import threading
+
+import pytest
+
+from writers import db_writer, encoding, ingest
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """ An empty database whose writer thread is stopped after the test. """
+    path = str(tmp_path / 'dispensary.db')
+    conn = sqlite3.connect(path)
+    ingest.create_run_tables(conn.cursor())
+    conn.execute('CREATE TABLE notes (Note TEXT)')
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db_writer, 'stats', {'transactions': 0, 'writes': 0, 'rows': 0, 'failed': 0,
+                                             'commit_seconds': [], 'wait_seconds': []})
+    yield path
+    db_writer.close()
+
+
+def note(text):
+    return lambda cursor: cursor.execute('INSERT INTO notes (Note) VALUES (?)', (text,)).rowcount
+
+
+def failing(cursor):
+    cursor.execute("INSERT INTO notes (Note) VALUES ('lost')")
+    raise RuntimeError('bad page')
+
+
+def notes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute('SELECT Note FROM notes ORDER BY rowid')]
+    finally:
+        conn.close()
+
+
+def test_failed_write_raises_and_rolls_back_alone(db_path):
+    # Hold the writer on a first write so the next three are taken as one batch
+    release = threading.Event()
+    blocked = db_writer.submit(lambda cursor: release.wait(5), db_path=db_path)
+    futures = [db_writer.submit(write, 1, db_path) for write in (note('before'), failing, note('after'))]
+    release.set()
+
+    assert blocked.result() is True
+    assert futures[0].result() == 1
+    with pytest.raises(RuntimeError, match='bad page'):
+        futures[1].result()
+    assert futures[2].result() == 1
+    assert notes(db_path) == ['before', 'after']
+    assert db_writer.stats['failed'] == 1
+    assert db_writer.stats['writes'] == 3
+
+
+def test_rolled_back_dictionary_codes_are_forgotten(db_path):
+    def encode_then_fail(cursor):
+        encoding.encode(cursor, 'Brand', 'Codes')
+        raise RuntimeError('bad page')
+
+    with pytest.raises(RuntimeError):
+        db_writer.submit(encode_then_fail, db_path=db_path).result()
+
+    # The rolled back code must not be handed out again as if it had been stored
+    def encode(cursor):
+        code = encoding.encode(cursor, 'Brand', 'Codes')
+        return cursor.execute('SELECT Name FROM brand_dict WHERE Code = ?', (code,)).fetchone()
+
+    assert db_writer.submit(encode, db_path=db_path).result() == ('Codes',)
+
+
+def test_locked_database_fails_the_batch_after_busy_timeout(db_path, monkeypatch):
+    monkeypatch.setattr(db_writer, 'BUSY_TIMEOUT', 0.1)
+    other = sqlite3.connect(db_path, isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    try:
+        with pytest.raises(sqlite3.OperationalError, match='locked'):
+            db_writer.submit(note('blocked'), 1, db_path).result()
+    finally:
+        other.execute('ROLLBACK')
+        other.close()
+
+    # The writer carries on once the lock is released
+    assert db_writer.submit(note('later'), 1, db_path).result() == 1
+    assert notes(db_path) == ['later']
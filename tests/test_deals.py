@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+from writers import deals, ingest
+
+
+def changed(product, price, weight=3.5, strain_type='Hybrid', location='CODES'):
+    """ A variant as changes.record_changes returns it. """
+    return (1, location, product, 'Codes', strain_type, weight, None, price, 0)
+
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(':memory:')
+    ingest.create_run_tables(conn.cursor())
+    yield conn.cursor()
+    conn.close()
+
+
+def test_window_keeps_the_newest_prices_in_order(monkeypatch):
+    monkeypatch.setattr(deals, 'WINDOW_SIZE', 3)
+    window = deals.PriceWindow()
+    assert window.add(1, 12.0) == []
+    window.add(2, 8.0)
+    window.add(3, 10.0)
+    assert window.median() == 10.0
+
+    assert window.add(4, 6.0) == [1]
+    assert list(window.sorted) == [6.0, 8.0, 10.0]
+    assert window.percentile_rank(9.0) == pytest.approx(200 / 3)
+    window.add(5, 4.0)
+    assert window.median() == 6.0
+
+
+def test_cheap_variant_is_a_deal_once_the_window_is_full(cursor):
+    history = [changed(f'Strain {i}', 35.0 + i % 5) for i in range(deals.MIN_WINDOW - 1)]
+    assert deals.detect_deals(cursor, 'CODES', 1, history) == 0
+    # One short of MIN_WINDOW, so even a cheap variant is only added to the window
+    assert deals.detect_deals(cursor, 'CODES', 1, [changed('Early', 10.0)]) == 0
+
+    assert deals.detect_deals(cursor, 'CODES', 2, [changed('Dosilato', 20.0), changed('Gelato', 34.0)]) == 1
+    row = cursor.execute('SELECT Product, RunId, PricePerGram, Percentile, Discount FROM deals').fetchone()
+    assert row[:3] == ('Dosilato', 2, pytest.approx(20.0 / 3.5))
+    assert row[3] <= deals.DEAL_PERCENTILE and row[4] >= deals.MIN_DISCOUNT
+
+
+def test_windows_are_per_location_bucket_and_strain(cursor):
+    history = [changed(f'Strain {i}', 35.0) for i in range(deals.MIN_WINDOW)]
+    deals.detect_deals(cursor, 'CODES', 1, history)
+    assert deals.detect_deals(cursor, 'CODES', 2, [changed('Dosilato', 10.0, strain_type='Indica')]) == 0
+    assert deals.detect_deals(cursor, 'CODES', 2, [changed('Dosilato', 20.0, weight=7.0)]) == 0
+    assert deals.detect_deals(cursor, 'Good Day Farm', 2, [changed('Dosilato', 10.0, location='Good Day Farm')]) == 0
+    assert deals.detect_deals(cursor, 'CODES', 2, [changed('Dosilato', 10.0)]) == 1
+
+
+def test_variant_is_listed_as_one_deal_and_old_prices_leave_the_window(cursor, monkeypatch):
+    monkeypatch.setattr(deals, 'WINDOW_SIZE', deals.MIN_WINDOW)
+    deals.detect_deals(cursor, 'CODES', 1, [changed(f'Strain {i}', 35.0) for i in range(deals.MIN_WINDOW)])
+    deals.detect_deals(cursor, 'CODES', 2, [changed('Dosilato', 10.0)])
+    deals.detect_deals(cursor, 'CODES', 3, [changed('Dosilato', 9.0)])
+
+    assert cursor.execute('SELECT Price, RunId FROM deals').fetchall() == [(9.0, 3)]
+    window = cursor.execute("SELECT COUNT(*) FROM deal_window WHERE Location = 'CODES'").fetchone()[0]
+    assert window == deals.MIN_WINDOW
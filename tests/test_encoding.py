@@ -0,0 +1,108 @@
+import sqlite3
+
+import pytest
+
+from writers import encoding
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    encoding.create_encoded_tables(conn.cursor())
+    return conn
+
+
+def test_encode_and_decode_round_trip(tmp_path):
+    conn = connect(str(tmp_path / 'dispensary.db'))
+    cursor = conn.cursor()
+    try:
+        codes = [encoding.encode(cursor, 'Brand', name) for name in ('Codes', 'Proper', 'Codes')]
+        assert codes[0] == codes[2] != codes[1]
+        assert encoding.decode(cursor, 'Brand', codes[1]) == 'Proper'
+        assert encoding.lookup(cursor, 'Brand', 'Proper') == codes[1]
+        assert encoding.lookup(cursor, 'Brand', 'Unknown') is None
+        assert encoding.encode(cursor, 'Brand', None) is None
+    finally:
+        encoding.forget(cursor)
+        conn.close()
+
+
+def test_in_memory_databases_do_not_share_codes():
+    first, second = connect(':memory:'), connect(':memory:')
+    try:
+        # Different names get code 1 in each database; neither may see the other's through a cache
+        assert encoding.encode(first.cursor(), 'Location', 'CODES') == 1
+        assert encoding.encode(second.cursor(), 'Location', 'Good Day Farm') == 1
+        assert encoding.decode(first.cursor(), 'Location', 1) == 'CODES'
+        assert encoding.decode(second.cursor(), 'Location', 1) == 'Good Day Farm'
+        assert encoding.lookup(second.cursor(), 'Location', 'CODES') is None
+    finally:
+        first.close()
+        second.close()
+
+
+def test_forget_drops_codes_of_a_replaced_database(tmp_path):
+    path = str(tmp_path / 'dispensary.db')
+    conn = connect(path)
+    assert encoding.encode(conn.cursor(), 'StrainType', 'Hybrid') == 1
+    conn.commit()
+    conn.close()
+
+    (tmp_path / 'dispensary.db').unlink()
+    conn = connect(path)
+    try:
+        encoding.forget(conn.cursor())
+        assert encoding.lookup(conn.cursor(), 'StrainType', 'Hybrid') is None
+    finally:
+        conn.close()
+
+
+def test_flower_view_decodes_inserted_rows(tmp_path):
+    conn = connect(str(tmp_path / 'dispensary.db'))
+    try:
+        conn.execute('INSERT INTO flower (Product, Brand, Potency, Weight, Price, StrainType, Location) '
+                     "VALUES ('Dosilato', 'Codes', 30.0, 3.5, 35.0, 'Hybrid', 'CODES')")
+        assert conn.execute('SELECT Product, Brand, StrainType, Location, PricePerGram FROM flower').fetchall() == [
+            ('Dosilato', 'Codes', 'Hybrid', 'CODES', 10.0)]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('product, weight, grams', [
+    ('Dosilato', 0.125, 3.5),
+    ('Dosilato', 0.25, 7.0),
+    ('ROBUST - PREPACK - 1G - PINNACLE', 1.0, 1.0),
+    ('CODES - PREPACK - 28G - DOSILATO', 1.0, 28.0),
+    ('CODES - 14G - DOSILATO', 0.5, 14.0),
+    ('Dosilato', 1.0, None),
+    ('Dosilato', 0.5, None),
+    # The name states another size than either reading gives
+    ('Gelato 3.5g', 1.0, None),
+])
+def test_legacy_grams(product, weight, grams):
+    assert encoding.legacy_grams(product, weight) == grams
+
+
+def test_legacy_flower_table_is_migrated_to_grams(tmp_path):
+    path = str(tmp_path / 'dispensary.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE flower (id INTEGER PRIMARY KEY AUTOINCREMENT, Product TEXT, Brand TEXT, '
+                 'Potency REAL, Weight REAL, Price REAL, StrainType TEXT, Location TEXT)')
+    conn.executemany('INSERT INTO flower (Product, Brand, Weight, Price, Location) VALUES (?, ?, ?, ?, ?)', [
+        ('Dosilato', 'Codes', 0.125, 35.0, 'CODES'),
+        ('ROBUST - PREPACK - 1G - PINNACLE', 'Robust', 1.0, 13.0, 'Elevate'),
+        ('Gelato', 'Proper', 1.0, 200.0, 'High Profile'),
+        ('Gelato', 'Proper', 56.0, 400.0, 'High Profile'),
+    ])
+    conn.commit()
+    encoding.create_encoded_tables(conn.cursor())
+    try:
+        assert conn.execute('SELECT Product, Weight, PricePerGram FROM flower ORDER BY id').fetchall() == [
+            ('Dosilato', 3.5, 10.0),
+            ('ROBUST - PREPACK - 1G - PINNACLE', 1.0, 13.0),
+            ('Gelato', 56.0, 400.0 / 56.0),
+        ]
+        assert conn.execute('SELECT Product, Brand, Weight, Location, Reason FROM flower_quarantine').fetchall() == [
+            ('Gelato', 'Proper', 1.0, 'High Profile', 'weight unit unknown')]
+    finally:
+        encoding.forget(conn.cursor())
+        conn.close()
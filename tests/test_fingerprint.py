@@ -0,0 +1,104 @@
+import sqlite3
+
+import pytest
+
+from writers import db_writer, fingerprint, ingest
+from writers.records import ProductVariant
+
+
+def page(*names):
+    return [ProductVariant(name, 'Codes', 'Hybrid', 30.0, 3.5, 35.0, 'CODES') for name in names]
+
+
+def handles(*pages):
+    """ Pages as the cached parse_service handles store_location collects. """
+    return iter([(None, 'CODES', None, products) for products in pages])
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """ An empty database whose writer thread is stopped after the test. """
+    path = str(tmp_path / 'dispensary.db')
+    conn = sqlite3.connect(path)
+    ingest.create_run_tables(conn.cursor())
+    conn.commit()
+    conn.close()
+    yield path
+    db_writer.close()
+
+
+def insert(path):
+    return lambda products, location, page_number, seen_keys: db_writer.write_page(
+        products, location, page_number, seen_keys, path)
+
+
+def published(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute('SELECT Product FROM flower ORDER BY Product')]
+    finally:
+        conn.close()
+
+
+def test_page_fingerprint_changes_with_any_field():
+    assert fingerprint.page_fingerprint(page('Dosilato')) == fingerprint.page_fingerprint(page('Dosilato'))
+    assert fingerprint.page_fingerprint(page('Dosilato')) != fingerprint.page_fingerprint(page('Gelato'))
+    assert fingerprint.page_fingerprint(page('Dosilato')).startswith('1:')
+
+
+def test_store_and_forget(tmp_path):
+    path = str(tmp_path / 'dispensary.db')
+    assert fingerprint.load_fingerprint('CODES', path) is None
+    conn = sqlite3.connect(path)
+    fingerprint.store_fingerprint(conn.cursor(), 'CODES', '1:abc', 12.5)
+    conn.commit()
+    assert fingerprint.load_fingerprint('CODES', path) == {'fingerprint': '1:abc', 'scrape_seconds': 12.5}
+    fingerprint.store_fingerprint(conn.cursor(), 'CODES', None, 0)
+    conn.commit()
+    conn.close()
+    assert fingerprint.load_fingerprint('CODES', path) is None
+
+
+def test_unchanged_first_page_carries_the_menu_forward(db_path):
+    start_page, seen_keys = db_writer.begin_location('CODES', db_path=db_path)
+    assert db_writer.store_location(handles(page('Dosilato'), page('Gelato')), 'CODES', start_page, seen_keys,
+                                    insert(db_path), db_path)
+    assert published(db_path) == ['Dosilato', 'Gelato']
+    saved = fingerprint.load_fingerprint('CODES', db_path)
+    assert saved['fingerprint'] == fingerprint.page_fingerprint(page('Dosilato'))
+
+    # The same first page again stops before staging anything and keeps the published rows
+    stored = []
+    start_page, seen_keys = db_writer.begin_location('CODES', db_path=db_path)
+    assert not db_writer.store_location(handles(page('Dosilato'), page('Sundae')), 'CODES', start_page, seen_keys,
+                                        lambda *args: stored.append(args), db_path)
+    assert stored == []
+    assert published(db_path) == ['Dosilato', 'Gelato']
+
+
+def test_failed_page_write_publishes_nothing(db_path):
+    def failing(products, location, page_number, seen_keys):
+        if page_number == 2:
+            raise RuntimeError('database is locked')
+        insert(db_path)(products, location, page_number, seen_keys)
+
+    with pytest.raises(RuntimeError):
+        db_writer.store_location(handles(page('Dosilato'), page('Gelato')), 'CODES', 1, set(), failing, db_path)
+    assert published(db_path) == []
+    assert fingerprint.load_fingerprint('CODES', db_path) is None
+
+
+def test_failed_publish_saves_no_fingerprint(db_path, monkeypatch):
+    def publish_staged(cursor, location):
+        cursor.execute("DELETE FROM flower_partial WHERE Location = 'CODES'")
+        raise RuntimeError('disk I/O error')
+
+    monkeypatch.setattr(ingest, 'publish_staged', publish_staged)
+    with pytest.raises(RuntimeError):
+        db_writer.store_location(handles(page('Dosilato')), 'CODES', 1, set(), insert(db_path), db_path)
+    assert fingerprint.load_fingerprint('CODES', db_path) is None
+
+    # The failed publish was rolled back, so the staged page is still there to resume from
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT COUNT(*) FROM flower_partial').fetchone()[0] == 1
+    conn.close()
@@ -0,0 +1,114 @@
+import sqlite3
+
+import pytest
+
+from writers import db_writer, ingest
+from writers.records import ProductVariant
+
+
+def page(*names):
+    return [ProductVariant(name, 'Codes', 'Hybrid', 30.0, 3.5, 35.0, 'CODES') for name in names]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """ An empty database whose writer thread is stopped after the test. """
+    path = str(tmp_path / 'dispensary.db')
+    conn = sqlite3.connect(path)
+    ingest.create_run_tables(conn.cursor())
+    conn.commit()
+    conn.close()
+    yield path
+    db_writer.close()
+
+
+def scrape(path, location, *pages, resume=False):
+    """ Stage pages of a location the way a writer does and publish them. """
+    start_page, seen_keys = db_writer.begin_location(location, resume, path)
+    for page_number, products in enumerate(pages, start=start_page):
+        db_writer.write_page(products, location, page_number, seen_keys, path)
+    db_writer.publish_location(location, db_path=path)
+
+
+def compared(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute('SELECT Product FROM compare_index ORDER BY Rank')]
+    finally:
+        conn.close()
+
+
+def test_run_ranks_comparison_index_once_it_finishes(db_path):
+    run_id = ingest.start_run(db_path=db_path)
+    scrape(db_path, 'CODES', page('Dosilato', 'Gelato'))
+    assert compared(db_path) == []
+
+    ingest.finish_run(run_id, db_path)
+    assert compared(db_path) == ['Dosilato', 'Gelato']
+
+
+def test_publish_outside_a_run_ranks_comparison_index_straight_away(db_path):
+    scrape(db_path, 'CODES', page('Dosilato'))
+    assert compared(db_path) == ['Dosilato']
+
+
+def test_run_counts_autocomplete_names_once_it_finishes(db_path):
+    run_id = ingest.start_run(db_path=db_path)
+    scrape(db_path, 'CODES', page('Dosilato'))
+
+    conn = sqlite3.connect(db_path)
+    names = "SELECT Product FROM product_names_fts WHERE product_names_fts MATCH 'dos*'"
+    # Full-text search is kept current by triggers, autocomplete waits for the run
+    assert conn.execute("SELECT COUNT(*) FROM flower_fts WHERE flower_fts MATCH 'dosilato'").fetchone()[0] == 1
+    assert conn.execute(names).fetchall() == []
+
+    ingest.finish_run(run_id, db_path)
+    assert conn.execute(names).fetchall() == [('Dosilato',)]
+    conn.close()
+
+
+def staged(path, location):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM flower_partial WHERE Location = ?', (location,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_resume_continues_after_the_last_committed_page(db_path):
+    start_page, seen_keys = db_writer.begin_location('CODES', db_path=db_path)
+    db_writer.write_page(page('Dosilato'), 'CODES', start_page, seen_keys, db_path)
+    db_writer.write_page(page('Gelato'), 'CODES', start_page + 1, seen_keys, db_path)
+
+    # The scrape died before publishing; a resume starts on page 3 and still knows page 1's variants
+    start_page, seen_keys = db_writer.begin_location('CODES', True, db_path)
+    assert start_page == 3
+    assert seen_keys == {ingest.product_key(product) for product in page('Dosilato', 'Gelato')}
+    assert db_writer.write_page(page('Gelato', 'Sundae'), 'CODES', start_page, seen_keys, db_path) == 1
+
+    db_writer.publish_location('CODES', db_path=db_path)
+    conn = sqlite3.connect(db_path)
+    assert [row[0] for row in conn.execute('SELECT Product FROM flower ORDER BY id')] == [
+        'Dosilato', 'Gelato', 'Sundae']
+    conn.close()
+
+
+def test_resume_skips_a_published_location(db_path):
+    scrape(db_path, 'CODES', page('Dosilato'))
+    assert db_writer.begin_location('CODES', True, db_path) == (None, set())
+
+
+def test_fresh_scrape_discards_staged_pages(db_path):
+    start_page, seen_keys = db_writer.begin_location('CODES', db_path=db_path)
+    db_writer.write_page(page('Dosilato'), 'CODES', start_page, seen_keys, db_path)
+    assert staged(db_path, 'CODES') == 1
+
+    assert db_writer.begin_location('CODES', db_path=db_path) == (1, set())
+    assert staged(db_path, 'CODES') == 0
+
+
+def test_resumed_run_reopens_the_unfinished_run(db_path):
+    run_id = ingest.start_run(db_path=db_path)
+    assert ingest.start_run(resume=True, db_path=db_path) == run_id
+    ingest.finish_run(run_id, db_path)
+    assert ingest.start_run(resume=True, db_path=db_path) != run_id
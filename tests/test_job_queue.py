@@ -0,0 +1,159 @@
+import pytest
+
+from writers import job_queue
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = job_queue.connect(str(tmp_path / 'queue.db'))
+    yield conn
+    conn.close()
+
+
+def expire_lease(conn, job_id):
+    conn.execute('UPDATE jobs SET LeaseExpiresAt = 0 WHERE JobId = ?', (job_id,))
+
+
+def test_claim_leases_oldest_job_once(conn):
+    first = job_queue.enqueue(conn, 'CODES')
+    job_queue.enqueue(conn, 'Good Day Farm')
+
+    job = job_queue.claim(conn, 'a')
+    assert job['job_id'] == first
+    assert job['location'] == 'CODES'
+    assert job['attempts'] == 1
+    assert job_queue.claim(conn, 'b')['location'] == 'Good Day Farm'
+    assert job_queue.claim(conn, 'c') is None
+
+
+def test_complete_only_by_the_lease_owner(conn):
+    job_queue.enqueue(conn, 'CODES', run_id=7)
+    job = job_queue.claim(conn, 'a')
+
+    assert not job_queue.complete(conn, job['job_id'], 'b')
+    assert job_queue.complete(conn, job['job_id'], 'a', {'seconds': 1})
+    assert job_queue.counts(conn) == {'done': 1}
+    assert job_queue.pending(conn, 7) == 0
+
+
+def test_fail_requeues_after_backoff_then_gives_up(conn):
+    job_id = job_queue.enqueue(conn, 'CODES', max_attempts=2)
+
+    job = job_queue.claim(conn, 'a')
+    assert job_queue.fail(conn, job['job_id'], 'a', 'boom') == 'queued'
+    # Backing off, so not claimable yet
+    assert job_queue.claim(conn, 'a') is None
+
+    conn.execute('UPDATE jobs SET AvailableAt = 0 WHERE JobId = ?', (job_id,))
+    job = job_queue.claim(conn, 'a')
+    assert job['attempts'] == 2
+    assert job_queue.fail(conn, job['job_id'], 'a', 'boom') == 'failed'
+    assert job_queue.counts(conn) == {'failed': 1}
+
+
+def test_fail_after_losing_the_lease(conn):
+    job_queue.enqueue(conn, 'CODES')
+    job = job_queue.claim(conn, 'a')
+    expire_lease(conn, job['job_id'])
+    assert job_queue.claim(conn, 'b')['job_id'] == job['job_id']
+    assert job_queue.fail(conn, job['job_id'], 'a', 'boom') is None
+
+
+def test_backoff_doubles_with_jitter():
+    assert job_queue.BASE_BACKOFF / 2 <= job_queue.backoff(1) <= job_queue.BASE_BACKOFF
+    assert job_queue.BASE_BACKOFF <= job_queue.backoff(2) <= 2 * job_queue.BASE_BACKOFF
+    assert job_queue.backoff(100) <= job_queue.MAX_BACKOFF
+
+
+def test_expired_lease_is_taken_over(conn):
+    job_queue.enqueue(conn, 'CODES')
+    job = job_queue.claim(conn, 'a')
+    assert job_queue.claim(conn, 'b') is None
+
+    expire_lease(conn, job['job_id'])
+    taken = job_queue.claim(conn, 'b')
+    assert taken['job_id'] == job['job_id']
+    assert taken['attempts'] == 2
+    assert not job_queue.heartbeat(conn, job['job_id'], 'a')
+    assert job_queue.heartbeat(conn, job['job_id'], 'b')
+
+
+def test_expired_last_attempt_is_given_up_and_finishes_its_run(conn):
+    job_queue.enqueue(conn, 'CODES', run_id=3, max_attempts=1)
+    job = job_queue.claim(conn, 'a')
+    expire_lease(conn, job['job_id'])
+
+    # Not retried past its last attempt
+    assert job_queue.claim(conn, 'b') is None
+    given_up = job_queue.give_up_expired(conn)
+    assert [(expired['job_id'], expired['run_id']) for expired in given_up] == [(job['job_id'], 3)]
+    assert job_queue.counts(conn) == {'failed': 1}
+    assert job_queue.finish_run(conn, 3)
+
+
+def test_finish_run_fires_once_when_no_jobs_are_left(conn):
+    job_queue.enqueue(conn, 'CODES', run_id=1)
+    job_queue.enqueue(conn, 'Good Day Farm', run_id=1)
+    first = job_queue.claim(conn, 'a')
+    second = job_queue.claim(conn, 'a')
+
+    job_queue.complete(conn, first['job_id'], 'a')
+    assert not job_queue.finish_run(conn, 1)
+    job_queue.complete(conn, second['job_id'], 'a')
+    assert job_queue.finish_run(conn, 1)
+    assert not job_queue.finish_run(conn, 1)
+    assert not job_queue.finish_run(conn, None)
+
+
+def test_claim_keeps_to_domain_concurrency(conn):
+    job_queue.enqueue(conn, 'CODES', domain='codesdispensary.com')
+    job_queue.enqueue(conn, 'CODES 2', domain='codesdispensary.com')
+    job_queue.enqueue(conn, 'Good Day Farm', domain='gooddayfarmdispensary.com')
+    limits = {'domain_concurrency': 1}
+
+    assert job_queue.claim(conn, 'a', **limits)['location'] == 'CODES'
+    # The second CODES job waits for the first, later jobs of other domains go ahead
+    assert job_queue.claim(conn, 'b', **limits)['location'] == 'Good Day Farm'
+    assert job_queue.claim(conn, 'c', **limits) is None
+    assert job_queue.claim(conn, 'c', domain_concurrency=1,
+                           domain_limits={'codesdispensary.com': 2})['location'] == 'CODES 2'
+
+
+def test_claim_keeps_to_max_leased(conn):
+    for location in ('CODES', 'Good Day Farm', 'Elevate'):
+        job_queue.enqueue(conn, location, domain=location)
+    job = job_queue.claim(conn, 'a', max_leased=2)
+    assert job_queue.claim(conn, 'b', max_leased=2) is not None
+    assert job_queue.claim(conn, 'c', max_leased=2) is None
+
+    job_queue.complete(conn, job['job_id'], 'a')
+    assert job_queue.claim(conn, 'c', max_leased=2)['location'] == 'Elevate'
+
+
+def test_expired_leases_do_not_count_against_limits(conn):
+    job_queue.enqueue(conn, 'CODES', domain='codesdispensary.com')
+    job_queue.enqueue(conn, 'CODES 2', domain='codesdispensary.com')
+    job = job_queue.claim(conn, 'a', domain_concurrency=1)
+    expire_lease(conn, job['job_id'])
+    # The abandoned job is the oldest, so it is taken over first
+    assert job_queue.claim(conn, 'b', domain_concurrency=1)['job_id'] == job['job_id']
+    assert job_queue.claim(conn, 'c', domain_concurrency=1) is None
+
+
+def test_work_runs_handler_and_wraps_up_runs(tmp_path):
+    path = str(tmp_path / 'queue.db')
+    conn = job_queue.connect(path)
+    job_queue.enqueue(conn, 'CODES', run_id=1)
+    job_queue.enqueue(conn, 'Good Day Farm', run_id=1, max_attempts=1)
+    conn.close()
+
+    def handler(job):
+        if job['location'] == 'Good Day Farm':
+            raise RuntimeError('menu did not load')
+        return {'pages': 3}
+
+    finished = []
+    done = job_queue.work(handler, path, until_empty=True,
+                          on_finished=lambda conn, job: finished.append(job_queue.finish_run(conn, job['run_id'])))
+    assert done == 1
+    assert finished == [False, True]
@@ -0,0 +1,70 @@
+import sqlite3
+
+import pytest
+
+from writers import encoding, matching
+
+
+@pytest.mark.parametrize('product, brand, key', [
+    ('Codes: Flower | Dosilato | 3.5g', 'Codes', ('flower', 'dosilato')),
+    ('CODES - PREPACK - 3.5G - DOSILATO - HYBRID', 'Codes', ('flower', 'dosilato')),
+    ('Dosilato', 'Codes', ('flower', 'dosilato')),
+    ('Dosilato Popcorn', 'Codes', ('smalls', 'dosilato')),
+    ('GDF: Popcorn Flower | Kiwi Candy #5', 'Good Day Farm', ('smalls', 'kiwi candy #5')),
+    ('Proper Cannabis Gelato 1/8 oz', 'Proper Cannabis', ('flower', 'gelato')),
+    ('Gelato Pre-Roll 1g', 'Proper', ('preroll', 'gelato')),
+])
+def test_name_key(product, brand, key):
+    assert matching.name_key(product, brand) == key
+
+
+def test_name_key_keeps_a_name_made_only_of_skipped_words():
+    assert matching.name_key('Smalls', 'Codes') == ('smalls', 'smalls')
+
+
+def test_brand_key():
+    assert matching.brand_key('Proper Cannabis') == 'proper'
+    assert matching.brand_key('C4 (Carroll County Cannabis Co.)') == 'c4 carroll county'
+    assert matching.brand_key(None) == ''
+
+
+def test_brand_block_matches_similar_names():
+    block = matching.BrandBlock()
+    block.add(1, 'dosilato')
+    block.add(2, 'kiwi candy #5')
+    assert block.match('dosilato') == (1, 1.0)
+    assert block.match('dosilatto')[0] == 1
+    assert block.match('wedding cake')[0] is None
+
+
+def test_brand_block_keeps_numbered_phenotypes_apart():
+    block = matching.BrandBlock()
+    block.add(2, 'kiwi candy #5')
+    assert block.match('kiwi candy #19')[0] is None
+    assert block.match('kiwi candy # 5')[0] == 2
+
+
+def test_match_new_products_joins_names_across_stores(tmp_path):
+    path = str(tmp_path / 'dispensary.db')
+    conn = sqlite3.connect(path)
+    encoding.create_encoded_tables(conn.cursor())
+    conn.executemany('INSERT INTO flower (Product, Brand) VALUES (?, ?)', [
+        ('Codes: Flower | Dosilato | 3.5g', 'Codes'),
+        ('CODES - PREPACK - 3.5G - DOSILATO - HYBRID', 'Codes'),
+        ('Dosilato Popcorn', 'Codes'),
+    ])
+    # A canonical product keyed before name_key dropped the brand's own words
+    matching.create_matching_tables(conn.cursor())
+    conn.execute("INSERT INTO canonical_product (BrandKey, Form, NameKey, Brand, Product) "
+                 "VALUES ('proper', 'flower', 'cannabis gelato', 'Proper Cannabis', 'Proper Cannabis Gelato')")
+    conn.execute("INSERT INTO flower (Product, Brand) VALUES ('Gelato', 'Proper Cannabis')")
+    conn.commit()
+    conn.close()
+
+    assert matching.match_new_products(path) == 4
+    conn = sqlite3.connect(path)
+    canonical = dict(conn.execute('SELECT Product, CanonicalId FROM product_identity').fetchall())
+    conn.close()
+    assert canonical['Codes: Flower | Dosilato | 3.5g'] == canonical['CODES - PREPACK - 3.5G - DOSILATO - HYBRID']
+    assert canonical['Dosilato Popcorn'] != canonical['Codes: Flower | Dosilato | 3.5g']
+    assert canonical['Gelato'] == 1
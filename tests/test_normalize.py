@@ -0,0 +1,82 @@
+import pytest
+
+from writers import normalize, units
+
+
+@pytest.mark.parametrize('label, grams', [
+    ('1/8 oz', 3.5),
+    ('1/4oz', 7.0),
+    ('1/2 Ounce', 14.0),
+    ('1 oz', 28.0),
+    ('3.5g', 3.5),
+    ('3.5 grams', 3.5),
+    ('1g', 1.0),
+    ('0.5g', 0.5),
+    ('.5 G', 0.5),
+    ('14g', 14.0),
+    ('1/8', 3.5),
+    ('7', 7.0),
+    ('Eighth', 3.5),
+    ('Half Ounce', 14.0),
+])
+def test_parse_weight_returns_grams(label, grams):
+    assert normalize.parse_weight(label) == pytest.approx(grams)
+
+
+@pytest.mark.parametrize('label', ['', 'each', '1/0 oz'])
+def test_parse_weight_rejects_unreadable_labels(label):
+    with pytest.raises(ValueError):
+        normalize.parse_weight(label)
+
+
+def test_parse_potency_and_price():
+    assert normalize.parse_potency('THC: 30.69%') == 30.69
+    assert normalize.parse_potency('18.02%') == 18.02
+    assert normalize.parse_price('$1,027.50') == 1027.5
+    assert normalize.parse_price('$25.00$35.00') == 25.0
+
+
+def test_normalize_columns_reports_unreadable_labels():
+    values, errors = normalize.normalize_columns({'weight': ['1/8 oz', None, 'each', '1/8 oz'],
+                                                  'price': ['$30', '$40', '$50', 'free']})
+    assert values['weight'] == [3.5, None, None, 3.5]
+    assert values['price'] == [30.0, 40.0, 50.0, None]
+    assert sorted((column, label) for column, label, _ in errors) == [('price', 'free'), ('weight', 'each')]
+
+
+def test_page_variants_drops_variants_without_weight_or_price():
+    products = normalize.page_variants([
+        ('Dosilato', 'Codes', 'Hybrid', 'THC: 30%', '1/8 oz', '$35'),
+        ('Dosilato', 'Codes', 'Hybrid', 'THC: 30%', 'each', '$10'),
+        ('Kiwi Candy', 'Proper', 'Indica', None, '1g', '$12'),
+    ], 'CODES')
+    assert [(product.name, product.weight, product.price, product.potency) for product in products] == [
+        ('Dosilato', 3.5, 35.0, 30.0),
+        ('Kiwi Candy', 1.0, 12.0, None),
+    ]
+    assert normalize.page_variants([], 'CODES') == []
+
+
+def test_units():
+    assert units.grams(3.5) == 3.5
+    assert units.grams(None) is None
+    assert units.grams(0) is None
+    assert units.price_per_gram(35.0, 3.5) == 10.0
+    assert units.price_per_gram(None, 3.5) is None
+    assert units.price_per_gram(35.0, None) is None
+    assert units.weight_bucket(3.5) == '1/8 oz'
+    assert units.weight_bucket(28.0) == '1 oz'
+    assert units.weight_bucket(1.0) == '1g'
+    assert units.weight_bucket(56.0) == '56g'
+    assert units.weight_bucket(None) == 'unknown'
+
+
+@pytest.mark.parametrize('name, grams', [
+    ('ROBUST - PREPACK - 1G - PINNACLE', 1.0),
+    ('Codes: Flower | Dosilato | 3.5g', 3.5),
+    ('Kiwi Candy #5 1/8 oz', 3.5),
+    ('Kiwi Candy #5', None),
+    ('Bulk Gelato', None),
+])
+def test_weight_in_name(name, grams):
+    assert normalize.weight_in_name(name) == grams
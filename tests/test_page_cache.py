@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+
+from writers import page_cache
+from writers.records import ProductVariant
+
+
+def parse_products(html, location):
+    return [ProductVariant(html, 'Codes', 'Hybrid', 30.0, 3.5, 35.0, location)]
+
+
+def parse_other(html, location):
+    return parse_products(html, location)
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_cache, 'stats', {})
+    return str(tmp_path / 'page_cache.db')
+
+
+def test_page_hash_depends_on_html_and_parser():
+    key = page_cache.page_hash('<div>Dosilato</div>', parse_products)
+    assert key == page_cache.page_hash('<div>Dosilato</div>', parse_products)
+    assert key != page_cache.page_hash('<div>Gelato</div>', parse_products)
+    assert key != page_cache.page_hash('<div>Dosilato</div>', parse_other)
+
+
+def test_hit_returns_rows_for_the_store_asking(cache_path):
+    key = page_cache.page_hash('Dosilato', parse_products)
+    assert page_cache.lookup(key, 'CODES', cache_path) is None
+
+    page_cache.store(key, parse_products('Dosilato', 'CODES'), cache_path)
+    products = page_cache.lookup(key, 'Good Day Farm', cache_path)
+    assert [(product.name, product.location) for product in products] == [('Dosilato', 'Good Day Farm')]
+    assert page_cache.stats == {'CODES': {'hits': 0, 'misses': 1}, 'Good Day Farm': {'hits': 1, 'misses': 0}}
+
+
+def test_eviction_drops_least_recently_used_pages(cache_path):
+    keys = [page_cache.page_hash(name, parse_products) for name in ('Dosilato', 'Gelato', 'Sundae')]
+    for key, name in zip(keys, ('Dosilato', 'Gelato', 'Sundae')):
+        page_cache.store(key, parse_products(name, 'CODES'), cache_path)
+    conn = sqlite3.connect(cache_path)
+    conn.executemany('UPDATE page_cache SET LastUsed = ? WHERE Hash = ?', [(1, keys[0]), (2, keys[1]), (3, keys[2])])
+    conn.commit()
+
+    # A hit makes the oldest page the most recently used, so the next oldest goes first
+    assert page_cache.lookup(keys[0], 'CODES', cache_path) is not None
+    size = conn.execute('SELECT MAX(Size) FROM page_cache').fetchone()[0]
+    page_cache.evict(conn.cursor(), max_bytes=2 * size)
+    assert {row[0] for row in conn.execute('SELECT Hash FROM page_cache')} == {keys[0], keys[2]}
+    conn.close()
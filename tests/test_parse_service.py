@@ -0,0 +1,52 @@
+import pytest
+
+from writers import high_profile_writers, page_cache, parse_service
+
+CARD = '''<div class="shopitem">
+  <p class="shopitem__title">{name}</p>
+  <p class="shopitem__strain">Hybrid</p>
+  <p class="shopitem__strain-thc">THC 30%</p>
+  <p class="shopitem__brand">Codes</p>
+  <div class="shopitem__listPrices-productVariants-item">
+    <p class="shopitem__listPrices-productVariants-name">3.5g</p>
+    <p class="shopitem__listPrices-productVariants-price">$35.00</p>
+  </div>
+  <div class="shopitem__listPrices-productVariants-item">
+    <p class="shopitem__listPrices-productVariants-name">1oz</p>
+    <p class="shopitem__listPrices-productVariants-price">$180.00</p>
+  </div>
+</div>'''
+
+HTML = ''.join(CARD.format(name=name) for name in ('Dosilato', 'Gelato #33', 'Kiwi Candy'))
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """ The parse pool, with the page cache at ../page_cache.db of a scratch working directory. """
+    work = tmp_path / 'work'
+    work.mkdir()
+    monkeypatch.chdir(work)
+    monkeypatch.setattr(parse_service, 'stats', {})
+    monkeypatch.setattr(page_cache, 'stats', {})
+    yield parse_service
+    with parse_service._lock:
+        if parse_service._executor is not None:
+            parse_service._executor.shutdown()
+            parse_service._executor = None
+
+
+def test_pool_parses_like_the_scraper_process(service):
+    parse = high_profile_writers.parse_products
+    expected = [product.row() for product in parse(HTML, 'High Profile')]
+    assert len(expected) == 6
+
+    handle = service.submit(HTML, 'High Profile', parse)
+    assert handle[2] is not None
+    assert [product.row() for product in service.result(handle)] == expected
+    assert service.stats[service.TREE_BUILDER]['pages'] == 1
+
+    # The same page again comes from the page cache without reaching the pool
+    handle = service.submit(HTML, 'High Profile', parse)
+    assert handle[2] is None
+    assert [product.row() for product in service.result(handle)] == expected
+    assert service.stats['cache']['pages'] == 1
@@ -0,0 +1,44 @@
+from writers import quality
+
+
+def columns(rows):
+    """ Column lists for screen() from (Product, Brand, Potency, Weight, Price) rows of one group. """
+    products, brands, potency, weight, price = map(list, zip(*rows))
+    return {'id': list(range(len(rows))), 'Product': products, 'Brand': brands, 'Potency': potency,
+            'Weight': weight, 'Price': price, 'StrainType': ['Hybrid'] * len(rows), 'Location': ['CODES'] * len(rows)}
+
+
+def test_outliers_need_a_large_enough_group():
+    assert quality.outliers([1, 1, 1, 100], ['a'] * 4) == []
+
+
+def test_outliers_are_judged_within_their_group():
+    values = [10, 11, 10, 12, 11, 10, 11, 12, 100] + [100, 101, 99, 100, 102, 98, 100, 101]
+    groups = ['a'] * 9 + ['b'] * 8
+    assert quality.outliers(values, groups) == [8]
+
+
+def test_outliers_ignore_missing_values():
+    values = [10, None, 10, 11, 10, 12, 11, 10, 11, 500]
+    assert quality.outliers(values, ['a'] * 10) == [9]
+
+
+def test_screen_flags_price_outliers_and_placeholders():
+    rows = [(f'Strain {i}', 'Codes', 25.0, 3.5, 35.0 + i) for i in range(10)]
+    rows.append(('Preroll', 'Codes', 25.0, 3.5, 4.0))
+    rows.append(('No name found', 'Codes', 25.0, 3.5, 35.0))
+    rows.append(('Strain', 'No brand found', None, 3.5, 35.0))
+    rows.append(('Strain', 'Codes', 25.0, None, 35.0))
+    reasons, missing_potency = quality.screen(columns(rows))
+    assert reasons == {
+        10: 'price per gram outlier',
+        11: 'placeholder name',
+        12: 'placeholder brand',
+        13: 'missing price or weight',
+    }
+    assert missing_potency == 1
+
+
+def test_quantile_interpolates():
+    assert quality.quantile([1, 2, 3, 4], 0.5) == 2.5
+    assert quality.quantile([5], 0.25) == 5
@@ -0,0 +1,93 @@
+import pytest
+
+from writers import rate_limit
+
+
+class Clock:
+    """ Stands in for time.monotonic and time.sleep, so waits are computed rather than slept. """
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(rate_limit.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_burst_is_served_without_waiting(clock):
+    bucket = rate_limit.TokenBucket(rate=2, burst=3)
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    # The fourth request waits for one token at 2 per second
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+
+
+def test_tokens_refill_up_to_burst(clock):
+    bucket = rate_limit.TokenBucket(rate=1, burst=2)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 60
+    assert [bucket.acquire() for _ in range(2)] == [0, 0]
+    assert bucket.acquire() == pytest.approx(1)
+
+
+def test_throttling_halves_the_rate_and_pauses(clock):
+    bucket = rate_limit.TokenBucket(rate=4, burst=10)
+    bucket.record(429, retry_after=5)
+    assert bucket.rate == 2
+    assert bucket.acquire() == pytest.approx(5)
+    bucket.record(503)
+    bucket.record(500)
+    assert bucket.rate == 0.5
+    assert bucket.stats['throttled'] == 3
+
+
+def test_rate_never_drops_below_the_minimum(clock):
+    bucket = rate_limit.TokenBucket(rate=1, burst=1)
+    for _ in range(50):
+        bucket.record(503)
+    assert bucket.rate == rate_limit.MIN_RATE
+
+
+def test_slow_responses_ease_the_rate_off(clock):
+    bucket = rate_limit.TokenBucket(rate=1, burst=1)
+    bucket.record(200, seconds=rate_limit.SLOW_SECONDS + 1)
+    assert bucket.rate == rate_limit.SLOW_FACTOR
+    assert bucket.stats['slow'] == 1
+
+
+def test_recovery_is_a_bounded_step(clock):
+    bucket = rate_limit.TokenBucket(rate=1, burst=1)
+    for _ in range(4):
+        bucket.record(429)
+    # One good response wins back a fixed share of the configured rate, however low the rate fell
+    bucket.record(200)
+    assert bucket.rate == pytest.approx(1 / 16 + rate_limit.RECOVERY)
+    for _ in range(1000):
+        bucket.record(200)
+    assert bucket.rate == 1
+
+
+def test_configure_sets_domain_overrides(clock):
+    rate_limit.configure({'codesdispensary.com': {'rate': 0.2}}, rate=1, burst=4)
+    try:
+        assert rate_limit.domain_settings('codesdispensary.com') == (0.2, 4)
+        assert rate_limit.domain_settings('gooddayfarmdispensary.com') == (1, 4)
+    finally:
+        rate_limit.configure({})
+
+
+def test_domain_of_drops_www():
+    assert rate_limit.domain_of('https://www.codesdispensary.com/location/x') == 'codesdispensary.com'
+    assert rate_limit.domain_of('https://gooddayfarmdispensary.com/menu') == 'gooddayfarmdispensary.com'
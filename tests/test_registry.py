@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from writers import registry
+
+SITE = {'location': 'CODES', 'adapter': 'dutchie',
+        'url': 'https://codesdispensary.com/location/cape-girardeau-mo/?dtche%5Bcategory%5D=flower'}
+
+
+def test_parse_registry_defaults():
+    sites = registry.parse_registry({'sites': [SITE, {**SITE, 'location': 'Off', 'enabled': False}]})
+    assert sites.max_browsers == 1
+    assert sites.domain_concurrency == 1
+    assert [site.location for site in sites.enabled()] == ['CODES']
+    assert sites.sites[0].category == 'flower'
+    assert sites.sites[0].domain == 'codesdispensary.com'
+
+
+def test_parse_registry_domain_limits():
+    sites = registry.parse_registry({'max_browsers': 4, 'domain_concurrency': 2,
+                                     'domains': {'codesdispensary.com': {'concurrency': 1, 'rate': 0.2}},
+                                     'sites': [SITE]})
+    assert sites.concurrency('codesdispensary.com') == 1
+    assert sites.concurrency('gooddayfarmdispensary.com') == 2
+    assert sites.queue_limits() == {'max_leased': 4, 'domain_concurrency': 2,
+                                    'domain_limits': {'codesdispensary.com': 1}}
+
+
+def test_parse_registry_lists_every_problem():
+    data = {'max_browsers': 0, 'colour': 'green', 'sites': [
+        {**SITE, 'adapter': 'weedmaps', 'url': 'ftp://example.com'},
+        {**SITE, 'timing': {'load_wait': -1, 'scroll_speed': 2}},
+        {'adapter': 'dutchie'},
+    ]}
+    with pytest.raises(registry.RegistryError) as raised:
+        registry.parse_registry(data)
+    message = str(raised.value)
+    for problem in ("unknown key 'colour'", 'max_browsers must be a positive whole number',
+                    'adapter must be one of', 'url must be an http(s) URL', 'timing load_wait must be a positive',
+                    "unknown timing 'scroll_speed'", "location 'CODES' is listed twice",
+                    'sites[2] (no location): location is required'):
+        assert problem in message
+
+
+@pytest.mark.parametrize('data', [[], {'sites': {}}, {}])
+def test_parse_registry_rejects_other_shapes(data):
+    with pytest.raises(registry.RegistryError):
+        registry.parse_registry(data)
+
+
+def test_parse_registry_rejects_bad_domain_limits():
+    with pytest.raises(registry.RegistryError, match=r"domains\['a.com'\]: concurrency"):
+        registry.parse_registry({'domains': {'a.com': {'concurrency': 1.5}}, 'sites': [SITE]})
+    with pytest.raises(registry.RegistryError, match='domains must map'):
+        registry.parse_registry({'domains': {'a.com': 2}, 'sites': [SITE]})
+
+
+def test_shipped_registry_is_valid():
+    path = os.path.join(os.path.dirname(__file__), '..', 'sites.json')
+    assert registry.load_registry(path).sites
@@ -0,0 +1,67 @@
+import sqlite3
+import uuid
+
+import pytest
+
+from api import db, result_cache
+from writers import encoding, ingest
+
+
+@pytest.fixture
+def scope():
+    """ A scope no other test shares, since the memory cache is module state. """
+    return str(uuid.uuid4())
+
+
+def test_hit_until_the_version_changes(scope):
+    key = result_cache.cache_key(scope, 'SELECT 1', ())
+    assert result_cache.lookup(key, 'v1', scope=scope) is None
+    result_cache.store(key, 'v1', b'[1]', scope=scope)
+    assert result_cache.lookup(key, 'v1', scope=scope) == b'[1]'
+    # A new publish drops every body computed before it
+    assert result_cache.lookup(key, 'v2', scope=scope) is None
+    assert result_cache.lookup(key, 'v1', scope=scope) is None
+
+
+def test_scopes_do_not_invalidate_each_other(scope):
+    other = str(uuid.uuid4())
+    result_cache.store('key', 'v1', b'a', scope=scope)
+    result_cache.store('key', 'v9', b'b', scope=other)
+    assert result_cache.lookup('key', 'v1', scope=scope) == b'a'
+    assert result_cache.lookup('key', 'v9', scope=other) == b'b'
+
+
+def test_disk_cache_survives_the_memory_cache(tmp_path, scope):
+    disk = str(tmp_path / 'cache.db')
+    result_cache.store('key', 'v1', b'body', disk_path=disk, scope=scope)
+    # A different process starts with an empty memory cache
+    result_cache.lookup('other', 'v0', scope=scope)
+    assert result_cache.lookup('key', 'v1', disk_path=disk, scope=scope) == b'body'
+    assert result_cache.lookup('key', 'v2', disk_path=disk, scope=scope) is None
+
+
+def test_published_version_changes_on_every_publish(tmp_path):
+    path = str(tmp_path / 'dispensary.db')
+    writer = sqlite3.connect(path)
+    cursor = writer.cursor()
+    encoding.create_encoded_tables(cursor)
+    ingest.create_run_tables(cursor)
+    writer.commit()
+
+    reader = db.connect(path)
+    try:
+        versions = [db.published_version(reader)[0]]
+        writer.execute("INSERT INTO flower (Product, Location) VALUES ('Dosilato', 'CODES')")
+        writer.execute("INSERT INTO flower (Product, Location) VALUES ('Gelato', 'CODES')")
+        writer.commit()
+        versions.append(db.published_version(reader)[0])
+        # A publish that only removed rows, leaving the highest row id as it was
+        writer.execute("DELETE FROM flower WHERE Product = 'Dosilato'")
+        writer.commit()
+        versions.append(db.published_version(reader)[0])
+        assert len(set(versions)) == 3
+        # Nothing written since, so the version is unchanged
+        assert db.published_version(reader)[0] == versions[-1]
+    finally:
+        reader.close()
+        writer.close()
@@ -0,0 +1,59 @@
+import math
+
+from writers import scheduler
+
+
+def test_change_rate_needs_two_checks():
+    assert scheduler.change_rate([]) is None
+    assert scheduler.change_rate([(0, True)]) is None
+
+
+def test_change_rate_ignores_checks_at_the_same_time():
+    assert scheduler.change_rate([(100, False), (100, True)]) is None
+
+
+def test_menu_that_never_changed_is_checked_least_often():
+    checks = [(hour * 3600, False) for hour in range(11)]
+    assert scheduler.change_rate(checks) == 0
+    assert scheduler.interval_for(scheduler.change_rate(checks)) == scheduler.MAX_INTERVAL
+
+
+def test_change_rate_uses_the_poisson_estimator():
+    # 10 hourly gaps, the menu changed in 5 of them
+    checks = [(0, False)] + [(hour * 3600, hour % 2 == 0) for hour in range(1, 11)]
+    expected = -math.log((10 - 5 + 0.5) / (10 + 0.5)) / 3600
+    assert math.isclose(scheduler.change_rate(checks), expected)
+    # Changing in every gap does not make the estimate infinite
+    always = [(hour * 3600, True) for hour in range(11)]
+    assert math.isfinite(scheduler.change_rate(always))
+    assert scheduler.change_rate(always) > scheduler.change_rate(checks)
+
+
+def test_interval_for_targets_the_change_probability():
+    rate = 1 / (24 * 3600)
+    interval = scheduler.interval_for(rate)
+    assert math.isclose(1 - math.exp(-rate * interval), scheduler.TARGET_CHANGE_PROBABILITY)
+
+
+def test_interval_for_without_history_or_changes():
+    assert scheduler.interval_for(None) == scheduler.DEFAULT_INTERVAL
+    assert scheduler.interval_for(0) == scheduler.MAX_INTERVAL
+
+
+def test_interval_for_is_bounded():
+    assert scheduler.interval_for(1.0) == scheduler.MIN_INTERVAL
+    assert scheduler.interval_for(1e-9) == scheduler.MAX_INTERVAL
+
+
+def test_priority_puts_never_scraped_sites_first():
+    assert scheduler.priority(None, None, 1000) == 1.0
+    assert scheduler.priority(1 / 3600, 0, 3600) < 1.0
+    # A site checked longer ago is more likely to have changed
+    assert scheduler.priority(1 / 3600, 0, 7200) > scheduler.priority(1 / 3600, 3600, 7200)
+
+
+def test_retry_interval_doubles_up_to_the_maximum():
+    assert scheduler.retry_interval(0) == scheduler.RETRY_INTERVAL
+    assert scheduler.retry_interval(1) == 2 * scheduler.RETRY_INTERVAL
+    assert scheduler.retry_interval(3) == 8 * scheduler.RETRY_INTERVAL
+    assert scheduler.retry_interval(50) == scheduler.MAX_INTERVAL
@@ -0,0 +1,44 @@
+import argparse
+
+from writers import alerts, ingest
+
+
+# Function to print every watch as one line
+def print_watches(db_path=ingest.DB_PATH):
+    for watch_id, location, brand, strain_type, weight, canonical_id, metric, threshold, sink, target \
+            in alerts.list_watches(db_path):
+        fields = [f"{name}={value}" for name, value in (
+            ('location', location), ('brand', brand), ('strain', strain_type), ('weight', weight),
+            ('product', canonical_id)) if value is not None]
+        print(f"{watch_id}: {metric} <= {threshold:g} {' '.join(fields) or 'any variant'} -> {sink} {target}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the price watches notified after every scrape run')
+    parser.add_argument('--db', default=ingest.DB_PATH, help='database holding the watches')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='notify a sink when a matching variant drops to a threshold')
+    add.add_argument('threshold', type=float)
+    add.add_argument('sink', choices=alerts.SINKS)
+    add.add_argument('target', help='file path for the file sink, URL for the webhook sink')
+    add.add_argument('--metric', choices=alerts.METRICS, default='price_per_gram')
+    add.add_argument('--location')
+    add.add_argument('--brand')
+    add.add_argument('--strain', help='strain type, e.g. Indica')
+    add.add_argument('--weight', type=float, help='weight in grams, e.g. 3.5 for an eighth')
+    add.add_argument('--product', type=int, help='canonical product id')
+
+    remove = commands.add_parser('remove', help='stop notifying a watch')
+    remove.add_argument('watch_id', type=int)
+
+    commands.add_parser('list', help='list every watch')
+    args = parser.parse_args()
+
+    if args.command == 'add':
+        watch_id = alerts.add_watch(args.metric, args.threshold, args.sink, args.target, args.location, args.brand,
+                                    args.strain, args.weight, args.product, args.db)
+        print(f"Added watch {watch_id}.")
+    elif args.command == 'remove':
+        print(f"Removed {alerts.remove_watch(args.watch_id, args.db)} watch.")
+    else:
+        print_watches(args.db)
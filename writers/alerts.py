@@ -0,0 +1,240 @@
+import json
+import sqlite3
+import time
+import urllib.request
+from bisect import bisect_left
+from itertools import product
+
+from writers import changes, ingest, matching, rate_limit, units
+from writers.compare import strain_group
+
+# What a watch's threshold is compared with
+METRICS = ('price', 'price_per_gram')
+
+# Seconds a webhook sink waits for the receiving end
+WEBHOOK_TIMEOUT = 10
+# Deliveries a notification gets, on this and later evaluations, before it is given up on
+MAX_DELIVERY_ATTEMPTS = 5
+
+# Create the watches evaluated against every publish's price changes
+def create_alert_tables(cursor):
+    changes.create_changes_table(cursor)
+    matching.create_matching_tables(cursor)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS watches (
+            WatchId INTEGER PRIMARY KEY AUTOINCREMENT,
+            Location TEXT,
+            Brand TEXT,
+            StrainType TEXT,
+            Weight REAL,
+            CanonicalId INTEGER,
+            Metric TEXT,
+            Threshold REAL,
+            Sink TEXT,
+            Target TEXT,
+            CreatedAt REAL
+        )
+    ''')
+    # Notifications whose sink failed, delivered again by the next evaluations
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alert_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Sink TEXT,
+            Target TEXT,
+            Notification TEXT,
+            Attempts INTEGER,
+            LastError TEXT,
+            CreatedAt REAL
+        )
+    ''')
+
+def add_watch(metric, threshold, sink, target, location=None, brand=None, strain_type=None, weight=None,
+              canonical_id=None, db_path=ingest.DB_PATH):
+    """ Watch for variants matching every given field whose price or price per gram drops to threshold or below. """
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {', '.join(METRICS)}, got {metric!r}")
+    if sink not in SINKS:
+        raise ValueError(f"sink must be one of {', '.join(SINKS)}, got {sink!r}")
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        create_alert_tables(cursor)
+        cursor.execute('''
+            INSERT INTO watches
+                (Location, Brand, StrainType, Weight, CanonicalId, Metric, Threshold, Sink, Target, CreatedAt)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (location, brand, strain_type, weight, canonical_id, metric, threshold, sink, target, time.time()))
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+def remove_watch(watch_id, db_path=ingest.DB_PATH):
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        create_alert_tables(cursor)
+        cursor.execute('DELETE FROM watches WHERE WatchId = ?', (watch_id,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+def list_watches(db_path=ingest.DB_PATH):
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        create_alert_tables(cursor)
+        return cursor.execute('''
+            SELECT WatchId, Location, Brand, StrainType, Weight, CanonicalId, Metric, Threshold, Sink, Target
+            FROM watches ORDER BY WatchId
+        ''').fetchall()
+    finally:
+        conn.close()
+
+def watch_dimensions(location, brand, strain_type, weight, canonical_id):
+    """ Spelling-independent values a watch or a change is matched on; None is a wildcard for watches. """
+    return (
+        location,
+        matching.brand_key(brand) if brand is not None else None,
+        strain_group(strain_type) if strain_type is not None else None,
+        units.weight_bucket(weight) if weight is not None else None,
+        canonical_id,
+    )
+
+class WatchIndex:
+    """ Watches grouped by metric and the exact fields they name, each group sorted by threshold.
+
+    A change is matched by looking up the 32 combinations of its fields and wildcards, then
+    bisecting each group for the watches whose threshold it is at or below, so the cost per
+    change depends on the watches that fire rather than on how many watches there are.
+    """
+    def __init__(self, watches):
+        groups = {}
+        for watch_id, location, brand, strain_type, weight, canonical_id, metric, threshold, sink, target in watches:
+            key = (metric, *watch_dimensions(location, brand, strain_type, weight, canonical_id))
+            groups.setdefault(key, []).append((threshold, watch_id, sink, target))
+        self.groups = {}
+        for key, members in groups.items():
+            members.sort()
+            self.groups[key] = ([member[0] for member in members], members)
+
+    def matches(self, metric, value, dimensions):
+        """ Yield (watch id, sink, target) of every watch on metric that value satisfies. """
+        if value is None:
+            return
+        for key in product(*((field, None) if field is not None else (None,) for field in dimensions)):
+            group = self.groups.get((metric, *key))
+            if group is None:
+                continue
+            thresholds, members = group
+            for _, watch_id, sink, target in members[bisect_left(thresholds, value):]:
+                yield watch_id, sink, target
+
+def load_index(cursor):
+    return WatchIndex(cursor.execute('''
+        SELECT WatchId, Location, Brand, StrainType, Weight, CanonicalId, Metric, Threshold, Sink, Target FROM watches
+    '''))
+
+def evaluate_changes(db_path=ingest.DB_PATH):
+    """ Match the price changes published since the last evaluation against every watch and notify their sinks.
+
+    Only new variants and price drops can fire a watch; each change is evaluated once. Notifications
+    a sink fails to take are kept in alert_outbox and delivered again with the next evaluations,
+    up to MAX_DELIVERY_ATTEMPTS times.
+    """
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        create_alert_tables(cursor)
+        index = load_index(cursor)
+
+        pending = cursor.execute('''
+            SELECT c.id, c.RunId, c.Location, c.Product, c.Brand, c.StrainType, c.Weight, c.OldPrice, c.NewPrice,
+                   p.CanonicalId
+            FROM price_changes c
+            LEFT JOIN product_identity p ON p.Product = c.Product AND p.Brand = COALESCE(c.Brand, '')
+            WHERE c.Evaluated = 0 ORDER BY c.id
+        ''').fetchall()
+
+        # (sink, target) -> [(outbox id or None for a new notification, attempts so far, notification)]
+        outbox = {}
+        for outbox_id, sink, target, notification, attempts in cursor.execute('''
+            SELECT id, Sink, Target, Notification, Attempts FROM alert_outbox ORDER BY id
+        ''').fetchall():
+            outbox.setdefault((sink, target), []).append((outbox_id, attempts, json.loads(notification)))
+        retried = sum(map(len, outbox.values()))
+
+        for change_id, run_id, location, name, brand, strain_type, weight, old_price, new_price, canonical_id \
+                in pending:
+            if old_price is not None and new_price >= old_price:
+                continue
+            dimensions = watch_dimensions(location, brand, strain_type, weight, canonical_id)
+            unit_price = units.price_per_gram(new_price, weight)
+            for metric, value in (('price', new_price), ('price_per_gram', unit_price)):
+                for watch_id, sink, target in index.matches(metric, value, dimensions):
+                    outbox.setdefault((sink, target), []).append((None, 0, {
+                        'watch_id': watch_id, 'run_id': run_id, 'location': location, 'product': name,
+                        'brand': brand, 'strain_type': strain_type, 'weight': weight, 'old_price': old_price,
+                        'price': new_price, 'price_per_gram': unit_price,
+                    }))
+
+        # Each sink target gets its notifications in one delivery, made before anything is written
+        # so no lock is held while a sink is slow
+        delivered, failed = [], []
+        for (sink, target), entries in outbox.items():
+            try:
+                SINKS[sink](target, [notification for _, _, notification in entries])
+                delivered.extend(entries)
+            except Exception as e:
+                failed.extend((sink, target, entry, f"{type(e).__name__}: {e}") for entry in entries)
+                print(f"Error notifying {sink} {target}: {e}")
+
+        cursor.executemany('DELETE FROM alert_outbox WHERE id = ?',
+                           [(outbox_id,) for outbox_id, _, _ in delivered if outbox_id is not None])
+        dropped = 0
+        now = time.time()
+        for sink, target, (outbox_id, attempts, notification), error in failed:
+            if attempts + 1 >= MAX_DELIVERY_ATTEMPTS:
+                dropped += 1
+                cursor.execute('DELETE FROM alert_outbox WHERE id = ?', (outbox_id,))
+            elif outbox_id is None:
+                cursor.execute('''
+                    INSERT INTO alert_outbox (Sink, Target, Notification, Attempts, LastError, CreatedAt)
+                    VALUES (?, ?, ?, 1, ?, ?)
+                ''', (sink, target, json.dumps(notification), error, now))
+            else:
+                cursor.execute('UPDATE alert_outbox SET Attempts = Attempts + 1, LastError = ? WHERE id = ?',
+                               (error, outbox_id))
+        cursor.executemany('UPDATE price_changes SET Evaluated = 1 WHERE id = ?', [(row[0],) for row in pending])
+        conn.commit()
+
+        print(f"Evaluated {len(pending)} price changes and {retried} earlier failed notifications: "
+              f"{len(delivered)} notifications sent to {len(outbox)} sinks, {len(failed) - dropped} kept "
+              f"for retry, {dropped} given up on after {MAX_DELIVERY_ATTEMPTS} attempts.")
+        return len(delivered)
+    finally:
+        conn.close()
+
+def file_sink(path, notifications):
+    """ Append notifications to a file as newline-delimited JSON. """
+    with open(path, 'a', encoding='utf-8') as f:
+        f.writelines(json.dumps(notification) + '\n' for notification in notifications)
+
+def webhook_sink(url, notifications):
+    """ POST notifications to url as one JSON array. """
+    request = urllib.request.Request(url, data=json.dumps(notifications).encode('utf-8'), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    with rate_limit.urlopen(request, timeout=WEBHOOK_TIMEOUT):
+        pass
+
+def print_sink(label, notifications):
+    for notification in notifications:
+        print(f"[{label}] {notification['product']} at {notification['location']}: ${notification['price']:.2f}")
+
+# Sink name -> function(target, notifications); add an entry to deliver alerts somewhere new
+SINKS = {
+    'file': file_sink,
+    'webhook': webhook_sink,
+    'print': print_sink,
+}
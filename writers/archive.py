@@ -0,0 +1,106 @@
+import hashlib
+import importlib
+import lzma
+import sqlite3
+import time
+import zlib
+
+ARCHIVE_PATH = '../menu_archive.db'
+
+# Codec used for new snapshots, either 'lzma' (smaller) or 'zlib' (faster)
+ARCHIVE_CODEC = 'lzma'
+
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 9), zlib.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+# Create the snapshot store (one row per distinct page) and the index of captured pages
+def create_archive_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS snapshot (
+            Hash TEXT PRIMARY KEY,
+            Codec TEXT,
+            RawSize INTEGER,
+            Data BLOB
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS snapshot_index (
+            RunId INTEGER,
+            Location TEXT,
+            PageNumber INTEGER,
+            Parser TEXT,
+            Hash TEXT,
+            CapturedAt REAL,
+            PRIMARY KEY (RunId, Location, PageNumber)
+        )
+    ''')
+
+def parser_name(parse):
+    """ Importable name of a parse function, e.g. 'writers.dutchie_writer:parse_products'. """
+    return f"{parse.__module__}:{parse.__name__}"
+
+def load_parser(name):
+    """ Import the parse function recorded by parser_name. """
+    module, function = name.split(':')
+    return getattr(importlib.import_module(module), function)
+
+def store_page(html, run_id, location, page_number, parse, archive_path=ARCHIVE_PATH, codec=ARCHIVE_CODEC):
+    """ Archive the raw HTML of a whole page; identical pages are only compressed and stored once.
+
+    parse picks the product cards out of the page itself, so a re-parse applies whatever card
+    selector the parser uses by then.
+    """
+    data = html.encode('utf-8')
+    key = hashlib.sha256(data).hexdigest()
+
+    try:
+        conn = sqlite3.connect(archive_path)
+        cursor = conn.cursor()
+        create_archive_tables(cursor)
+
+        if cursor.execute('SELECT 1 FROM snapshot WHERE Hash = ?', (key,)).fetchone() is None:
+            compress = CODECS[codec][0]
+            cursor.execute('INSERT INTO snapshot (Hash, Codec, RawSize, Data) VALUES (?, ?, ?, ?)',
+                           (key, codec, len(data), compress(data)))
+
+        cursor.execute('''
+            INSERT OR REPLACE INTO snapshot_index (RunId, Location, PageNumber, Parser, Hash, CapturedAt)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (run_id, location, page_number, parser_name(parse), key, time.time()))
+        conn.commit()
+    except Exception as e:
+        print(f"Error archiving page {page_number} of {location}: {e}")
+    finally:
+        conn.close()
+
+def load_page(key, archive_path=ARCHIVE_PATH):
+    """ Return the decompressed HTML of an archived page. """
+    try:
+        conn = sqlite3.connect(archive_path)
+        codec, data = conn.execute('SELECT Codec, Data FROM snapshot WHERE Hash = ?', (key,)).fetchone()
+        return CODECS[codec][1](data).decode('utf-8')
+    finally:
+        conn.close()
+
+def run_pages(run_id, location=None, archive_path=ARCHIVE_PATH):
+    """ Return (location, page_number, parser, hash) for every page archived by a run, in page order. """
+    try:
+        conn = sqlite3.connect(archive_path)
+        cursor = conn.cursor()
+        create_archive_tables(cursor)
+
+        sql = 'SELECT Location, PageNumber, Parser, Hash FROM snapshot_index WHERE RunId IS ?'
+        params = [run_id]
+        if location:
+            sql += ' AND Location = ?'
+            params.append(location)
+        return cursor.execute(sql + ' ORDER BY Location, PageNumber', params).fetchall()
+    finally:
+        conn.close()
+
+def reparse_page(location, page_number, parser, key, archive_path=ARCHIVE_PATH):
+    """ Parse one archived page from scratch; runs in a worker process. """
+    parse = load_parser(parser)
+    return location, page_number, parse(load_page(key, archive_path), location)
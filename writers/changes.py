@@ -0,0 +1,62 @@
+import time
+
+# Create the table of variants that are new or changed price in a publish, kept until the alert
+# engine has evaluated them
+def create_changes_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS price_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            RunId INTEGER,
+            Location TEXT,
+            Product TEXT,
+            Brand TEXT,
+            StrainType TEXT,
+            Weight REAL,
+            OldPrice REAL,
+            NewPrice REAL,
+            ChangedAt REAL,
+            Evaluated INTEGER DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_changes_pending ON price_changes (Evaluated)')
+    # One row per scrape of a location saying whether its menu had changed, the history the
+    # scheduler estimates each menu's change rate from
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS menu_checks (
+            Location TEXT,
+            CheckedAt REAL,
+            Changed INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_menu_checks_location ON menu_checks (Location, CheckedAt)')
+
+def record_changes(cursor, location, staged, run_id):
+    """ Record the staged variants of a location that are new or whose price changed since its last publish.
+
+    staged rows are in flower column order. Called before the location's old rows are replaced;
+    returns the recorded rows. The scrape counts as a menu change when anything was recorded or
+    a variant was taken off the menu.
+    """
+    create_changes_table(cursor)
+    previous = {(product, brand, weight): price for product, brand, weight, price in cursor.execute('''
+        SELECT Product, Brand, Weight, Price FROM flower WHERE Location = ?
+    ''', (location,))}
+
+    now = time.time()
+    rows = []
+    for product, brand, _, weight, price, strain_type, _ in staged:
+        old_price = previous.pop((product, brand, weight), None)
+        if old_price != price:
+            rows.append((run_id, location, product, brand, strain_type, weight, old_price, price, now))
+    record_check(cursor, location, bool(rows or previous))
+    cursor.executemany('''
+        INSERT INTO price_changes
+            (RunId, Location, Product, Brand, StrainType, Weight, OldPrice, NewPrice, ChangedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    return rows
+
+def record_check(cursor, location, changed):
+    create_changes_table(cursor)
+    cursor.execute('INSERT INTO menu_checks (Location, CheckedAt, Changed) VALUES (?, ?, ?)',
+                   (location, time.time(), int(changed)))
@@ -0,0 +1,106 @@
+import re
+
+from writers.units import weight_bucket
+
+STRAIN_WORDS = re.compile(r'[^A-Za-z]+')
+
+def strain_group(strain_type):
+    """ Spelling-independent strain type, so stores' 'INDICA HYBRID' and 'Indica-Hybrid' compare together. """
+    if not strain_type:
+        return 'Unknown'
+    return '-'.join(word.capitalize() for word in STRAIN_WORDS.split(strain_type) if word) or 'Unknown'
+
+# Create the cross-store comparison index: every published variant with a price per gram,
+# ranked cheapest first within its (weight bucket, strain type) group
+def create_compare_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS compare_index (
+            WeightBucket TEXT,
+            StrainType TEXT,
+            Rank INTEGER,
+            PricePerGram REAL,
+            Potency REAL,
+            Location TEXT,
+            Product TEXT,
+            Price REAL,
+            FlowerId INTEGER,
+            PRIMARY KEY (WeightBucket, StrainType, Rank)
+        ) WITHOUT ROWID
+    ''')
+    # Used when a query spans every strain type of a bucket
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_compare_bucket_price ON compare_index (WeightBucket, PricePerGram)')
+
+def rebuild_index(cursor):
+    """ Rebuild compare_index from the published rows; ranks span every store, so it is rebuilt whole. """
+    create_compare_table(cursor)
+    cursor.connection.create_function('weight_bucket', 1, weight_bucket, deterministic=True)
+    cursor.connection.create_function('strain_group', 1, strain_group, deterministic=True)
+    cursor.execute('DELETE FROM compare_index')
+    cursor.execute('''
+        INSERT INTO compare_index
+            (WeightBucket, StrainType, Rank, PricePerGram, Potency, Location, Product, Price, FlowerId)
+        SELECT weight_bucket(Weight), strain_group(StrainType),
+               ROW_NUMBER() OVER (PARTITION BY weight_bucket(Weight), strain_group(StrainType)
+                                  ORDER BY PricePerGram, Potency DESC, id),
+               PricePerGram, Potency, Location, Product, Price, id
+        FROM flower WHERE PricePerGram IS NOT NULL
+    ''')
+    return cursor.rowcount
+
+def band_clauses(strain_type, min_potency, max_potency):
+    """ WHERE clauses and parameters selecting a bucket, optionally one strain type and a potency band. """
+    clauses = ['WeightBucket = ?']
+    params = []
+    if strain_type is not None:
+        clauses.append('StrainType = ?')
+        params.append(strain_group(strain_type))
+    if min_potency is not None:
+        clauses.append('Potency >= ?')
+        params.append(min_potency)
+    if max_potency is not None:
+        clauses.append('Potency <= ?')
+        params.append(max_potency)
+    return clauses, params
+
+def top_query(bucket, strain_type=None, min_potency=None, max_potency=None, k=10):
+    """ Return (sql, params) for the k cheapest variants per gram in a bucket.
+
+    With a strain type this reads the first rows of one (bucket, strain type) range of the
+    primary key; without one it walks the bucket's price index. Either way no sort is needed.
+    """
+    clauses, params = band_clauses(strain_type, min_potency, max_potency)
+    order = 'Rank' if strain_type is not None else 'PricePerGram'
+    return (f'''
+        SELECT Location, Product, StrainType, Potency, Price, PricePerGram, FlowerId
+        FROM compare_index WHERE {' AND '.join(clauses)} ORDER BY {order} LIMIT ?
+    ''', [bucket, *params, k])
+
+def percentile_query(bucket, percentile, strain_type=None, min_potency=None, max_potency=None):
+    """ Return (sql, params) for the variant at a price-per-gram percentile (0-100, nearest rank) of a bucket.
+
+    For a whole (bucket, strain type) group the rank is known up front, so the row is found
+    with two primary key seeks. A potency band or every strain type of a bucket has to be
+    counted first, which walks the matching rows once.
+    """
+    if strain_type is not None and min_potency is None and max_potency is None:
+        group = [bucket, strain_group(strain_type)]
+        return ('''
+            WITH band AS (
+                SELECT MAX(Rank) AS Total FROM compare_index WHERE WeightBucket = ? AND StrainType = ?
+            )
+            SELECT Location, Product, StrainType, Potency, Price, PricePerGram, FlowerId, Total
+            FROM compare_index, band
+            WHERE WeightBucket = ? AND StrainType = ? AND Rank >= ? / 100.0 * Total
+            ORDER BY Rank LIMIT 1
+        ''', [*group, *group, percentile])
+
+    clauses, params = band_clauses(strain_type, min_potency, max_potency)
+    order = 'Rank' if strain_type is not None else 'PricePerGram'
+    return (f'''
+        WITH band AS (
+            SELECT *, ROW_NUMBER() OVER (ORDER BY {order}) AS Position, COUNT(*) OVER () AS Total
+            FROM compare_index WHERE {' AND '.join(clauses)}
+        )
+        SELECT Location, Product, StrainType, Potency, Price, PricePerGram, FlowerId, Total
+        FROM band WHERE Position >= ? / 100.0 * Total ORDER BY Position LIMIT 1
+    ''', [bucket, *params, percentile])
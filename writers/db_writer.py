@@ -0,0 +1,212 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from writers import encoding, fingerprint, ingest, parse_service
+
+# Writes that may wait for the writer thread before submit() blocks the scraper handing them over
+MAX_PENDING = 64
+# Most rows one transaction takes from the queue
+MAX_BATCH_ROWS = 5000
+# Seconds the write connection waits for another process's lock, e.g. a publish or a second worker
+BUSY_TIMEOUT = 30
+
+# Transactions, writes and rows committed by the writer thread, with their commit and queue times
+stats = {'transactions': 0, 'writes': 0, 'rows': 0, 'failed': 0, 'commit_seconds': [], 'wait_seconds': []}
+
+# Database path -> (queue, thread) of the writer owning that database's write connection
+_writers = {}
+_lock = threading.Lock()
+
+def writer_thread(db_path):
+    """ Start the thread owning db_path's write connection on first use and return its queue. """
+    with _lock:
+        if db_path not in _writers:
+            pending = queue.Queue(maxsize=MAX_PENDING)
+            thread = threading.Thread(target=run, args=(pending, db_path), name='db-writer', daemon=True)
+            thread.start()
+            _writers[db_path] = (pending, thread)
+        return _writers[db_path][0]
+
+def submit(write, rows=0, db_path=ingest.DB_PATH):
+    """ Queue write(cursor) for the writer thread and return a Future of its result.
+
+    Blocks while MAX_PENDING writes are already waiting, so scrapers slow down to the pace the
+    database can commit at instead of queueing without bound. The future resolves once the
+    transaction holding the write has committed.
+    """
+    future = Future()
+    writer_thread(db_path).put((write, rows, future, time.perf_counter()))
+    return future
+
+def write_page(products, location, page_number, seen_keys, db_path=ingest.DB_PATH):
+    """ Stage a page through the writer thread and return the number of rows written once committed. """
+    products = list(products)
+    return submit(lambda cursor: ingest.write_page(cursor, products, location, page_number, seen_keys),
+                  len(products), db_path).result()
+
+def begin_location(location, resume=False, db_path=ingest.DB_PATH):
+    """ Reset or resume a location through the writer thread and return (start_page, seen_keys). """
+    return submit(lambda cursor: ingest.reset_location(cursor, location, resume), db_path=db_path).result()
+
+def publish_location(location, menu_fingerprint=None, scrape_seconds=0, db_path=ingest.DB_PATH):
+    """ Publish a location's staged pages through the writer thread and return the rows published.
+
+    The menu's fingerprint is saved in the same transaction, so it is only ever kept for a menu
+    stored in full. Raises when the publish fails, leaving the previous rows and the staged pages
+    in place for a resume or retry.
+    """
+    def publish(cursor):
+        count = ingest.publish_staged(cursor, location)
+        fingerprint.store_fingerprint(cursor, location, menu_fingerprint, scrape_seconds)
+        return count
+
+    try:
+        return submit(publish, db_path=db_path).result()
+    except Exception as e:
+        print(f"Error publishing {location}: {e}")
+        raise
+
+def carry_forward(location, seconds_saved, db_path=ingest.DB_PATH):
+    """ Keep a location's previous rows through the writer thread and count the skip. """
+    try:
+        submit(lambda cursor: ingest.carry_forward_staged(cursor, location, seconds_saved), db_path=db_path).result()
+    except Exception as e:
+        print(f"Error carrying forward {location}: {e}")
+
+def store_location(pages, location, start_page, seen_keys, insert_page, db_path=ingest.DB_PATH):
+    """ Stage each scraped page through insert_page, then publish the location.
+
+    pages yields parse_service handles. Each page is collected only after the browser
+    has moved on to the next one, so navigation never waits on parsing. The first page
+    is the exception: it is fingerprinted straight away, and when it matches the
+    fingerprint saved by the last published scrape, pagination stops and the previous
+    rows are carried forward.
+    """
+    started = time.time()
+    menu_fingerprint = None
+    pending = None
+
+    for page_number, handle in enumerate(pages, start=start_page):
+        if page_number == 1:
+            products = parse_service.result(handle)
+            menu_fingerprint = fingerprint.page_fingerprint(products)
+            previous = fingerprint.load_fingerprint(location, db_path)
+            if products and previous and previous['fingerprint'] == menu_fingerprint:
+                carry_forward(location, max(previous['scrape_seconds'] - (time.time() - started), 0), db_path)
+                return False
+            insert_page(products, location, page_number, seen_keys)
+            continue
+
+        if pending:
+            insert_page(parse_service.result(pending[1]), location, pending[0], seen_keys)
+        pending = (page_number, handle)
+
+    if pending:
+        insert_page(parse_service.result(pending[1]), location, pending[0], seen_keys)
+
+    # A resumed scrape never saw page 1, so it forgets the fingerprint rather than saving one
+    publish_location(location, menu_fingerprint, time.time() - started, db_path)
+    return True
+
+def next_batch(pending):
+    """ Wait for a write, then take every write already queued behind it up to MAX_BATCH_ROWS.
+
+    Nothing waits for a batch to fill: writes queue up while the previous transaction commits, so
+    batches grow with the load on their own. None in the queue means stop.
+    """
+    item = pending.get()
+    if item is None:
+        return [], True
+    batch, rows = [item], item[1]
+    while rows < MAX_BATCH_ROWS:
+        try:
+            item = pending.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            return batch, True
+        batch.append(item)
+        rows += item[1]
+    return batch, False
+
+def run(pending, db_path):
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    cursor = conn.cursor()
+    stopping = False
+    try:
+        while not stopping:
+            batch, stopping = next_batch(pending)
+            if not batch:
+                continue
+
+            # Each write gets a savepoint, so one failing write is rolled back without the others
+            results = []
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+            except sqlite3.OperationalError as e:
+                # Another process held the write lock past BUSY_TIMEOUT
+                for _, _, future, _ in batch:
+                    stats['failed'] += 1
+                    future.set_exception(e)
+                continue
+            for write, rows, future, queued_at in batch:
+                stats['wait_seconds'].append(time.perf_counter() - queued_at)
+                cursor.execute('SAVEPOINT write')
+                try:
+                    results.append((future, write(cursor), None))
+                    cursor.execute('RELEASE write')
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write')
+                    cursor.execute('RELEASE write')
+                    # Dictionary codes the write added are gone with it
+                    encoding.forget(cursor)
+                    results.append((future, None, e))
+
+            started = time.perf_counter()
+            try:
+                cursor.execute('COMMIT')
+            except Exception as e:
+                cursor.execute('ROLLBACK')
+                encoding.forget(cursor)
+                results = [(future, None, e) for future, _, _ in results]
+            stats['commit_seconds'].append(time.perf_counter() - started)
+            stats['transactions'] += 1
+
+            for (future, result, error), (_, rows, _, _) in zip(results, batch):
+                if error is None:
+                    stats['writes'] += 1
+                    stats['rows'] += rows
+                    future.set_result(result)
+                else:
+                    stats['failed'] += 1
+                    future.set_exception(error)
+    finally:
+        conn.close()
+
+def close():
+    """ Commit whatever is queued and stop the writer threads. """
+    with _lock:
+        for pending, _ in _writers.values():
+            pending.put(None)
+        for _, thread in _writers.values():
+            thread.join()
+        _writers.clear()
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+def report():
+    """ Print how the writer thread grouped writes and how long commits and queueing took. """
+    if not stats['transactions']:
+        return
+    commits = [1000 * seconds for seconds in stats['commit_seconds']]
+    waits = [1000 * seconds for seconds in stats['wait_seconds']]
+    print(f"Database writer: {stats['writes']} writes ({stats['rows']} rows) in {stats['transactions']} "
+          f"transactions, {stats['failed']} failed.")
+    print(f"  commit latency p50 {percentile(commits, 50):.1f}ms, p95 {percentile(commits, 95):.1f}ms, "
+          f"max {max(commits):.1f}ms; queue wait p50 {percentile(waits, 50):.1f}ms, "
+          f"p95 {percentile(waits, 95):.1f}ms, max {max(waits):.1f}ms")
@@ -0,0 +1,152 @@
+import time
+from collections import deque
+
+from sortedcontainers import SortedList
+
+from writers.compare import strain_group
+from writers.units import price_per_gram, weight_bucket
+
+# Price-per-gram observations kept per (location, weight bucket, strain type), newest replacing oldest
+WINDOW_SIZE = 500
+# Observations a window needs before anything in it is called a deal
+MIN_WINDOW = 20
+# A deal is in the cheapest DEAL_PERCENTILE percent of its window and at least MIN_DISCOUNT below the median
+DEAL_PERCENTILE = 10
+MIN_DISCOUNT = 0.2
+
+# Create the rolling price windows and the deals found in them
+def create_deal_tables(cursor):
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'deal_window'").fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deal_window (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Location TEXT,
+            WeightBucket TEXT,
+            StrainType TEXT,
+            PricePerGram REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deal_window_location ON deal_window (Location, id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            RunId INTEGER,
+            Location TEXT,
+            Product TEXT,
+            Brand TEXT,
+            StrainType TEXT,
+            Weight REAL,
+            Price REAL,
+            PricePerGram REAL,
+            MedianPricePerGram REAL,
+            Percentile REAL,
+            Discount REAL,
+            FoundAt REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_variant ON deals (Location, Product, Weight)')
+
+    # Windows start from what is listed now, so the first publish already has something to compare with
+    if not exists:
+        cursor.executemany('''
+            INSERT INTO deal_window (Location, WeightBucket, StrainType, PricePerGram) VALUES (?, ?, ?, ?)
+        ''', [(location, weight_bucket(weight), strain_group(strain_type), price_per_gram(price, weight))
+              for location, weight, strain_type, price in cursor.execute('''
+                  SELECT Location, Weight, StrainType, Price FROM flower ORDER BY id
+              ''').fetchall() if price_per_gram(price, weight) is not None])
+
+class PriceWindow:
+    """ The last WINDOW_SIZE prices per gram of one group, in arrival order and in sorted order.
+
+    The sorted copy makes a percentile or a value's rank a bisection instead of a sort.
+    """
+    def __init__(self):
+        self.arrivals = deque()
+        self.sorted = SortedList()
+
+    def add(self, row_id, value):
+        """ Add an observation and return the row ids it pushed out of the window. """
+        self.arrivals.append((row_id, value))
+        self.sorted.add(value)
+        evicted = []
+        while len(self.arrivals) > WINDOW_SIZE:
+            old_id, old_value = self.arrivals.popleft()
+            self.sorted.remove(old_value)
+            evicted.append(old_id)
+        return evicted
+
+    def percentile_rank(self, value):
+        """ Percent of the window priced below value. """
+        return 100 * self.sorted.bisect_left(value) / len(self.sorted)
+
+    def median(self):
+        middle = len(self.sorted) // 2
+        if len(self.sorted) % 2:
+            return self.sorted[middle]
+        return (self.sorted[middle - 1] + self.sorted[middle]) / 2
+
+def load_windows(cursor, location):
+    windows = {}
+    for row_id, bucket, strain_type, value in cursor.execute('''
+        SELECT id, WeightBucket, StrainType, PricePerGram FROM deal_window WHERE Location = ? ORDER BY id
+    ''', (location,)).fetchall():
+        windows.setdefault((bucket, strain_type), PriceWindow()).add(row_id, value)
+    return windows
+
+def detect_deals(cursor, location, run_id, changed):
+    """ Score a location's new and repriced variants against its rolling windows and record the deals.
+
+    changed rows are as returned by changes.record_changes. Each is scored before it joins its
+    window, so a deal is compared with what came before it. Returns the number of deals found.
+    """
+    windows = load_windows(cursor, location)
+    now = time.time()
+    found = []
+    evicted = []
+    for _, _, product, brand, strain_type, weight, _, price, _ in changed:
+        value = price_per_gram(price, weight)
+        if value is None:
+            continue
+        bucket, strain = weight_bucket(weight), strain_group(strain_type)
+        window = windows.setdefault((bucket, strain), PriceWindow())
+
+        if len(window.sorted) >= MIN_WINDOW:
+            rank, median = window.percentile_rank(value), window.median()
+            discount = 1 - value / median if median else 0
+            if rank <= DEAL_PERCENTILE and discount >= MIN_DISCOUNT:
+                found.append((run_id, location, product, brand, strain_type, weight, price, value, median, rank,
+                              discount, now))
+
+        cursor.execute('''
+            INSERT INTO deal_window (Location, WeightBucket, StrainType, PricePerGram) VALUES (?, ?, ?, ?)
+        ''', (location, bucket, strain, value))
+        evicted.extend(window.add(cursor.lastrowid, value))
+
+    cursor.executemany('DELETE FROM deal_window WHERE id = ?', [(row_id,) for row_id in evicted])
+    # A variant is only ever listed as one deal, the latest
+    cursor.executemany('''
+        DELETE FROM deals WHERE Location = ? AND Product = ? AND Brand IS ? AND Weight IS ?
+    ''', [(location, row[2], row[3], row[5]) for row in found])
+    cursor.executemany('''
+        INSERT INTO deals
+            (RunId, Location, Product, Brand, StrainType, Weight, Price, PricePerGram, MedianPricePerGram,
+             Percentile, Discount, FoundAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', found)
+    return len(found)
+
+def deals_query(location=None, limit=100):
+    """ Return (sql, params) for the deals still listed at the price they were found at, biggest discount first. """
+    clauses, params = [], []
+    if location is not None:
+        clauses.append('d.Location = ?')
+        params.append(location)
+    return (f'''
+        SELECT f.id, d.Product, d.Brand, d.StrainType, d.Weight, d.Price, d.PricePerGram, d.MedianPricePerGram,
+               d.Percentile, d.Discount, d.Location, d.RunId, d.FoundAt
+        FROM deals d
+        JOIN flower f ON f.Location = d.Location AND f.Product = d.Product AND f.Brand IS d.Brand
+                     AND f.Weight IS d.Weight AND f.Price = d.Price
+        {'WHERE ' + ' AND '.join(clauses) if clauses else ''}
+        ORDER BY d.Discount DESC, d.id LIMIT ?
+    ''', (*params, limit))
@@ -3,11 +3,22 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import time
 import re
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from writers import archive, db_writer, ingest, normalize, page_cache, parse_service, rate_limit
+
+# Seconds and key presses spent loading a menu; a site registry entry can override any of them
+TIMING = {
+    'scroll_presses': 15,
+    'scroll_pause': 1,
+    'load_wait': 9,
+    'age_gate_wait': 80,
+    'implicit_wait': 15,
+    'page_timeout': None,
+}
 
 # Create or connect to a SQLite database
 def create_database():
@@ -38,35 +49,26 @@ def create_database():
         conn.close()
 
 # Function to send PAGE_DOWN key presses to scroll and load more products
-def send_page_down(driver, num_times=15):
+def send_page_down(driver, num_times=15, pause=1):
     """ Simulate PAGE_DOWN key presses to scroll the page. """
     body = driver.find_element(By.TAG_NAME, 'body')
     for _ in range(num_times):
         body.send_keys(Keys.PAGE_DOWN)
         print("Sent PAGE_DOWN key...")
-        time.sleep(1)  # Allow content to load after each key press
-
-# Function to clean and convert fields
-def clean_potency(potency_str):
-    """ Remove the '%' and convert to float for handling decimal percentages. """
-    return float(potency_str.replace('%', '').strip()) if potency_str else None
-
-def clean_weight(weight_str):
-    """ Extract the numeric part of the weight (assumes input like '1/8 oz -'). """
-    weight_match = re.search(r'([\d/\.]+)', weight_str)
-    if weight_match:
-        return eval(weight_match.group(1))  # Convert fractions like '1/8' to decimal (3.5)
-    return None
-
-def clean_price(price_str):
-    """ Remove the '$' and convert to float. """
-    return float(price_str.replace('$', '').strip()) if price_str else None
-
-# Function to scrape the current page
-def scrape_current_page(driver, location):
-    html = driver.page_source
-    soup = BeautifulSoup(html, 'html.parser')
-    products = []
+        time.sleep(pause)  # Allow content to load after each key press
+
+# Function to scrape the current page; parsing is handed to the parse service and not waited on
+def scrape_current_page(driver, location, page_number=1):
+    html = page_cache.product_list_html(driver, 'div[data-testid="product-list-item"]')
+    # The whole page is archived, so a re-parse is not limited to the cards the selector matched today
+    archive.store_page(driver.page_source, ingest.active_run_id(), location, page_number, parse_products)
+    return parse_service.submit(html, location, parse_products)
+
+# Function to parse the product cards of a page
+def parse_products(html, location):
+    product_cards_only = SoupStrainer('div', {'data-testid': 'product-list-item'})
+    soup = BeautifulSoup(html, parse_service.TREE_BUILDER, parse_only=product_cards_only)
+    raw_variants = []
 
     product_cards = soup.find_all('div', {'data-testid': 'product-list-item'})
 
@@ -87,7 +89,7 @@ def scrape_current_page(driver, location):
             strain_type = details.split("•")[0].strip()
             potency_match = re.search(r'THC:\s*([0-9.]+%)', details)
             if potency_match:
-                potency = clean_potency(potency_match.group(1).strip())
+                potency = potency_match.group(1).strip()
 
         weight_price_container = product.find('div', class_='mobile-product-list-item__MultipleOptionsContainer-zxgt1n-2')
 
@@ -99,130 +101,125 @@ def scrape_current_page(driver, location):
                 price_tag = option.find('span', class_='weight-tile__PriceText-otzu8j-6')
 
                 if weight_tag and price_tag:
-                    weight = clean_weight(weight_tag.text.strip())
-                    price = clean_price(price_tag.text.strip())
-
-                    products.append({
-                        'name': name,
-                        'brand': brand,
-                        'strain_type': strain_type,
-                        'potency': potency,
-                        'weight': weight,
-                        'price': price,
-                        'location': location
-                    })
+                    weight = weight_tag.text.strip()
+                    price = price_tag.text.strip()
+
+                    raw_variants.append((name, brand, strain_type, potency, weight, price))
         else:
             weight_tag = product.find('span', class_='weight-tile__Label-otzu8j-5')
             price_tag = product.find('span', class_='weight-tile__PriceText-otzu8j-6')
 
             if weight_tag and price_tag:
-                weight = clean_weight(weight_tag.text.strip())
-                price = clean_price(price_tag.text.strip())
+                weight = weight_tag.text.strip()
+                price = price_tag.text.strip()
 
-                products.append({
-                    'name': name,
-                    'brand': brand,
-                    'strain_type': strain_type,
-                    'potency': potency,
-                    'weight': weight,
-                    'price': price,
-                    'location': location
-                })
+                raw_variants.append((name, brand, strain_type, potency, weight, price))
 
-    return products
+    # Convert the page's potency, weight and price labels in one batch
+    return normalize.page_variants(raw_variants, location)
 
-# Updated function to handle pagination and scrape all pages
-def scrape_all_pages(driver, location):
-    all_products = []
-
-    while True:
-        send_page_down(driver, num_times=15)  # Scroll down enough to load products
+# Function to click the pager's next button, returns False once the last page is reached
+def click_next_page(driver, load_wait=9):
+    # Only a missing or disabled next button means the last page; a timeout or a stale element
+    # raises, so a half-scraped menu stays unpublished for a resume or retry to finish
+    buttons = driver.find_elements(By.CSS_SELECTOR, 'button[aria-label="go to next page"]')
+    if not buttons or not buttons[0].is_enabled() or buttons[0].get_attribute('aria-disabled') == 'true':
+        print("Reached the last page.")
+        return False
 
-        products = scrape_current_page(driver, location)
-        all_products.extend(products)
+    # Wait for the next button to become clickable
+    next_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable(buttons[0]))
 
-        try:
-            # Scroll to the next button to make sure it's in view
-            next_button = WebDriverWait(driver, 10).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, 'button[aria-label="go to next page"]'))
-            )
+    # Scroll the next button into view
+    driver.execute_script("arguments[0].scrollIntoView(true);", next_button)
 
-            # Scroll the next button into view
-            driver.execute_script("arguments[0].scrollIntoView(true);", next_button)
+    # Add a small wait before clicking to ensure it’s clickable
+    time.sleep(2)
 
-            # Add a small wait before clicking to ensure it’s clickable
-            time.sleep(2)
+    # Click the next button once the domain's rate limit allows another page load
+    rate_limit.acquire(driver.current_url)
+    next_button.click()
 
-            # Click the next button
-            next_button.click()
+    # Wait for the next page to load
+    time.sleep(load_wait)
+    return True
 
-            # Wait for the next page to load
-            time.sleep(9)
-        except Exception as e:
-            print(f"Reached the last page or encountered an error: {e}")
-            break
+# Generator that handles pagination and yields the products of each page as it is scraped
+def scrape_all_pages(driver, location, start_page=1, timing=TIMING):
+    # Jump past pages an interrupted run already stored, without scrolling or parsing them
+    for _ in range(start_page - 1):
+        if not click_next_page(driver, load_wait=3):
+            return
 
-    return all_products
+    page_number = start_page
+    while True:
+        # Scroll down enough to load products
+        send_page_down(driver, timing['scroll_presses'], timing['scroll_pause'])
 
-# Function to insert products into the SQLite database
-def insert_into_database(products):
-    try:
-        conn = sqlite3.connect('../dispensary.db')
-        cursor = conn.cursor()
+        # Hand the page to the caller before navigating so it is stored first
+        yield scrape_current_page(driver, location, page_number)
 
-        for product in products:
-            cursor.execute('''
-                INSERT INTO flower (Product, Brand, Potency, Weight, Price, StrainType, Location)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                product['name'],
-                product['brand'],
-                product['potency'],
-                product['weight'],
-                product['price'],
-                product['strain_type'],
-                product['location']
-            ))
+        if not click_next_page(driver, timing['load_wait']):
+            break
+        page_number += 1
 
-        conn.commit()
-        print(f"Inserted {len(products)} products into the database.")
-    except Exception as e:
-        print(f"Error inserting into database: {e}")
-    finally:
-        conn.close()
+# Function to stage one page of products in the SQLite database
+def insert_into_database(products, location, page_number, seen_keys):
+    # Rows and the page checkpoint are committed together, in a transaction the writer thread
+    # shares with pages from any other scraper running in this process. A failed write raises, so
+    # the location is left unpublished for a resume to finish from its last committed page
+    count = db_writer.write_page(products, location, page_number, seen_keys)
+    print(f"Inserted {count} products into the database.")
 
-def handle_age_verification(driver):
+def handle_age_verification(driver, wait=80):
     try:
-        print("Waiting 70 seconds for the age verification to bypass automatically...")
-        time.sleep(80)  # Wait for 70 seconds to allow the age verification screen to bypass
+        print(f"Waiting {wait} seconds for the age verification to bypass automatically...")
+        time.sleep(wait)  # Allow the age verification screen to bypass
         print("Age verification screen should be bypassed now, proceeding with scrape.")
     except Exception as e:
         print(f"Encountered an error during wait: {e}, proceeding with scrape.")
 
-def scrape_data(urls_and_locations):
+def scrape_data(urls_and_locations, resume=False, timing=None):
+    timing = {**TIMING, **(timing or {})}
     driver_path = '../chromedriver.exe'  # Replace with your actual path to chromedriver
     service = Service(driver_path)
 
     # Initialize the Selenium WebDriver
     driver = webdriver.Chrome(service=service)
+    try:
+        if timing['page_timeout']:
+            driver.set_page_load_timeout(timing['page_timeout'])
 
-    for url, location in urls_and_locations:
-        print(f"Scraping data for: {location}")
-
-        driver.get(url)
-        driver.implicitly_wait(15)
+        for url, location in urls_and_locations:
+            start_page, seen_keys = db_writer.begin_location(location, resume)
+            if start_page is None:
+                continue
 
-        handle_age_verification(driver)
+            print(f"Scraping data for: {location}")
 
-        iframe = driver.find_element(By.CSS_SELECTOR, 'iframe.dutchie--iframe')
-        driver.switch_to.frame(iframe)
+            rate_limit.load(driver, url)  # Waits for the domain's rate limit before loading
+            driver.implicitly_wait(timing['implicit_wait'])
 
-        all_products = scrape_all_pages(driver, location)
+            handle_age_verification(driver, timing['age_gate_wait'])
 
-        insert_into_database(all_products)
+            iframe = driver.find_element(By.CSS_SELECTOR, 'iframe.dutchie--iframe')
+            driver.switch_to.frame(iframe)
 
-    driver.quit()
+            # Each page is committed as soon as it is scraped, then the finished scrape is swapped
+            # into the flower table; an unchanged first page stops pagination early
+            pages = scrape_all_pages(driver, location, start_page, timing)
+            db_writer.store_location(pages, location, start_page, seen_keys, insert_into_database)
+    finally:
+        # Close the browser even when the scrape fails, so a retry does not leave it running
+        driver.quit()
 
+# Scrape these sites on their own. Run from writers/, where the ../dispensary.db and
+# ../chromedriver.exe paths resolve, as: PYTHONPATH=.. python -m writers.elevate_writer
 if __name__ == '__main__':
-    # List of URLs and their corresponding location names
-    scrape_data([('https://keycannabis.com/shop/cape-girardeau-mo/?dtche%5Bcategory%5D=flower', 'Elevate')])
+    # Imported again under its package name, so the parser is archived, cached and sent to the
+    # parse workers as writers.elevate_writer.parse_products rather than __main__.parse_products
+    from writers import elevate_writer
+
+    elevate_writer.scrape_data([
+        ('https://keycannabis.com/shop/cape-girardeau-mo/?dtche%5Bcategory%5D=flower', 'Elevate'),
+    ])
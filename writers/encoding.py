@@ -0,0 +1,301 @@
+import math
+import sqlite3
+import threading
+import time
+
+from writers import normalize, quality
+from writers.units import OUNCE_IN_GRAMS
+
+# Low-cardinality flower columns and the dictionary table holding their values
+DICTIONARIES = {
+    'Brand': 'brand_dict',
+    'StrainType': 'strain_type_dict',
+    'Location': 'location_dict',
+}
+
+# Price per gram, computed by SQLite so it can be indexed for sorting; Weight is in grams
+PRICE_PER_GRAM_SQL = 'REAL GENERATED ALWAYS AS (Price / Weight) VIRTUAL'
+
+# Weight used to be stored as the label's bare number, read as ounces up to one
+LEGACY_PRICE_PER_GRAM = 'CASE WHEN Weight <= 1'
+# Tables holding a product's legacy weight; rows of the published table whose unit cannot be
+# told are quarantined, derived rows are dropped, and already quarantined rows are left as they are
+LEGACY_WEIGHT_TABLES = {
+    'flower_quarantine': None,
+    'flower_rows': 'quarantine',
+    'price_changes': 'delete',
+    'deals': 'delete',
+}
+# No menu sells flower by the gram below this, so a smaller legacy weight was an ounce fraction
+MIN_GRAM_WEIGHT = 0.5
+
+# Indexes on the keys the API sorts by; id breaks ties so keyset pages are stable. The location
+# ones serve a page filtered to one store straight from the index, without sorting the store's rows
+SORT_INDEXES = {
+    'idx_flower_rows_price': 'Price, id',
+    'idx_flower_rows_price_per_gram': 'PricePerGram, id',
+    'idx_flower_rows_potency': 'Potency, id',
+    'idx_flower_rows_location_price': 'LocationId, Price, id',
+    'idx_flower_rows_location_price_per_gram': 'LocationId, PricePerGram, id',
+    'idx_flower_rows_location_potency': 'LocationId, Potency, id',
+}
+
+# Codes are never reassigned, so name <-> code lookups are cached per database file. Each thread
+# keeps its own: scrapers publish from several threads, and codes added by one thread's
+# transaction must not be handed to another before it commits, or after it rolls back
+_local = threading.local()
+
+# Create the dictionary tables, the encoded flower_rows table and the flower view that decodes it
+def create_encoded_tables(cursor):
+    for table in DICTIONARIES.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                Code INTEGER PRIMARY KEY,
+                Name TEXT UNIQUE NOT NULL
+            )
+        ''')
+
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS flower_rows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Product TEXT,
+            BrandId INTEGER,
+            Potency REAL,
+            Weight REAL,
+            Price REAL,
+            StrainTypeId INTEGER,
+            LocationId INTEGER,
+            RunId INTEGER,
+            PricePerGram {PRICE_PER_GRAM_SQL}
+        )
+    ''')
+    legacy_weights = False
+    definition = cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'flower_rows'").fetchone()[0]
+    if 'PricePerGram' not in definition or LEGACY_PRICE_PER_GRAM in definition:
+        # The view predates the column or its grams reading; it and its triggers are recreated below
+        cursor.execute('DROP VIEW IF EXISTS flower')
+        if 'PricePerGram' in definition:
+            cursor.execute('DROP INDEX IF EXISTS idx_flower_rows_price_per_gram')
+            cursor.execute('ALTER TABLE flower_rows DROP COLUMN PricePerGram')
+        cursor.execute(f'ALTER TABLE flower_rows ADD COLUMN PricePerGram {PRICE_PER_GRAM_SQL}')
+        legacy_weights = True
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_flower_rows_location ON flower_rows (LocationId)')
+    for index, columns in SORT_INDEXES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {index} ON flower_rows ({columns})')
+
+    kind = cursor.execute("SELECT type FROM sqlite_master WHERE name = 'flower'").fetchone()
+    if kind and kind[0] == 'table':
+        migrate_flower_table(cursor)
+        legacy_weights = True
+    if legacy_weights:
+        migrate_weights(cursor)
+
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS flower AS
+        SELECT r.id, r.Product, b.Name AS Brand, r.Potency, r.Weight, r.Price,
+               s.Name AS StrainType, l.Name AS Location, r.RunId, r.PricePerGram
+        FROM flower_rows r
+        LEFT JOIN brand_dict b ON b.Code = r.BrandId
+        LEFT JOIN strain_type_dict s ON s.Code = r.StrainTypeId
+        LEFT JOIN location_dict l ON l.Code = r.LocationId
+    ''')
+
+    # Keep plain INSERT / DELETE statements against flower working through the view
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS flower_insert INSTEAD OF INSERT ON flower
+        BEGIN
+            INSERT OR IGNORE INTO brand_dict (Name) SELECT NEW.Brand WHERE NEW.Brand IS NOT NULL;
+            INSERT OR IGNORE INTO strain_type_dict (Name) SELECT NEW.StrainType WHERE NEW.StrainType IS NOT NULL;
+            INSERT OR IGNORE INTO location_dict (Name) SELECT NEW.Location WHERE NEW.Location IS NOT NULL;
+            INSERT INTO flower_rows (Product, BrandId, Potency, Weight, Price, StrainTypeId, LocationId, RunId)
+            VALUES (
+                NEW.Product,
+                (SELECT Code FROM brand_dict WHERE Name = NEW.Brand),
+                NEW.Potency, NEW.Weight, NEW.Price,
+                (SELECT Code FROM strain_type_dict WHERE Name = NEW.StrainType),
+                (SELECT Code FROM location_dict WHERE Name = NEW.Location),
+                NEW.RunId
+            );
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS flower_delete INSTEAD OF DELETE ON flower
+        BEGIN
+            DELETE FROM flower_rows WHERE id = OLD.id;
+        END
+    ''')
+
+def migrate_flower_table(cursor):
+    """ Move the rows of an older plain-text flower table into flower_rows and drop it. """
+    has_run_id = any(row[1] == 'RunId' for row in cursor.execute('PRAGMA table_info(flower)'))
+    for column, table in DICTIONARIES.items():
+        cursor.execute(f'INSERT OR IGNORE INTO {table} (Name) SELECT DISTINCT {column} FROM flower '
+                       f'WHERE {column} IS NOT NULL')
+    cursor.execute(f'''
+        INSERT INTO flower_rows (id, Product, BrandId, Potency, Weight, Price, StrainTypeId, LocationId, RunId)
+        SELECT f.id, f.Product, b.Code, f.Potency, f.Weight, f.Price, s.Code, l.Code,
+               {'f.RunId' if has_run_id else 'NULL'}
+        FROM flower f
+        LEFT JOIN brand_dict b ON b.Name = f.Brand
+        LEFT JOIN strain_type_dict s ON s.Name = f.StrainType
+        LEFT JOIN location_dict l ON l.Name = f.Location
+        ORDER BY f.id
+    ''')
+    cursor.execute('DROP TABLE flower')
+    print("Migrated the flower table to dictionary-encoded flower_rows.")
+
+def legacy_grams(product, weight):
+    """ Grams of a Weight stored without its unit, or None when the unit cannot be told.
+
+    Values below MIN_GRAM_WEIGHT can only be ounces. Otherwise the product name has to state a
+    weight with its unit that matches reading the value as ounces or as grams, as 'PREPACK - 1G'
+    does; a name stating another size, or none, leaves it ambiguous.
+    """
+    if weight < MIN_GRAM_WEIGHT:
+        return weight * OUNCE_IN_GRAMS
+    try:
+        named = normalize.weight_in_name(product)
+    except ValueError:
+        return None
+    if named is None:
+        return None
+    return next((grams for grams in (weight, weight * OUNCE_IN_GRAMS) if math.isclose(grams, named)), None)
+
+def migrate_weights(cursor):
+    """ Convert Weight values stored by older versions into grams.
+
+    Those stored the label's number without its unit, so values up to one may be ounces or grams.
+    Each is resolved by legacy_grams; published rows that stay ambiguous are moved to
+    flower_quarantine until their location is next scraped, which republishes every location in
+    full because the weights change its first-page fingerprint. Watches were set under the old
+    reading, so it is what they meant. Staged pages and checkpoints, whose resume keys hold the
+    old weights, are dropped, and the comparison index and deal windows are rebuilt from fresh prices.
+    """
+    tables = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    quality.create_quarantine_table(cursor)
+    ambiguous = 0
+    for table, unresolved in LEGACY_WEIGHT_TABLES.items():
+        if table not in tables:
+            continue
+        stored_price_per_gram = any(row[1] == 'PricePerGram' and not row[6]
+                                    for row in cursor.execute(f'PRAGMA table_xinfo({table})'))
+        resolved, unknown = [], []
+        for row_id, product, weight in cursor.execute(
+                f'SELECT id, Product, Weight FROM {table} WHERE Weight <= 1').fetchall():
+            grams = legacy_grams(product, weight)
+            if grams is None:
+                unknown.append((row_id,))
+            else:
+                resolved.append((grams, row_id))
+        cursor.executemany(f'UPDATE {table} SET Weight = ? WHERE id = ?', resolved)
+        if stored_price_per_gram:
+            cursor.executemany(f'UPDATE {table} SET PricePerGram = Price / Weight WHERE id = ?',
+                               [(row_id,) for _, row_id in resolved])
+
+        if unresolved == 'quarantine':
+            ambiguous += len(unknown)
+            cursor.executemany(f'''
+                INSERT INTO flower_quarantine ({', '.join(quality.COLUMNS[1:])}, RunId, Reason, QuarantinedAt)
+                SELECT r.Product, b.Name, r.Potency, r.Weight, r.Price, s.Name, l.Name, r.RunId,
+                       'weight unit unknown', ?
+                FROM flower_rows r
+                LEFT JOIN brand_dict b ON b.Code = r.BrandId
+                LEFT JOIN strain_type_dict s ON s.Code = r.StrainTypeId
+                LEFT JOIN location_dict l ON l.Code = r.LocationId
+                WHERE r.id = ?
+            ''', [(time.time(), row_id) for row_id, in unknown])
+        if unresolved:
+            cursor.executemany(f'DELETE FROM {table} WHERE id = ?', unknown)
+
+    if 'watches' in tables:
+        cursor.execute(f'UPDATE watches SET Weight = Weight * {OUNCE_IN_GRAMS} WHERE Weight <= 1')
+    for table in ('flower_partial', 'scrape_checkpoint'):
+        if table in tables:
+            cursor.execute(f'DELETE FROM {table}')
+    if 'deal_window' in tables:
+        cursor.execute('DELETE FROM deal_window')
+    cursor.execute('DROP TABLE IF EXISTS compare_index')
+    print(f"Converted stored weights to grams; {ambiguous} rows whose unit was unknown were quarantined.")
+
+def _thread_caches():
+    if not hasattr(_local, 'caches'):
+        _local.caches = {}
+    return _local.caches
+
+def _cache(cursor, column):
+    path = cursor.execute('PRAGMA database_list').fetchone()[2]
+    # Every in-memory and temporary database reports an empty path, so their codes are not cached
+    if not path:
+        return {}, {}
+    caches = _thread_caches().setdefault(path, {})
+    return caches.setdefault(column, ({}, {}))
+
+def forget(cursor):
+    """ Drop the cached codes of the database behind cursor. """
+    _thread_caches().pop(cursor.execute('PRAGMA database_list').fetchone()[2] or None, None)
+
+def encode(cursor, column, name):
+    """ Return the code of a Brand / StrainType / Location value, adding it to the dictionary if new. """
+    if name is None:
+        return None
+    codes, names = _cache(cursor, column)
+    code = codes.get(name)
+    if code is None:
+        table = DICTIONARIES[column]
+        cursor.execute(f'INSERT OR IGNORE INTO {table} (Name) VALUES (?)', (name,))
+        code = cursor.execute(f'SELECT Code FROM {table} WHERE Name = ?', (name,)).fetchone()[0]
+        codes[name] = code
+        names[code] = name
+    return code
+
+def lookup(cursor, column, name):
+    """ Return the code of an existing value without adding it, or None when it is unknown. """
+    codes, names = _cache(cursor, column)
+    code = codes.get(name)
+    if code is None:
+        row = cursor.execute(f'SELECT Code FROM {DICTIONARIES[column]} WHERE Name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        code = codes[name] = row[0]
+        names[code] = name
+    return code
+
+def decode(cursor, column, code):
+    """ Return the value a code stands for. """
+    if code is None:
+        return None
+    codes, names = _cache(cursor, column)
+    name = names.get(code)
+    if name is None:
+        name = cursor.execute(f'SELECT Name FROM {DICTIONARIES[column]} WHERE Code = ?', (code,)).fetchone()[0]
+        names[code] = name
+        codes[name] = code
+    return name
+
+def encode_rows(cursor, rows, run_id):
+    """ Turn (Product, Brand, Potency, Weight, Price, StrainType, Location) rows into flower_rows tuples. """
+    for product, brand, potency, weight, price, strain_type, location in rows:
+        yield (
+            product,
+            encode(cursor, 'Brand', brand),
+            potency,
+            weight,
+            price,
+            encode(cursor, 'StrainType', strain_type),
+            encode(cursor, 'Location', location),
+            run_id
+        )
+
+def average_price_by_location(db_path):
+    """ Average price and variant count per (location, strain type), grouped on the integer codes. """
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        rows = cursor.execute('''
+            SELECT LocationId, StrainTypeId, AVG(Price), COUNT(*)
+            FROM flower_rows GROUP BY LocationId, StrainTypeId
+        ''').fetchall()
+        return [(decode(cursor, 'Location', location), decode(cursor, 'StrainType', strain_type), price, count)
+                for location, strain_type, price, count in rows]
+    finally:
+        conn.close()
@@ -0,0 +1,48 @@
+import hashlib
+import sqlite3
+import time
+
+# Create the table holding the first-page fingerprint of each location's last published scrape
+def create_fingerprint_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS menu_fingerprint (
+            Location TEXT PRIMARY KEY,
+            Fingerprint TEXT,
+            ScrapeSeconds REAL,
+            UpdatedAt REAL
+        )
+    ''')
+
+def page_fingerprint(products):
+    """ Fingerprint a menu from its first page: variant count plus a hash of every card field. """
+    digest = hashlib.sha1()
+    for product in products:
+        digest.update(repr(product.fields()).encode('utf-8'))
+    return f"{len(products)}:{digest.hexdigest()}"
+
+def load_fingerprint(location, db_path):
+    """ Return the saved fingerprint and full scrape duration for a location, or None. """
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        create_fingerprint_table(cursor)
+
+        row = cursor.execute('''
+            SELECT Fingerprint, ScrapeSeconds FROM menu_fingerprint WHERE Location = ?
+        ''', (location,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return {'fingerprint': row[0], 'scrape_seconds': row[1] or 0}
+    finally:
+        conn.close()
+
+def store_fingerprint(cursor, location, menu_fingerprint, scrape_seconds):
+    """ Remember the fingerprint of a published scrape; None forgets it so the next run scrapes in full. """
+    create_fingerprint_table(cursor)
+    if menu_fingerprint is None:
+        cursor.execute('DELETE FROM menu_fingerprint WHERE Location = ?', (location,))
+    else:
+        cursor.execute('''
+            INSERT OR REPLACE INTO menu_fingerprint (Location, Fingerprint, ScrapeSeconds, UpdatedAt)
+            VALUES (?, ?, ?, ?)
+        ''', (location, menu_fingerprint, scrape_seconds, time.time()))
@@ -3,9 +3,19 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import time
 import re
+from writers import archive, db_writer, ingest, normalize, page_cache, parse_service, rate_limit
+
+# Seconds and key presses spent loading a menu; a site registry entry can override any of them
+TIMING = {
+    'scroll_presses': 10,
+    'scroll_pause': 2,
+    'load_wait': 5,
+    'implicit_wait': 15,
+    'page_timeout': None,
+}
 
 # Create or connect to a SQLite database
 def create_database():
@@ -35,56 +45,32 @@ def create_database():
     finally:
         conn.close()
 
-# Function to truncate the flower table (remove all rows)
-def truncate_table():
-    try:
-        conn = sqlite3.connect('../dispensary.db')
-        cursor = conn.cursor()
-
-        # Delete all rows from the flower table
-        cursor.execute('DELETE FROM flower')
-        conn.commit()
-        print("Flower table truncated successfully.")
-    except Exception as e:
-        print(f"Error truncating table: {e}")
-    finally:
-        conn.close()
-
 # Function to send PAGE_DOWN key presses to scroll and load more products
-def send_page_down(driver, num_times=15):
+def send_page_down(driver, num_times=15, pause=2):
     """ Simulate PAGE_DOWN key presses to scroll the page. """
     body = driver.find_element(By.TAG_NAME, 'body')
     for _ in range(num_times):
         body.send_keys(Keys.PAGE_DOWN)
         print("Sent PAGE_DOWN key...")
-        time.sleep(2)  # Allow content to load after each key press
-
-# Function to clean and convert fields
-def clean_potency(potency_str):
-    """ Remove the '%' and convert to float for handling decimal percentages. """
-    return float(potency_str.replace('%', '').strip()) if potency_str else None
-
-def clean_weight(weight_str):
-    """ Extract the numeric part of the weight (assumes input like '1/8 oz -'). """
-    weight_match = re.search(r'([\d/\.]+)', weight_str)
-    if weight_match:
-        # Handle fractional weights (e.g., 1/8 becomes 3.5)
-        return eval(weight_match.group(1))  # Convert fractions like '1/8' to decimal (3.5)
-    return None
-
-def clean_price(price_str):
-    """ Remove the '$' and convert to float. """
-    return float(price_str.replace('$', '').strip()) if price_str else None
+        time.sleep(pause)  # Allow content to load after each key press
 
 # Function to scrape the current page
-def scrape_current_page(driver, location):
-    # Get the page source after scrolling
-    html = driver.page_source
+def scrape_current_page(driver, location, page_number=1):
+    # Get the product cards after scrolling and keep a raw copy for re-parsing
+    html = page_cache.product_list_html(driver, 'div[data-testid="product-list-item"]')
+    # The whole page is archived, so a re-parse is not limited to the cards the selector matched today
+    archive.store_page(driver.page_source, ingest.active_run_id(), location, page_number, parse_products)
+
+    # Hand the cards to the parse service without waiting; identical product lists reuse their rows
+    return parse_service.submit(html, location, parse_products)
 
-    # Use BeautifulSoup to parse the HTML
-    soup = BeautifulSoup(html, 'html.parser')
+# Function to parse the product cards of a page
+def parse_products(html, location):
+    # Use BeautifulSoup with the fastest available tree builder, keeping only the product cards
+    product_cards_only = SoupStrainer('div', {'data-testid': 'product-list-item'})
+    soup = BeautifulSoup(html, parse_service.TREE_BUILDER, parse_only=product_cards_only)
 
-    products = []
+    raw_variants = []
 
     # Find all product items using the 'data-testid' attribute
     product_cards = soup.find_all('div', {'data-testid': 'product-list-item'})
@@ -111,7 +97,7 @@ def scrape_current_page(driver, location):
             strain_type = details.split("•")[0].strip()  # Extract strain type
             potency_match = re.search(r'THC:\s*([0-9.]+%)', details)
             if potency_match:
-                potency = clean_potency(potency_match.group(1).strip())  # Clean and convert THC potency
+                potency = potency_match.group(1).strip()  # Clean and convert THC potency
 
         # Check for multiple weight/price options
         weight_price_container = product.find('div', class_='mobile-product-list-item__MultipleOptionsContainer-zxgt1n-2')
@@ -126,100 +112,71 @@ def scrape_current_page(driver, location):
                 price_tag = option.find('span', class_='weight-tile__PriceText-otzu8j-6')
 
                 if weight_tag and price_tag:
-                    weight = clean_weight(weight_tag.text.strip())
-                    price = clean_price(price_tag.text.strip())
+                    weight = weight_tag.text.strip()
+                    price = price_tag.text.strip()
 
                     # Append the product with the specific weight and price
-                    products.append({
-                        'name': name,
-                        'brand': brand,
-                        'strain_type': strain_type,
-                        'potency': potency,
-                        'weight': weight,
-                        'price': price,
-                        'location': location  # Use the parameterized location
-                    })
+                    raw_variants.append((name, brand, strain_type, potency, weight, price))
         else:
             # In case there are no multiple weights/prices, handle the default product entry
             weight_tag = product.find('span', class_='weight-tile__Label-otzu8j-5')
             price_tag = product.find('span', class_='weight-tile__PriceText-otzu8j-6')
 
             if weight_tag and price_tag:
-                weight = clean_weight(weight_tag.text.strip())
-                price = clean_price(price_tag.text.strip())
+                weight = weight_tag.text.strip()
+                price = price_tag.text.strip()
 
-                products.append({
-                    'name': name,
-                    'brand': brand,
-                    'strain_type': strain_type,
-                    'potency': potency,
-                    'weight': weight,
-                    'price': price,
-                    'location': location  # Use the parameterized location
-                })
+                raw_variants.append((name, brand, strain_type, potency, weight, price))
 
-    return products
+    # Convert the page's potency, weight and price labels in one batch
+    return normalize.page_variants(raw_variants, location)
 
-# Function to handle pagination and scrape all pages
-def scrape_all_pages(driver, location):
-    all_products = []
+# Function to click the "Next" button, returns False once the last page is reached
+def click_next_page(driver, load_wait=5):
+    next_buttons = driver.find_elements(By.CSS_SELECTOR, 'button[aria-label="go to next page"]')
 
-    while True:
-        # Scroll down to load all products on the current page
-        send_page_down(driver, num_times=10)
+    # A missing or disabled "Next" button is the last page; any other error raises, so a
+    # half-scraped menu stays unpublished for a resume or retry to finish
+    if not next_buttons or not next_buttons[0].is_enabled():
+        print("Reached the last page.")
+        return False
 
-        # Scrape the current page
-        products = scrape_current_page(driver, location)
-        all_products.extend(products)
+    # Click the "Next" button to go to the next page, within the domain's rate limit
+    print("Clicking the 'Next' button...")
+    rate_limit.acquire(driver.current_url)
+    next_buttons[0].click()
 
-        # Find the "Next" button
-        try:
-            next_button = driver.find_element(By.CSS_SELECTOR, 'button[aria-label="go to next page"]')
+    # Wait for the next page to load
+    time.sleep(load_wait)
+    return True
 
-            # Check if the "Next" button is disabled (indicating the last page)
-            if not next_button.is_enabled():
-                break
+# Generator that handles pagination and yields the products of each page as it is scraped
+def scrape_all_pages(driver, location, start_page=1, timing=TIMING):
+    # Jump past pages an interrupted run already stored, without scrolling or parsing them
+    for _ in range(start_page - 1):
+        if not click_next_page(driver, load_wait=2):
+            return
 
-            # Click the "Next" button to go to the next page
-            print("Clicking the 'Next' button...")
-            next_button.click()
+    page_number = start_page
+    while True:
+        # Scroll down to load all products on the current page
+        send_page_down(driver, timing['scroll_presses'], timing['scroll_pause'])
 
-            # Wait for the next page to load
-            time.sleep(5)
+        # Scrape the current page and hand it to the caller before navigating
+        yield scrape_current_page(driver, location, page_number)
 
-        except Exception as e:
-            print(f"Reached the last page or encountered an error: {e}")
+        # Move on to the next page, stopping after the last one
+        if not click_next_page(driver, timing['load_wait']):
             break
+        page_number += 1
 
-    return all_products
-
-# Function to insert products into the SQLite database
-def insert_into_database(products):
-    try:
-        conn = sqlite3.connect('../dispensary.db')
-        cursor = conn.cursor()
-
-        for product in products:
-            cursor.execute('''
-                INSERT INTO flower (Product, Brand, Potency, Weight, Price, StrainType, Location)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                product['name'],
-                product['brand'],
-                product['potency'],
-                product['weight'],
-                product['price'],
-                product['strain_type'],
-                product['location']
-            ))
-
-        # Commit the transaction and close the connection
-        conn.commit()
-        print(f"Inserted {len(products)} products into the database.")
-    except Exception as e:
-        print(f"Error inserting into database: {e}")
-    finally:
-        conn.close()
+# Function to stage one page of products in the SQLite database
+def insert_into_database(products, location, page_number, seen_keys):
+    # Rows and the page checkpoint are committed together, in a transaction the writer thread
+    # shares with pages from any other scraper running in this process. A failed write raises, so
+    # the location is left unpublished for a resume to finish from its last committed page
+    count = db_writer.write_page(products, location, page_number, seen_keys)
+    print(f"Inserted {count} products into the database.")
 
 def handle_age_verification(driver):
     try:
@@ -233,7 +190,14 @@ def handle_age_verification(driver):
         print("No age verification found, proceeding with scrape.")
 
 # Main function to run the scraper for a given dispensary
-def scrape_data(url, location):
+def scrape_data(url, location, resume=False, timing=None):
+    timing = {**TIMING, **(timing or {})}
+
+    # Find out where an interrupted run left off, or skip a location it already finished
+    start_page, seen_keys = db_writer.begin_location(location, resume)
+    if start_page is None:
+        return
+
     # Path to your ChromeDriver
     driver_path = '../chromedriver.exe'  # Replace with your actual path to chromedriver
 
@@ -242,34 +206,36 @@ def scrape_data(url, location):
 
     # Set up Selenium WebDriver with the service
     driver = webdriver.Chrome(service=service)
-    driver.get(url)  # Use the parameterized URL
-
-    # Wait for the page to load completely
-    driver.implicitly_wait(15)
-
-    # Handle age verification if present
-    handle_age_verification(driver)
+    try:
+        if timing['page_timeout']:
+            driver.set_page_load_timeout(timing['page_timeout'])
+        rate_limit.load(driver, url)  # Waits for the domain's rate limit before loading
 
-    # Find the iframe element using the updated Selenium method
-    iframe = driver.find_element(By.CSS_SELECTOR, 'iframe.dutchie--iframe')  # Use the correct selector for the iframe
-    driver.switch_to.frame(iframe)  # Switch to the iframe
+        # Wait for the page to load completely
+        driver.implicitly_wait(timing['implicit_wait'])
 
-    # Scrape all pages
-    all_products = scrape_all_pages(driver, location)
+        # Handle age verification if present
+        handle_age_verification(driver)
 
-    # Insert all products into the database
-    insert_into_database(all_products)
+        # Find the iframe element using the updated Selenium method
+        iframe = driver.find_element(By.CSS_SELECTOR, 'iframe.dutchie--iframe')  # Use the correct selector for the iframe
+        driver.switch_to.frame(iframe)  # Switch to the iframe
 
-    # Close the browser after scraping
-    driver.quit()
+        # Scrape all pages, committing each one as soon as it is scraped, then swap the finished
+        # scrape into the flower table; an unchanged first page stops pagination early
+        pages = scrape_all_pages(driver, location, start_page, timing)
+        db_writer.store_location(pages, location, start_page, seen_keys, insert_into_database)
+    finally:
+        # Close the browser even when the scrape fails, so a retry does not leave it running
+        driver.quit()
 
-# Example usage for Greenlight and CODES dispensaries
+# Scrape Greenlight on its own. Run from writers/, where the ../dispensary.db and
+# ../chromedriver.exe paths resolve, as: PYTHONPATH=.. python -m writers.green_light_writer
 if __name__ == '__main__':
-    # Truncate the table before inserting new records
-    truncate_table()
-
-    # Scrape Greenlight
-    scrape_data('https://greenlightdispensary.com/cape-girardeau-menu/?dtche%5Bcategory%5D=flower', 'Greenlight')
-
-    # Scrape CODES Dispensary
+    # Imported again under its package name, so the parser is archived, cached and sent to the
+    # parse workers as writers.green_light_writer.parse_products rather than __main__.parse_products
+    from writers import green_light_writer
 
+    # Only Greenlight's rows are replaced once its scrape is published; other stores' rows are kept
+    green_light_writer.scrape_data('https://greenlightdispensary.com/cape-girardeau-menu/?dtche%5Bcategory%5D=flower',
+                                   'Greenlight')
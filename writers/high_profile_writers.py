@@ -4,11 +4,19 @@ from selenium.common import TimeoutException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import time
-import re
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from writers import archive, db_writer, ingest, normalize, page_cache, parse_service, rate_limit
+
+# Seconds and key presses spent loading a menu; a site registry entry can override any of them
+TIMING = {
+    'scroll_presses': 20,
+    'scroll_pause': 1,
+    'implicit_wait': 15,
+    'page_timeout': None,
+}
 
 # Create or connect to a SQLite database
 def create_database():
@@ -39,46 +47,32 @@ def create_database():
         conn.close()
 
 # Function to send PAGE_DOWN key presses to scroll and load more products
-def send_page_down(driver, num_times=15):
+def send_page_down(driver, num_times=15, pause=1):
     """ Simulate PAGE_DOWN key presses to scroll the page. """
     body = driver.find_element(By.TAG_NAME, 'body')
     for _ in range(num_times):
         body.send_keys(Keys.PAGE_DOWN)
         print("Sent PAGE_DOWN key...")
-        time.sleep(1)  # Allow content to load after each key press
-
-def clean_potency(potency_str):
-    """ Remove the 'THC: ' prefix and '%' symbol, and convert to float for handling decimal percentages. """
-    try:
-        # Extract the numeric part of the potency, assuming the format is 'THC: 30.69%'
-        potency_value = re.search(r"(\d+\.?\d*)", potency_str)
-        return float(potency_value.group(1)) if potency_value else None
-    except Exception as e:
-        print(f"Error cleaning potency: {e}")
-        return None
-
-def clean_weight(weight_str):
-    """ Extract the numeric part of the weight (assumes input like '1/8 oz -'). """
-    weight_match = re.search(r'([\d/\.]+)', weight_str)
-    if weight_match:
-        return eval(weight_match.group(1))  # Convert fractions like '1/8' to decimal (3.5)
-    return None
+        time.sleep(pause)  # Allow content to load after each key press
 
-def clean_price(price_str):
-    """ Remove the '$' and convert to float. """
-    return float(price_str.replace('$', '').strip()) if price_str else None
+def scrape_current_page(driver, location, page_number=1):
+    # Keep a raw copy for re-parsing, then reuse the rows of an identical product list
+    html = page_cache.product_list_html(driver, 'div.shopitem')
+    # The whole page is archived, so a re-parse is not limited to the cards the selector matched today
+    archive.store_page(driver.page_source, ingest.active_run_id(), location, page_number, parse_products)
+    return parse_service.submit(html, location, parse_products)
 
-def scrape_current_page(driver, location):
-    html = driver.page_source
-    soup = BeautifulSoup(html, 'html.parser')
-    products = []
+def parse_products(html, location):
+    # Only build the tree for the product cards, with the fastest available tree builder
+    soup = BeautifulSoup(html, parse_service.TREE_BUILDER, parse_only=SoupStrainer('div', class_='shopitem'))
+    raw_variants = []
 
     # Find all product items based on the 'shopitem' class
     product_cards = soup.find_all('div', class_='shopitem')
 
     if not product_cards:
         print("No products found on the page.")
-        return products
+        return []
 
     print(f"Found {len(product_cards)} products on the page.")
 
@@ -94,7 +88,7 @@ def scrape_current_page(driver, location):
 
         # Extract the potency (THC percentage) from 'shopitem__strain-thc'
         potency_tag = product.find('p', class_='shopitem__strain-thc')
-        potency = clean_potency(potency_tag.text.strip()) if potency_tag else None
+        potency = potency_tag.text.strip() if potency_tag else None
 
         # Extract the brand information
         brand_tag = product.find('p', class_='shopitem__brand')
@@ -112,35 +106,27 @@ def scrape_current_page(driver, location):
             price_tag = option.find('p', class_='shopitem__listPrices-productVariants-price')
 
             if weight_tag and price_tag:
-                weight = clean_weight(weight_tag.text.strip())
-                price = clean_price(price_tag.text.strip())
+                weight = weight_tag.text.strip()
+                price = price_tag.text.strip()
 
                 # Print debug info for each weight and price
                 print(f"Found weight: {weight}, price: {price} for product: {name}")
 
                 # Append each product weight and price as a separate entry
-                products.append({
-                    'name': name,
-                    'strain_type': strain_type,  # Store the strain type here (Indica, Sativa, Hybrid)
-                    'potency': potency,          # Store the THC percentage here
-                    'brand': brand,
-                    'weight': weight,
-                    'price': price,
-                    'location': location
-                })
+                raw_variants.append((name, brand, strain_type, potency, weight, price))
 
+    # Convert the page's potency, weight and price labels in one batch
+    products = normalize.page_variants(raw_variants, location)
     print(f"Scraped {len(products)} products.")
     return products
 
-# Updated function to handle pagination and scrape all pages
+# Generator that handles pagination and yields the products of each page as it is scraped
 def scrape_all_pages(driver, location):
-    all_products = []
-
     while True:
         send_page_down(driver, num_times=15)  # Scroll down enough to load products
 
-        products = scrape_current_page(driver, location)
-        all_products.extend(products)
+        # Hand the page to the caller before navigating so it is stored first
+        yield scrape_current_page(driver, location)
 
         try:
             # Scroll to the next button to make sure it's in view
@@ -154,7 +140,8 @@ def scrape_all_pages(driver, location):
             # Add a small wait before clicking to ensure it’s clickable
             time.sleep(2)
 
-            # Click the next button
+            # Click the next button once the domain's rate limit allows another page load
+            rate_limit.acquire(driver.current_url)
             next_button.click()
 
             # Wait for the next page to load
@@ -163,34 +150,13 @@ def scrape_all_pages(driver, location):
             print(f"Reached the last page or encountered an error: {e}")
             break
 
-    return all_products
-
-# Function to insert products into the SQLite database
-def insert_into_database(products):
-    try:
-        conn = sqlite3.connect('../dispensary.db')
-        cursor = conn.cursor()
-
-        for product in products:
-            cursor.execute('''
-                INSERT INTO flower (Product, Brand, Potency, Weight, Price, StrainType, Location)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                product['name'],
-                product['brand'],
-                product['potency'],
-                product['weight'],
-                product['price'],
-                product['strain_type'],
-                product['location']
-            ))
-
-        conn.commit()
-        print(f"Inserted {len(products)} products into the database.")
-    except Exception as e:
-        print(f"Error inserting into database: {e}")
-    finally:
-        conn.close()
+# Function to stage one page of products in the SQLite database
+def insert_into_database(products, location, page_number, seen_keys):
+    # Rows and the page checkpoint are committed together, in a transaction the writer thread
+    # shares with pages from any other scraper running in this process. A failed write raises, so
+    # the location is left unpublished for a resume to finish from its last committed page
+    count = db_writer.write_page(products, location, page_number, seen_keys)
+    print(f"Inserted {count} products into the database.")
 
 # Function to handle age verification
 def handle_age_verification(driver):
@@ -211,39 +177,50 @@ def handle_age_verification(driver):
     except Exception as e:
         print(f"Error handling age verification: {e}. Proceeding with scrape.")
 
-def scrape_data(urls_and_locations):
+def scrape_data(urls_and_locations, resume=False, timing=None):
+    timing = {**TIMING, **(timing or {})}
     driver_path = '../chromedriver.exe'  # Replace with your actual path to chromedriver
     service = Service(driver_path)
 
     # Initialize the Selenium WebDriver
     driver = webdriver.Chrome(service=service)
+    try:
+        if timing['page_timeout']:
+            driver.set_page_load_timeout(timing['page_timeout'])
 
-    for url, location in urls_and_locations:
-        print(f"Scraping data for: {location}")
-
-        driver.get(url)
-        driver.implicitly_wait(15)
+        for url, location in urls_and_locations:
+            start_page, seen_keys = db_writer.begin_location(location, resume)
+            if start_page is None:
+                continue
 
-        handle_age_verification(driver)
+            print(f"Scraping data for: {location}")
 
-        # Ensure scrolling happens to load all products
-        send_page_down(driver, num_times=20)  # Scroll the page down to load products
+            rate_limit.load(driver, url)  # Waits for the domain's rate limit before loading
+            driver.implicitly_wait(timing['implicit_wait'])
 
-        # Scrape the current page after scrolling
-        all_products = scrape_current_page(driver, location)
+            handle_age_verification(driver)
 
-        # If no products are found, output a message
-        if not all_products:
-            print("No products found after scrolling.")
+            # Ensure scrolling happens to load all products
+            send_page_down(driver, timing['scroll_presses'], timing['scroll_pause'])  # Scroll the page down to load products
 
-        # Insert the products into the database
-        insert_into_database(all_products)
+            # Scrape the current page after scrolling
+            page = scrape_current_page(driver, location)
 
-    driver.quit()
+            # Insert the products into the database and swap them into the flower table,
+            # unless the menu is unchanged since the last run
+            db_writer.store_location(iter([page]), location, 1, seen_keys, insert_into_database)
+    finally:
+        # Close the browser even when the scrape fails, so a retry does not leave it running
+        driver.quit()
 
+# Scrape these sites on their own. Run from writers/, where the ../dispensary.db and
+# ../chromedriver.exe paths resolve, as: PYTHONPATH=.. python -m writers.high_profile_writers
 if __name__ == '__main__':
-    # List of URLs and their corresponding location names
+    # Imported again under its package name, so the parser is archived, cached and sent to the
+    # parse workers as writers.high_profile_writers.parse_products rather than __main__.parse_products
+    from writers import high_profile_writers
+
     urls_and_locations = [
         ('https://highprofilecannabis.com/shop/cape-girardeau/flower', 'High Profile'),
     ]
-    scrape_data(urls_and_locations)
+    high_profile_writers.scrape_data(urls_and_locations)
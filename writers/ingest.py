@@ -0,0 +1,276 @@
+import json
+import sqlite3
+import time
+from itertools import islice
+
+from writers import changes, compare, deals, encoding, quality, search
+
+DB_PATH = '../dispensary.db'
+
+# Number of rows sent to SQLite per executemany call
+BATCH_SIZE = 250
+
+FLOWER_COLUMNS = 'Product, Brand, Potency, Weight, Price, StrainType, Location'
+
+INSERT_SQL = '''
+    INSERT INTO {table} (Product, Brand, Potency, Weight, Price, StrainType, Location)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Create the per-location checkpoint table and the staging table for pages of unfinished scrapes
+def create_checkpoint_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_checkpoint (
+            Location TEXT PRIMARY KEY,
+            LastPage INTEGER,
+            RowCount INTEGER,
+            UpdatedAt REAL
+        )
+    ''')
+    add_missing_columns(cursor, 'scrape_checkpoint', {
+        'SeenKeys': "TEXT DEFAULT '[]'",
+        'Complete': 'INTEGER DEFAULT 0',
+    })
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS flower_partial (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Product TEXT,
+            Brand TEXT,
+            Potency REAL,
+            Weight REAL,
+            Price REAL,
+            StrainType TEXT,
+            Location TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_flower_partial_location ON flower_partial (Location)')
+
+# Create the table of scrape runs and the dictionary-encoded flower tables, whose rows are
+# tagged with the run that published them
+def create_run_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_runs (
+            RunId INTEGER PRIMARY KEY AUTOINCREMENT,
+            StartedAt REAL,
+            FinishedAt REAL,
+            Published INTEGER DEFAULT 0,
+            Skipped INTEGER DEFAULT 0,
+            SecondsSaved REAL DEFAULT 0
+        )
+    ''')
+    add_missing_columns(cursor, 'scrape_runs', {'PublishedAt': 'REAL'})
+    encoding.create_encoded_tables(cursor)
+
+    # Databases published before the comparison index existed get one built from their rows
+    if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'compare_index'").fetchone():
+        compare.rebuild_index(cursor)
+    search.create_search_tables(cursor)
+    deals.create_deal_tables(cursor)
+
+def add_missing_columns(cursor, table, columns):
+    """ Add any of the given columns that an older copy of the table is missing. """
+    existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+def product_key(product):
+    """ Key identifying one weight/price variant of a product within a location. """
+    return f"{product.name}|{product.brand}|{product.weight}"
+
+def unseen_products(products, seen_keys):
+    """ Skip variants already stored by an earlier page, recording the new ones in seen_keys. """
+    for product in products:
+        key = product_key(product)
+        if key not in seen_keys:
+            seen_keys.add(key)
+            yield product
+
+def product_rows(products):
+    """ Lazily convert ProductVariant records into insert tuples. """
+    for product in products:
+        yield product.row()
+
+def write_batches(cursor, products, batch_size=BATCH_SIZE, table='flower'):
+    """ Insert products in bounded executemany batches and return the number of rows written. """
+    rows = product_rows(products)
+    sql = INSERT_SQL.format(table=table)
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        cursor.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+def write_page(cursor, products, location, page_number, seen_keys):
+    """ Stage one page of a location's scrape and checkpoint it in the same transaction. """
+    create_checkpoint_table(cursor)
+    count = write_batches(cursor, unseen_products(products, seen_keys), table='flower_partial')
+    save_checkpoint(cursor, location, page_number, count, seen_keys)
+    return count
+
+def save_checkpoint(cursor, location, page_number, row_count, seen_keys=()):
+    """ Record the last page written for a location; page 1 starts a new count. """
+    create_checkpoint_table(cursor)
+    cursor.execute('''
+        INSERT INTO scrape_checkpoint (Location, LastPage, RowCount, UpdatedAt, SeenKeys, Complete)
+        VALUES (?, ?, ?, ?, ?, 0)
+        ON CONFLICT(Location) DO UPDATE SET
+            LastPage = excluded.LastPage,
+            RowCount = CASE WHEN excluded.LastPage = 1 THEN excluded.RowCount
+                            ELSE RowCount + excluded.RowCount END,
+            UpdatedAt = excluded.UpdatedAt,
+            SeenKeys = excluded.SeenKeys,
+            Complete = 0
+    ''', (location, page_number, row_count, time.time(), json.dumps(sorted(seen_keys))))
+
+def load_checkpoint(cursor, location):
+    """ Return the stored checkpoint for a location as a dict, or None. """
+    create_checkpoint_table(cursor)
+    row = cursor.execute('''
+        SELECT LastPage, RowCount, SeenKeys, Complete FROM scrape_checkpoint WHERE Location = ?
+    ''', (location,)).fetchone()
+    if row is None:
+        return None
+    return {
+        'last_page': row[0],
+        'row_count': row[1],
+        'seen_keys': set(json.loads(row[2] or '[]')),
+        'complete': bool(row[3]),
+    }
+
+def reset_location(cursor, location, resume=False):
+    """ Prepare a location for scraping and return (start_page, seen_keys).
+
+    start_page is None when resuming and the location already finished. Without
+    resume any staged pages from an earlier attempt are discarded.
+    """
+    checkpoint = load_checkpoint(cursor, location)
+    if resume and checkpoint:
+        if checkpoint['complete']:
+            print(f"{location} already finished in the interrupted run, skipping.")
+            return None, set()
+        print(f"Resuming {location} after page {checkpoint['last_page']} "
+              f"({checkpoint['row_count']} products staged).")
+        return checkpoint['last_page'] + 1, checkpoint['seen_keys']
+
+    cursor.execute('DELETE FROM flower_partial WHERE Location = ?', (location,))
+    cursor.execute('DELETE FROM scrape_checkpoint WHERE Location = ?', (location,))
+    return 1, set()
+
+def current_run_id(cursor):
+    """ Return the id of the run in progress, or None when a writer is run on its own. """
+    create_run_tables(cursor)
+    row = cursor.execute('''
+        SELECT RunId FROM scrape_runs WHERE FinishedAt IS NULL ORDER BY RunId DESC LIMIT 1
+    ''').fetchone()
+    return row[0] if row else None
+
+def active_run_id(db_path=DB_PATH):
+    """ Open the database just long enough to look up the run in progress. """
+    try:
+        conn = sqlite3.connect(db_path)
+        return current_run_id(conn.cursor())
+    finally:
+        conn.close()
+
+def start_run(resume=False, db_path=DB_PATH):
+    """ Open a new scrape run, or reopen the unfinished one when resuming, and return its id. """
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        # WAL lets the read-only API keep answering while the run writes
+        cursor.execute('PRAGMA journal_mode = WAL')
+
+        run_id = current_run_id(cursor)
+        if not (resume and run_id):
+            cursor.execute('INSERT INTO scrape_runs (StartedAt) VALUES (?)', (time.time(),))
+            run_id = cursor.lastrowid
+            conn.commit()
+        return run_id
+    finally:
+        conn.close()
+
+def finish_run(run_id, db_path=DB_PATH):
+    """ Mark a run as published and print its report. """
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        create_run_tables(cursor)
+
+        # Ranks and listing counts span every store, so they are rebuilt once the last location is in
+        rebuild_indexes(cursor)
+        cursor.execute('UPDATE scrape_runs SET FinishedAt = ? WHERE RunId = ?', (time.time(), run_id))
+        conn.commit()
+
+        started, finished, published, skipped, saved = cursor.execute('''
+            SELECT StartedAt, FinishedAt, Published, Skipped, SecondsSaved FROM scrape_runs WHERE RunId = ?
+        ''', (run_id,)).fetchone()
+        print(f"Run {run_id} finished in {finished - started:.0f}s: {published} locations published, "
+              f"{skipped} unchanged menus skipped, about {saved:.0f}s saved.")
+    finally:
+        conn.close()
+
+def rebuild_indexes(cursor):
+    """ Re-rank every store's published variants for comparison queries and recount the autocomplete names. """
+    compare.rebuild_index(cursor)
+    search.rebuild_names(cursor)
+
+def publish_staged(cursor, location):
+    """ Replace a location's rows in flower with its staged pages and mark its checkpoint complete.
+
+    Runs in the caller's transaction; when it raises, rolling that back leaves the previous rows
+    and the staged pages in place.
+    """
+    create_checkpoint_table(cursor)
+    run_id = current_run_id(cursor)
+
+    # Suspicious rows go to flower_quarantine instead of being published
+    quality.quarantine_staged(cursor, location, run_id)
+
+    staged = cursor.execute(f'''
+        SELECT {FLOWER_COLUMNS} FROM flower_partial WHERE Location = ? ORDER BY id
+    ''', (location,)).fetchall()
+    # New variants and price changes are kept for the alert engine and scored against the
+    # location's recent prices before the old rows go
+    changed = changes.record_changes(cursor, location, staged, run_id)
+    deals.detect_deals(cursor, location, run_id, changed)
+
+    # Brand, strain type and location are stored as dictionary codes
+    cursor.execute('DELETE FROM flower_rows WHERE LocationId = ?',
+                   (encoding.encode(cursor, 'Location', location),))
+    cursor.executemany('''
+        INSERT INTO flower_rows (Product, BrandId, Potency, Weight, Price, StrainTypeId, LocationId, RunId)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', list(encoding.encode_rows(cursor, staged, run_id)))
+    count = len(staged)
+    cursor.execute('DELETE FROM flower_partial WHERE Location = ?', (location,))
+    # flower_fts is kept up to date by triggers. A run re-ranks every store's variants and
+    # recounts the autocomplete names once in finish_run; a writer run on its own has no run
+    # to finish, so it does so now
+    if run_id is None:
+        rebuild_indexes(cursor)
+    cursor.execute('UPDATE scrape_checkpoint SET Complete = 1, UpdatedAt = ? WHERE Location = ?',
+                   (time.time(), location))
+    cursor.execute('UPDATE scrape_runs SET Published = Published + 1, PublishedAt = ? WHERE RunId = ?',
+                   (time.time(), run_id))
+    print(f"Published {count} products for {location}.")
+    return count
+
+def carry_forward_staged(cursor, location, seconds_saved):
+    """ Keep a location's previous rows, dropping anything staged for it, and count the skip. """
+    create_checkpoint_table(cursor)
+    run_id = current_run_id(cursor)
+
+    cursor.execute('DELETE FROM flower_partial WHERE Location = ?', (location,))
+    cursor.execute('UPDATE scrape_checkpoint SET Complete = 1, UpdatedAt = ? WHERE Location = ?',
+                   (time.time(), location))
+    changes.record_check(cursor, location, False)
+    cursor.execute('''
+        UPDATE scrape_runs SET Skipped = Skipped + 1, SecondsSaved = SecondsSaved + ? WHERE RunId = ?
+    ''', (seconds_saved, run_id))
+    print(f"{location} menu is unchanged since the last run, carrying its rows forward "
+          f"(about {seconds_saved:.0f}s saved).")
@@ -0,0 +1,240 @@
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+
+QUEUE_PATH = '../job_queue.db'
+
+# WAL lets workers claim while others write, but needs every worker on the same host; use
+# 'DELETE' when workers on several machines share the file over a network filesystem
+JOURNAL_MODE = 'WAL'
+
+# Seconds a claimed job stays leased without a heartbeat before another worker may take it over
+LEASE_SECONDS = 120
+# Heartbeats per lease, so a single late one does not lose the job
+HEARTBEATS_PER_LEASE = 4
+# Retry delay after the first failure, doubled after each further one up to MAX_BACKOFF
+BASE_BACKOFF = 30
+MAX_BACKOFF = 3600
+MAX_ATTEMPTS = 5
+# Seconds an idle worker waits before looking for work again
+IDLE_SECONDS = 0.25
+
+# Create the jobs table; a job is one location's whole menu, as a location is only ever published whole
+def create_queue_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            JobId INTEGER PRIMARY KEY AUTOINCREMENT,
+            RunId INTEGER,
+            Location TEXT,
+            Domain TEXT,
+            Category TEXT,
+            Status TEXT DEFAULT 'queued',
+            Attempts INTEGER DEFAULT 0,
+            MaxAttempts INTEGER,
+            AvailableAt REAL,
+            LeaseOwner TEXT,
+            LeaseExpiresAt REAL,
+            Result TEXT,
+            Error TEXT,
+            CreatedAt REAL,
+            FinishedAt REAL
+        )
+    ''')
+    # Claims seek the oldest available job and expired leases without scanning finished jobs
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_available ON jobs (Status, AvailableAt)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs (Status, LeaseExpiresAt)')
+    # Queues created before jobs recorded their site's domain
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(jobs)')}
+    if 'Domain' not in columns:
+        cursor.execute('ALTER TABLE jobs ADD COLUMN Domain TEXT')
+    # Claims count the jobs each domain already has leased
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_domain ON jobs (Status, Domain)')
+    # Runs whose last job has finished, so exactly one worker wraps each run up
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            RunId INTEGER PRIMARY KEY,
+            FinishedAt REAL
+        )
+    ''')
+
+def connect(path=QUEUE_PATH):
+    """ Open the queue in autocommit mode; every statement that changes a job is atomic on its own. """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute(f'PRAGMA journal_mode = {JOURNAL_MODE}')
+    create_queue_tables(conn.cursor())
+    return conn
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+def enqueue(conn, location, category='flower', run_id=None, max_attempts=MAX_ATTEMPTS, domain=None):
+    now = time.time()
+    return conn.execute('''
+        INSERT INTO jobs (RunId, Location, Domain, Category, MaxAttempts, AvailableAt, CreatedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (run_id, location, domain, category, max_attempts, now, now)).lastrowid
+
+def give_up_expired(conn):
+    """ Fail jobs whose last allowed attempt lost its lease, rather than retrying them again.
+
+    Returns the jobs given up on, so the caller can wrap up any run they were the last of.
+    """
+    now = time.time()
+    cursor = conn.execute('''
+        UPDATE jobs SET Status = 'failed', Error = 'lease expired', FinishedAt = ?, LeaseExpiresAt = NULL
+        WHERE Status = 'leased' AND LeaseExpiresAt < ? AND Attempts >= MaxAttempts
+        RETURNING JobId, RunId, Location
+    ''', (now, now))
+    jobs = [dict(zip(('job_id', 'run_id', 'location'), row)) for row in cursor.fetchall()]
+    cursor.close()
+    return jobs
+
+def claim(conn, owner, lease_seconds=LEASE_SECONDS, max_leased=None, domain_concurrency=None,
+          domain_limits=None):
+    """ Lease the oldest job that is available, or whose last worker stopped heartbeating.
+
+    max_leased caps the jobs leased at once across every worker, and domain_concurrency (or
+    domain_limits[domain]) the jobs of one domain; a job over either limit waits in the queue.
+    Returns the job as a dict, or None when there is nothing to do. The claim is a single
+    UPDATE ... RETURNING, so two workers can never lease the same job or overrun a limit.
+    """
+    now = time.time()
+    cursor = conn.execute('''
+        UPDATE jobs SET Status = 'leased', Attempts = Attempts + 1, LeaseOwner = ?, LeaseExpiresAt = ?
+        WHERE JobId = (
+            SELECT JobId FROM (
+                SELECT JobId, Domain, AvailableAt FROM jobs WHERE Status = 'queued' AND AvailableAt <= ?
+                UNION ALL
+                SELECT JobId, Domain, LeaseExpiresAt FROM jobs
+                WHERE Status = 'leased' AND LeaseExpiresAt < ? AND Attempts < MaxAttempts
+            ) AS candidate
+            WHERE (? IS NULL OR (SELECT COUNT(*) FROM jobs
+                                 WHERE Status = 'leased' AND LeaseExpiresAt >= ?) < ?)
+              AND (COALESCE(json_extract(?, '$."' || candidate.Domain || '"'), ?) IS NULL
+                   OR (SELECT COUNT(*) FROM jobs AS active
+                       WHERE active.Status = 'leased' AND active.LeaseExpiresAt >= ?
+                         AND active.Domain IS candidate.Domain)
+                      < COALESCE(json_extract(?, '$."' || candidate.Domain || '"'), ?))
+            ORDER BY AvailableAt, JobId LIMIT 1
+        )
+        RETURNING JobId, RunId, Location, Category, Attempts
+    ''', (owner, now + lease_seconds, now, now, max_leased, now, max_leased, json.dumps(domain_limits or {}),
+          domain_concurrency, now, json.dumps(domain_limits or {}), domain_concurrency))
+    row = cursor.fetchone()
+    cursor.close()
+    if row is None:
+        return None
+    return dict(zip(('job_id', 'run_id', 'location', 'category', 'attempts'), row))
+
+def heartbeat(conn, job_id, owner, lease_seconds=LEASE_SECONDS):
+    """ Extend a lease; False means it expired and another worker has taken the job over. """
+    return conn.execute('''
+        UPDATE jobs SET LeaseExpiresAt = ? WHERE JobId = ? AND LeaseOwner = ? AND Status = 'leased'
+    ''', (time.time() + lease_seconds, job_id, owner)).rowcount == 1
+
+def complete(conn, job_id, owner, result=None):
+    return conn.execute('''
+        UPDATE jobs SET Status = 'done', Result = ?, FinishedAt = ?, LeaseExpiresAt = NULL
+        WHERE JobId = ? AND LeaseOwner = ? AND Status = 'leased'
+    ''', (json.dumps(result), time.time(), job_id, owner)).rowcount == 1
+
+def backoff(attempts):
+    """ Seconds before a job that has failed attempts times is tried again, with jitter. """
+    return min(BASE_BACKOFF * 2 ** (attempts - 1), MAX_BACKOFF) * random.uniform(0.5, 1)
+
+def fail(conn, job_id, owner, error):
+    """ Put a failed job back in the queue after its backoff, or give up after its last attempt.
+
+    Returns the job's new status, or None when its lease had already been lost.
+    """
+    now = time.time()
+    attempts, max_attempts = conn.execute('SELECT Attempts, MaxAttempts FROM jobs WHERE JobId = ?',
+                                          (job_id,)).fetchone()
+    if attempts >= max_attempts:
+        status, available_at, finished_at = 'failed', None, now
+    else:
+        status, available_at, finished_at = 'queued', now + backoff(attempts), None
+    updated = conn.execute('''
+        UPDATE jobs SET Status = ?, AvailableAt = ?, FinishedAt = ?, Error = ?, LeaseExpiresAt = NULL
+        WHERE JobId = ? AND LeaseOwner = ? AND Status = 'leased'
+    ''', (status, available_at, finished_at, error, job_id, owner)).rowcount
+    return status if updated else None
+
+def pending(conn, run_id=None):
+    """ Number of jobs not yet done or given up on, of one run or of all. """
+    return conn.execute('''
+        SELECT COUNT(*) FROM jobs WHERE Status IN ('queued', 'leased') AND (? IS NULL OR RunId = ?)
+    ''', (run_id, run_id)).fetchone()[0]
+
+def finish_run(conn, run_id):
+    """ True for exactly one caller once none of a run's jobs are left; that caller wraps the run up. """
+    if run_id is None or pending(conn, run_id):
+        return False
+    return conn.execute('INSERT OR IGNORE INTO job_runs (RunId, FinishedAt) VALUES (?, ?)',
+                        (run_id, time.time())).rowcount == 1
+
+def counts(conn):
+    return dict(conn.execute('SELECT Status, COUNT(*) FROM jobs GROUP BY Status').fetchall())
+
+def keep_alive(path, job_id, owner, lease_seconds, stop):
+    """ Heartbeat a job's lease from its own connection until stop is set or the lease is lost. """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        while not stop.wait(lease_seconds / HEARTBEATS_PER_LEASE):
+            if not heartbeat(conn, job_id, owner, lease_seconds):
+                print(f"Lost the lease on job {job_id}.")
+                return
+    finally:
+        conn.close()
+
+def work(handler, path=QUEUE_PATH, owner=None, lease_seconds=LEASE_SECONDS, until_empty=False,
+         on_finished=None, limits=None):
+    """ Claim jobs and run handler(job) on each until interrupted, or until the queue is empty.
+
+    handler's return value is stored as the job's result; an exception fails the attempt. on_finished,
+    when given, is called with (conn, job) after each job is done or given up on. limits holds claim's
+    max_leased, domain_concurrency and domain_limits. Returns the number of jobs completed.
+    """
+    owner = owner or worker_name()
+    conn = connect(path)
+    done = 0
+    try:
+        while True:
+            # A job abandoned on its last attempt may have been the last of its run
+            for expired in give_up_expired(conn):
+                print(f"Job {expired['job_id']} ({expired['location']}) lost its lease on its last attempt.")
+                if on_finished:
+                    on_finished(conn, expired)
+
+            job = claim(conn, owner, lease_seconds, **(limits or {}))
+            if job is None:
+                if until_empty and not pending(conn):
+                    return done
+                time.sleep(IDLE_SECONDS)
+                continue
+
+            stop = threading.Event()
+            beat = threading.Thread(target=keep_alive, args=(path, job['job_id'], owner, lease_seconds, stop),
+                                    daemon=True)
+            beat.start()
+            try:
+                result = handler(job)
+            except Exception as e:
+                print(f"Job {job['job_id']} ({job['location']}) failed attempt {job['attempts']}: {e}")
+                if fail(conn, job['job_id'], owner, f"{type(e).__name__}: {e}") == 'failed' and on_finished:
+                    on_finished(conn, job)
+                continue
+            finally:
+                stop.set()
+                beat.join()
+
+            if complete(conn, job['job_id'], owner, result):
+                done += 1
+                if on_finished:
+                    on_finished(conn, job)
+    finally:
+        conn.close()
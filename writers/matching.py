@@ -0,0 +1,190 @@
+import re
+import sqlite3
+import time
+
+from writers import ingest
+
+# Words that say how a product is packed or labelled rather than what it is
+PACKING_WORDS = {'flower', 'prepack', 'pre', 'pack', 'packed', 'packaged', 'prepackaged', 'bulk',
+                 'hybrid', 'indica', 'sativa', 'oz', 'g', 'gram', 'grams', 'eighth', 'quarter', 'half'}
+
+# Words brands are listed with or without, e.g. 'Proper Cannabis' and 'Proper'
+BRAND_WORDS = {'cannabis', 'co', 'company', 'the'}
+
+# Words naming a different cut of the same strain; a strain's popcorn or pre-rolls are not its flower
+FORM_WORDS = {
+    'popcorn': 'smalls', 'smalls': 'smalls', 'budlets': 'smalls', 'mini': 'smalls', 'minis': 'smalls',
+    'preroll': 'preroll', 'prerolls': 'preroll', 'roll': 'preroll', 'rolls': 'preroll',
+    'shake': 'shake', 'trim': 'shake',
+}
+
+WORD = re.compile(r'[a-z0-9#]+')
+WEIGHT = re.compile(r'\b\d+(?:\.\d+)?\s*(?:g|oz|gram|grams)\b|\b\d+\s*/\s*\d+\s*(?:oz)?\b')
+NUMBER = re.compile(r'\d+')
+
+# Dice similarity of character trigrams above which two names in a brand are the same product
+MATCH_THRESHOLD = 0.8
+
+# Create the canonical products and the table mapping every listed (product, brand) to one
+def create_matching_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS canonical_product (
+            CanonicalId INTEGER PRIMARY KEY AUTOINCREMENT,
+            BrandKey TEXT,
+            Form TEXT,
+            NameKey TEXT,
+            Brand TEXT,
+            Product TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_canonical_product_brand ON canonical_product (BrandKey, Form)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_identity (
+            Product TEXT,
+            Brand TEXT,
+            CanonicalId INTEGER,
+            Score REAL,
+            MatchedAt REAL,
+            PRIMARY KEY (Product, Brand)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_identity_canonical ON product_identity (CanonicalId)')
+    # Listings of a matched product are looked up by name
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_flower_rows_product ON flower_rows (Product)')
+
+def brand_key(brand):
+    """ 'Proper Cannabis' -> 'proper', 'C4 (Carroll County Cannabis Co.)' -> 'c4 carroll county' """
+    return ' '.join(word for word in WORD.findall((brand or '').lower()) if word not in BRAND_WORDS)
+
+def name_key(product, brand):
+    """ Reduce a listed name to (form, the words naming the product).
+
+    'Codes: Flower | Dosilato | 3.5g', 'CODES - PREPACK - 3.5G - DOSILATO - HYBRID' and
+    'Dosilato' all become ('flower', 'dosilato'); 'Dosilato Popcorn' is ('smalls', 'dosilato').
+    """
+    name = product.lower()
+    # 'Codes: Flower | ...' and 'GDF: Popcorn Flower | ...' lead with a store label
+    if ':' in name:
+        label, name = name.split(':', 1)
+        name = ' '.join(word for word in WORD.findall(label) if word in FORM_WORDS) + ' ' + name
+    name = WEIGHT.sub(' ', name)
+    # Every word of the brand as listed, including the 'Cannabis' brand_key leaves out
+    skip = PACKING_WORDS | set(WORD.findall((brand or '').lower()))
+    words = WORD.findall(name)
+    forms = sorted({FORM_WORDS[word] for word in words if word in FORM_WORDS})
+    words = [word for word in words if word not in skip and word not in FORM_WORDS]
+    return '+'.join(forms) or 'flower', ' '.join(words) or name.strip()
+
+def trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class BrandBlock:
+    """ The canonical products of one brand and form with a trigram index over their names, so a new
+    name is only scored against names it shares trigrams with.
+    """
+    def __init__(self):
+        self.by_name = {}
+        self.grams = {}
+        self.numbers = {}
+        self.postings = {}
+
+    def add(self, canonical_id, key):
+        self.by_name.setdefault(key, canonical_id)
+        grams = trigrams(key)
+        self.grams[canonical_id] = grams
+        self.numbers[canonical_id] = NUMBER.findall(key)
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(canonical_id)
+
+    def match(self, key):
+        """ Return (canonical id, score) of the most similar name, or (None, 0) when nothing is close. """
+        if key in self.by_name:
+            return self.by_name[key], 1.0
+        grams = trigrams(key)
+        shared = {}
+        for gram in grams:
+            for canonical_id in self.postings.get(gram, ()):
+                shared[canonical_id] = shared.get(canonical_id, 0) + 1
+
+        # Numbered phenotypes ('Kiwi Candy #5' and '#19') only match the same number
+        numbers = NUMBER.findall(key)
+        best, best_score = None, 0.0
+        for canonical_id, count in shared.items():
+            if numbers and self.numbers[canonical_id] and numbers != self.numbers[canonical_id]:
+                continue
+            score = 2 * count / (len(grams) + len(self.grams[canonical_id]))
+            if score > best_score:
+                best, best_score = canonical_id, score
+        return (best, best_score) if best_score >= MATCH_THRESHOLD else (None, best_score)
+
+def load_block(cursor, key, form):
+    block = BrandBlock()
+    for canonical_id, name in cursor.execute('''
+        SELECT CanonicalId, NameKey FROM canonical_product WHERE BrandKey = ? AND Form = ? ORDER BY CanonicalId
+    ''', (key, form)):
+        block.add(canonical_id, name)
+    return block
+
+def rekey_canonical(cursor):
+    """ Recompute stored name keys that name_key no longer produces, so new names still find them. """
+    stale = []
+    for canonical_id, form, name, brand, product in cursor.execute(
+            'SELECT CanonicalId, Form, NameKey, Brand, Product FROM canonical_product').fetchall():
+        key = name_key(product, brand)
+        if key != (form, name):
+            stale.append((*key, canonical_id))
+    cursor.executemany('UPDATE canonical_product SET Form = ?, NameKey = ? WHERE CanonicalId = ?', stale)
+    return len(stale)
+
+def match_new_products(db_path=ingest.DB_PATH):
+    """ Give every published (product, brand) that has no canonical product yet one.
+
+    Only names not matched by an earlier run are looked at, and each is only compared with
+    the canonical products of its own brand and form.
+    """
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        create_matching_tables(cursor)
+        rekey_canonical(cursor)
+
+        unmatched = cursor.execute('''
+            SELECT DISTINCT f.Product, COALESCE(f.Brand, '') FROM flower f
+            LEFT JOIN product_identity p ON p.Product = f.Product AND p.Brand = COALESCE(f.Brand, '')
+            WHERE p.CanonicalId IS NULL AND f.Product IS NOT NULL
+            ORDER BY f.Product
+        ''').fetchall()
+
+        blocks = {}
+        identities = []
+        joined = 0
+        for product, brand in unmatched:
+            key = brand_key(brand)
+            form, name = name_key(product, brand)
+            block = blocks.get((key, form))
+            if block is None:
+                block = blocks[key, form] = load_block(cursor, key, form)
+
+            canonical_id, score = block.match(name)
+            if canonical_id is None:
+                cursor.execute('''
+                    INSERT INTO canonical_product (BrandKey, Form, NameKey, Brand, Product) VALUES (?, ?, ?, ?, ?)
+                ''', (key, form, name, brand, product))
+                canonical_id, score = cursor.lastrowid, 1.0
+                block.add(canonical_id, name)
+            else:
+                joined += 1
+            identities.append((product, brand, canonical_id, score, time.time()))
+
+        cursor.executemany('''
+            INSERT OR REPLACE INTO product_identity (Product, Brand, CanonicalId, Score, MatchedAt)
+            VALUES (?, ?, ?, ?, ?)
+        ''', identities)
+        conn.commit()
+
+        print(f"Matched {len(identities)} new product names: {joined} joined an existing product, "
+              f"{len(identities) - joined} new products.")
+        return len(identities)
+    finally:
+        conn.close()
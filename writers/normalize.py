@@ -0,0 +1,121 @@
+import re
+from functools import lru_cache
+
+from writers.records import ProductVariant
+from writers.units import OUNCE_IN_GRAMS
+
+NUMBER = re.compile(r'\d+(?:\.\d+)?|\.\d+')
+FRACTION = re.compile(r'(\d+)\s*/\s*(\d+)')
+# Unit right after a weight's number; ounces are converted to grams
+UNIT = re.compile(r'\s*(oz|ounces?|g|grams?)\b', re.IGNORECASE)
+OUNCE_NAMES = {'eighth': 0.125, 'quarter': 0.25, 'half': 0.5, 'ounce': 1.0}
+# A weight given with its unit inside a product name, e.g. 'CODES - PREPACK - 3.5G - DOSILATO'
+NAMED_WEIGHT = re.compile(r'(?:\d+\s*/\s*\d+|\d+(?:\.\d+)?|\.\d+)\s*(?:oz|ounces?|g|grams?)\b', re.IGNORECASE)
+
+# Menus only use a handful of distinct labels, so each one is converted once and remembered
+@lru_cache(maxsize=4096)
+def parse_potency(label):
+    """ 'THC: 30.69%' or '18.02%' -> 30.69 / 18.02 """
+    match = NUMBER.search(label)
+    if not match:
+        raise ValueError(f"no potency in {label!r}")
+    return float(match.group())
+
+@lru_cache(maxsize=4096)
+def parse_weight(label):
+    """ '1/8 oz' -> 3.5, '3.5g' -> 3.5, '1g' -> 1.0: grams, converted by the label's unit.
+
+    A label without a unit is read as ounces when it is a fraction ('1/8') and as grams
+    otherwise; 'Eighth', 'Half Ounce' and the like are read as fractions of an ounce.
+    """
+    fraction = FRACTION.search(label)
+    if fraction:
+        numerator, denominator = int(fraction.group(1)), int(fraction.group(2))
+        if denominator == 0:
+            raise ValueError(f"zero denominator in {label!r}")
+        amount, end = numerator / denominator, fraction.end()
+    else:
+        match = NUMBER.search(label)
+        if not match:
+            for name, ounces in OUNCE_NAMES.items():
+                if name in label.lower():
+                    return ounces * OUNCE_IN_GRAMS
+            raise ValueError(f"no weight in {label!r}")
+        amount, end = float(match.group()), match.end()
+
+    unit = UNIT.match(label, end)
+    if unit:
+        return amount * (OUNCE_IN_GRAMS if unit.group(1).lower().startswith('o') else 1.0)
+    return amount * OUNCE_IN_GRAMS if fraction else amount
+
+def weight_in_name(name):
+    """ Grams of the weight a product name states with its unit, or None when it states none. """
+    match = NAMED_WEIGHT.search(name or '')
+    return parse_weight(match.group()) if match else None
+
+@lru_cache(maxsize=4096)
+def parse_price(label):
+    """ '$1,027.50' -> 1027.5; a struck-through original price after the sale price is ignored. """
+    match = NUMBER.search(label.replace(',', ''))
+    if not match:
+        raise ValueError(f"no price in {label!r}")
+    return float(match.group())
+
+PARSERS = {
+    'potency': parse_potency,
+    'weight': parse_weight,
+    'price': parse_price,
+}
+
+def normalize_columns(columns):
+    """ Convert whole columns of raw labels at once.
+
+    columns maps 'potency', 'weight' and 'price' to lists of label strings (None for a
+    missing label). Each distinct label is resolved once. Returns the converted column
+    lists and an error report of (column, label, message) tuples; labels that fail to
+    convert become None instead of raising.
+    """
+    values = {}
+    errors = []
+    for column, labels in columns.items():
+        parse = PARSERS[column]
+        table = {None: None}
+        for label in set(labels):
+            if label in table:
+                continue
+            try:
+                table[label] = parse(label)
+            except ValueError as e:
+                table[label] = None
+                errors.append((column, label, str(e)))
+        values[column] = [table[label] for label in labels]
+    return values, errors
+
+def page_variants(raw_variants, location):
+    """ Build the ProductVariant records of a page from (name, brand, strain_type,
+    potency_label, weight_label, price_label) tuples.
+
+    Variants without a usable weight or price are dropped and reported rather than
+    aborting the page.
+    """
+    if not raw_variants:
+        return []
+
+    names, brands, strain_types, potency, weight, price = zip(*raw_variants)
+    values, errors = normalize_columns({'potency': potency, 'weight': weight, 'price': price})
+
+    products = []
+    dropped = 0
+    for name, brand, strain_type, potency, weight, price in zip(
+            names, brands, strain_types, values['potency'], values['weight'], values['price']):
+        if weight is None or price is None:
+            dropped += 1
+            continue
+        products.append(ProductVariant(name, brand, strain_type, potency, weight, price, location))
+
+    if errors:
+        print(f"Normalization report for {location}: {len(errors)} unreadable labels, "
+              f"{dropped} variants dropped.")
+        for column, label, message in errors:
+            print(f"  {column}: {message}")
+    return products
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from writers import records
+
+CACHE_PATH = '../page_cache.db'
+
+# Upper bound on the stored parsed rows, least recently used pages are evicted past it
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# Bump when a parser changes so pages cached by the old parser are not reused
+CACHE_VERSION = 2
+
+# Hits and misses per location for the current process, counted under _lock as several
+# scrapers may run in threads of one process
+stats = {}
+_lock = threading.Lock()
+
+# Create the table of parsed pages keyed by the hash of their product card HTML
+def create_cache_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS page_cache (
+            Hash TEXT PRIMARY KEY,
+            Rows TEXT,
+            Size INTEGER,
+            LastUsed REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_page_cache_last_used ON page_cache (LastUsed)')
+
+def page_hash(html, parse):
+    """ Content address of a page for a given parser. """
+    digest = hashlib.sha1(f"{CACHE_VERSION}:{parse.__module__}.{parse.__name__}:".encode('utf-8'))
+    digest.update(html.encode('utf-8'))
+    return digest.hexdigest()
+
+def lookup(key, location, cache_path=CACHE_PATH):
+    """ Return the cached products of a page for a location, or None on a miss. """
+    try:
+        conn = sqlite3.connect(cache_path)
+        cursor = conn.cursor()
+        create_cache_table(cursor)
+
+        row = cursor.execute('SELECT Rows FROM page_cache WHERE Hash = ?', (key,)).fetchone()
+        if row is None:
+            count(location, 'misses')
+            return None
+
+        count(location, 'hits')
+        cursor.execute('UPDATE page_cache SET LastUsed = ? WHERE Hash = ?', (time.time(), key))
+        conn.commit()
+        # Rows are stored without the location so identical pages are shared between stores
+        return [records.from_fields(fields, location) for fields in json.loads(row[0])]
+    finally:
+        conn.close()
+
+def count(location, outcome):
+    with _lock:
+        stats.setdefault(location, {'hits': 0, 'misses': 0})[outcome] += 1
+
+def store(key, products, cache_path=CACHE_PATH):
+    """ Cache the parsed products of a page, evicting old pages to stay within the size bound. """
+    try:
+        conn = sqlite3.connect(cache_path)
+        cursor = conn.cursor()
+        create_cache_table(cursor)
+
+        rows = json.dumps([product.fields() for product in products])
+        cursor.execute('''
+            INSERT OR REPLACE INTO page_cache (Hash, Rows, Size, LastUsed) VALUES (?, ?, ?, ?)
+        ''', (key, rows, len(rows), time.time()))
+        evict(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+
+def evict(cursor, max_bytes=MAX_CACHE_BYTES):
+    """ Delete least recently used pages until the cache fits in max_bytes. """
+    total = cursor.execute('SELECT COALESCE(SUM(Size), 0) FROM page_cache').fetchone()[0]
+    if total <= max_bytes:
+        return
+
+    expired = []
+    for key, size in cursor.execute('SELECT Hash, Size FROM page_cache ORDER BY LastUsed'):
+        if total <= max_bytes:
+            break
+        expired.append((key,))
+        total -= size
+    cursor.executemany('DELETE FROM page_cache WHERE Hash = ?', expired)
+
+def report():
+    """ Print the page cache hit rate of each location scraped by this process. """
+    for location, counts in list(stats.items()):
+        pages = counts['hits'] + counts['misses']
+        print(f"Page cache for {location}: {counts['hits']}/{pages} pages reused "
+              f"({100 * counts['hits'] / pages:.0f}% hit rate).")
+
+def product_list_html(driver, card_selector):
+    """ Return the outerHTML of every product card on the page, which is all the parsers read. """
+    return driver.execute_script(
+        "return Array.from(document.querySelectorAll(arguments[0])).map(e => e.outerHTML).join('');",
+        card_selector
+    )
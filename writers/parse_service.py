@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from writers import page_cache, records
+
+# Use lxml's tree builder when it is installed, it is several times faster than html.parser
+try:
+    import lxml  # noqa: F401
+    TREE_BUILDER = 'lxml'
+except ImportError:
+    TREE_BUILDER = 'html.parser'
+
+# Pages parsed and CPU seconds spent per parser mode in this process
+stats = {}
+
+_executor = None
+# Guards the pool's creation and stats; scrapers submit pages from several threads
+_lock = threading.Lock()
+
+def executor():
+    """ Return the shared parse pool, started on first use with one worker per core. """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+        return _executor
+
+def parse_page(parse, data, location):
+    """ Parse raw HTML bytes in a worker and return (rows, cpu_seconds, mode). """
+    started = time.process_time()
+    products = parse(data.decode('utf-8'), location)
+    rows = [product.fields() for product in products]
+    return rows, time.process_time() - started, TREE_BUILDER
+
+def submit(html, location, parse):
+    """ Queue a page for parsing without waiting on it and return a handle for result().
+
+    Pages already in the page cache resolve immediately without touching the pool.
+    """
+    key = page_cache.page_hash(html, parse)
+    products = page_cache.lookup(key, location)
+    if products is not None:
+        return key, location, None, products
+    return key, location, executor().submit(parse_page, parse, html.encode('utf-8'), location), None
+
+def result(handle):
+    """ Wait for a page submitted with submit() and return its ProductVariant records. """
+    key, location, future, products = handle
+    if future is None:
+        record('cache', 0)
+        return products
+
+    rows, cpu_seconds, mode = future.result()
+    record(mode, cpu_seconds)
+    products = [records.from_fields(row, location) for row in rows]
+    page_cache.store(key, products)
+    return products
+
+def record(mode, cpu_seconds):
+    with _lock:
+        counts = stats.setdefault(mode, {'pages': 0, 'cpu_seconds': 0.0})
+        counts['pages'] += 1
+        counts['cpu_seconds'] += cpu_seconds
+
+def report():
+    """ Print the CPU time spent parsing per parser mode. """
+    for mode, counts in list(stats.items()):
+        average = 1000 * counts['cpu_seconds'] / counts['pages']
+        print(f"Parsing with {mode}: {counts['pages']} pages, {counts['cpu_seconds']:.2f}s CPU "
+              f"({average:.1f}ms per page).")
@@ -0,0 +1,137 @@
+import math
+import time
+
+from writers.units import price_per_gram
+
+# Values the parsers fall back to when a card is missing a field
+PLACEHOLDER_NAMES = {'No name found'}
+PLACEHOLDER_BRANDS = {'No brand found'}
+
+# Robust z-score above which a value is an outlier within its (location, strain type) group
+ROBUST_Z_LIMIT = 3.5
+
+# Menus price most products identically, which makes the MAD tiny; it is never taken to be
+# smaller than this fraction of the median so ordinary sale prices are not flagged
+MAD_FLOOR = 0.1
+
+# IQR fence multiplier, used when a group's values are too uniform for a robust z-score
+IQR_FENCE = 3.0
+
+# Groups smaller than this are too small to judge outliers in
+MIN_GROUP_SIZE = 8
+
+COLUMNS = ('id', 'Product', 'Brand', 'Potency', 'Weight', 'Price', 'StrainType', 'Location')
+
+# Create the side table suspicious rows are moved to instead of being published
+def create_quarantine_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS flower_quarantine (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Product TEXT,
+            Brand TEXT,
+            Potency REAL,
+            Weight REAL,
+            Price REAL,
+            StrainType TEXT,
+            Location TEXT,
+            RunId INTEGER,
+            Reason TEXT,
+            QuarantinedAt REAL
+        )
+    ''')
+
+def load_columns(cursor, table, location):
+    """ Load a location's rows from table as a dict of column lists. """
+    rows = cursor.execute(f'SELECT {", ".join(COLUMNS)} FROM {table} WHERE Location = ?', (location,)).fetchall()
+    if not rows:
+        return {column: [] for column in COLUMNS}
+    return dict(zip(COLUMNS, map(list, zip(*rows))))
+
+def quantile(ordered, q):
+    """ Linearly interpolated quantile of an already sorted list. """
+    position = (len(ordered) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def outliers(values, groups):
+    """ Return the indexes of values that are outliers within their group.
+
+    values and groups are parallel columns; None values are ignored. A value is an
+    outlier when its robust z-score (median / MAD, floored at MAD_FLOOR of the median)
+    exceeds ROBUST_Z_LIMIT, or, in groups whose MAD is still zero, when it falls outside
+    the IQR_FENCE fences.
+    """
+    members = {}
+    for index, (value, group) in enumerate(zip(values, groups)):
+        if value is not None:
+            members.setdefault(group, []).append(index)
+
+    flagged = []
+    for indexes in members.values():
+        if len(indexes) < MIN_GROUP_SIZE:
+            continue
+        group_values = [values[i] for i in indexes]
+        ordered = sorted(group_values)
+        median = quantile(ordered, 0.5)
+        mad = quantile(sorted(abs(value - median) for value in group_values), 0.5)
+        mad = max(mad, MAD_FLOOR * abs(median))
+
+        if mad:
+            scale = 0.6745 / mad
+            flagged.extend(i for i, value in zip(indexes, group_values)
+                           if abs(value - median) * scale > ROBUST_Z_LIMIT)
+        else:
+            q1, q3 = quantile(ordered, 0.25), quantile(ordered, 0.75)
+            low, high = q1 - IQR_FENCE * (q3 - q1), q3 + IQR_FENCE * (q3 - q1)
+            if q3 > q1:
+                flagged.extend(i for i, value in zip(indexes, group_values) if value < low or value > high)
+    return flagged
+
+def screen(columns):
+    """ Return ({row index: reason}, missing_potency_count) for a dict of column lists. """
+    reasons = {}
+    groups = list(zip(columns['Location'], columns['StrainType']))
+
+    # Prices are compared on a log scale, where a $25 eighth next to $35 ones is ordinary
+    # but a $10 "eighth" that is really a preroll stands out
+    unit_prices = [math.log(value) if value else None
+                   for value in map(price_per_gram, columns['Price'], columns['Weight'])]
+    for index in outliers(unit_prices, groups):
+        reasons[index] = 'price per gram outlier'
+    for index in outliers(columns['Potency'], groups):
+        reasons.setdefault(index, 'potency outlier')
+
+    for index, (price, weight) in enumerate(zip(columns['Price'], columns['Weight'])):
+        if price is None or weight is None:
+            reasons[index] = 'missing price or weight'
+    for index, brand in enumerate(columns['Brand']):
+        if brand in PLACEHOLDER_BRANDS:
+            reasons[index] = 'placeholder brand'
+    for index, name in enumerate(columns['Product']):
+        if name in PLACEHOLDER_NAMES:
+            reasons[index] = 'placeholder name'
+
+    missing_potency = sum(1 for potency in columns['Potency'] if potency is None)
+    return reasons, missing_potency
+
+def quarantine_staged(cursor, location, run_id):
+    """ Screen a location's staged rows before publish and move suspicious ones to flower_quarantine. """
+    create_quarantine_table(cursor)
+    columns = load_columns(cursor, 'flower_partial', location)
+    reasons, missing_potency = screen(columns)
+
+    if reasons:
+        now = time.time()
+        cursor.executemany('''
+            INSERT INTO flower_quarantine
+                (Product, Brand, Potency, Weight, Price, StrainType, Location, RunId, Reason, QuarantinedAt)
+            SELECT Product, Brand, Potency, Weight, Price, StrainType, Location, ?, ?, ?
+            FROM flower_partial WHERE id = ?
+        ''', [(run_id, reason, now, columns['id'][index]) for index, reason in reasons.items()])
+        cursor.executemany('DELETE FROM flower_partial WHERE id = ?',
+                           [(columns['id'][index],) for index in reasons])
+
+    print(f"Screened {len(columns['id'])} staged rows for {location}: {len(reasons)} quarantined, "
+          f"{missing_potency} without potency.")
+    return len(reasons)
@@ -0,0 +1,145 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlsplit
+
+# Requests per second and burst a domain gets when the registry does not set its own
+DEFAULT_RATE = 0.5
+DEFAULT_BURST = 3
+# The rate never drops below this, so a domain that throttled once is still retried
+MIN_RATE = 0.01
+# A throttled or failing response halves the rate; each good response wins back this share of the
+# configured rate, a fixed step whatever the rate fell to, so a domain is probed upwards again slowly
+BACKOFF_FACTOR = 0.5
+RECOVERY = 0.02
+# Responses slower than this count as the server struggling and ease the rate off a little
+SLOW_SECONDS = 15
+SLOW_FACTOR = 0.75
+# Pause after a 429 without a Retry-After header
+THROTTLE_PAUSE = 30
+
+# Statuses that mean the server wants fewer requests
+THROTTLE_STATUSES = {429, 503}
+
+def domain_of(url):
+    """ 'https://www.codesdispensary.com/location/...' -> 'codesdispensary.com' """
+    host = urlsplit(url).hostname or ''
+    return host[4:] if host.startswith('www.') else host
+
+class TokenBucket:
+    """ Tokens for one domain, refilled at rate per second up to burst.
+
+    A caller that finds no token takes one anyway, leaving the bucket in debt, and sleeps until
+    the debt would have been refilled; callers are served in the order they arrived.
+    """
+    def __init__(self, rate, burst):
+        self.configured_rate = self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'wait_seconds': 0.0, 'max_wait': 0.0, 'throttled': 0, 'slow': 0}
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """ Wait for a token and return the seconds waited. """
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+            self.tokens -= 1
+            wait = max(-self.tokens / self.rate, self.paused_until - now, 0)
+            self.stats['requests'] += 1
+            self.stats['wait_seconds'] += wait
+            self.stats['max_wait'] = max(self.stats['max_wait'], wait)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def record(self, status=None, seconds=None, retry_after=None):
+        """ Adapt the rate to a response: back off on throttling, server errors or slowness, and
+        recover towards the configured rate otherwise. status is None for browser page loads.
+        """
+        with self.lock:
+            self.refill(time.monotonic())
+            if status is not None and (status in THROTTLE_STATUSES or status >= 500):
+                self.stats['throttled'] += 1
+                self.rate = max(self.rate * BACKOFF_FACTOR, MIN_RATE)
+                if status == 429:
+                    self.paused_until = time.monotonic() + (retry_after or THROTTLE_PAUSE)
+            elif seconds is not None and seconds > SLOW_SECONDS:
+                self.stats['slow'] += 1
+                self.rate = max(self.rate * SLOW_FACTOR, MIN_RATE)
+            else:
+                self.rate = min(self.rate + self.configured_rate * RECOVERY, self.configured_rate)
+
+_buckets = {}
+_settings = {}
+_lock = threading.Lock()
+
+def configure(domains, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+    """ Set the default rate and burst and per-domain {'rate': ..., 'burst': ...} overrides.
+
+    Buckets already handed out keep their state; a changed setting applies to them from now on.
+    """
+    with _lock:
+        _settings.clear()
+        _settings.update({'rate': rate, 'burst': burst, 'domains': dict(domains)})
+        for domain, bucket in _buckets.items():
+            bucket.configured_rate, bucket.burst = domain_settings(domain)
+            bucket.rate = min(bucket.rate, bucket.configured_rate)
+
+def domain_settings(domain):
+    limits = _settings.get('domains', {}).get(domain, {})
+    return (limits.get('rate', _settings.get('rate', DEFAULT_RATE)),
+            limits.get('burst', _settings.get('burst', DEFAULT_BURST)))
+
+def bucket(url):
+    """ The shared bucket of url's domain, created on first use. """
+    domain = domain_of(url)
+    with _lock:
+        if domain not in _buckets:
+            _buckets[domain] = TokenBucket(*domain_settings(domain))
+        return _buckets[domain]
+
+def acquire(url):
+    return bucket(url).acquire()
+
+def record(url, status=None, seconds=None, retry_after=None):
+    bucket(url).record(status, seconds, retry_after)
+
+def load(driver, url):
+    """ Open url in a Selenium driver once its domain has a token, and time the load. """
+    acquire(url)
+    started = time.monotonic()
+    driver.get(url)
+    record(url, seconds=time.monotonic() - started)
+
+def urlopen(request, timeout=30):
+    """ urllib.request.urlopen behind the request's domain limit; throttling responses feed back into it. """
+    url = request.full_url if isinstance(request, urllib.request.Request) else request
+    acquire(url)
+    started = time.monotonic()
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        retry_after = e.headers.get('Retry-After') if e.headers else None
+        record(url, e.code, time.monotonic() - started,
+               float(retry_after) if retry_after and retry_after.isdigit() else None)
+        raise
+    record(url, response.status, time.monotonic() - started)
+    return response
+
+def report():
+    """ Print requests, time spent waiting for tokens and backoffs per domain. """
+    for domain, limiter in sorted(_buckets.items()):
+        counts = limiter.stats
+        if not counts['requests']:
+            continue
+        print(f"Rate limit {domain}: {counts['requests']} requests, {counts['wait_seconds']:.1f}s waiting "
+              f"for tokens (max {counts['max_wait']:.1f}s), {counts['throttled']} throttled, "
+              f"{counts['slow']} slow, now {limiter.rate:.2f}/s of {limiter.configured_rate:.2f}/s")
@@ -0,0 +1,37 @@
+import sys
+
+# Order of the fields in ProductVariant.fields() and from_fields()
+FIELDS = ('name', 'brand', 'strain_type', 'potency', 'weight', 'price')
+
+class ProductVariant:
+    """ One weight/price option of a menu product.
+
+    Brand, strain type and location repeat across every variant of a menu, so they
+    are interned and all variants share a single copy of each string.
+    """
+    __slots__ = ('name', 'brand', 'strain_type', 'potency', 'weight', 'price', 'location')
+
+    def __init__(self, name, brand, strain_type, potency, weight, price, location):
+        self.name = name
+        self.brand = sys.intern(brand)
+        self.strain_type = sys.intern(strain_type)
+        self.potency = potency
+        self.weight = weight
+        self.price = price
+        self.location = sys.intern(location)
+
+    def __repr__(self):
+        return (f"ProductVariant({self.name!r}, {self.brand!r}, {self.strain_type!r}, "
+                f"{self.potency!r}, {self.weight!r}, {self.price!r}, {self.location!r})")
+
+    def fields(self):
+        """ Location-free tuple used to send variants between processes and into the page cache. """
+        return (self.name, self.brand, self.strain_type, self.potency, self.weight, self.price)
+
+    def row(self):
+        """ Tuple in flower column order: Product, Brand, Potency, Weight, Price, StrainType, Location. """
+        return (self.name, self.brand, self.potency, self.weight, self.price, self.strain_type, self.location)
+
+def from_fields(fields, location):
+    """ Rebuild a variant from fields() and the location it was scraped at. """
+    return ProductVariant(*fields, location)
@@ -0,0 +1,200 @@
+import importlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from writers import rate_limit
+
+REGISTRY_PATH = '../sites.json'
+
+# Adapter name -> writer module scraping that kind of menu. The greenlight writer takes one
+# site per call, the others a list of (url, location) sharing a browser.
+ADAPTERS = {
+    'greenlight': 'writers.green_light_writer',
+    'dutchie': 'writers.dutchie_writer',
+    'high_profile': 'writers.high_profile_writers',
+    'elevate': 'writers.elevate_writer',
+}
+SINGLE_SITE_ADAPTERS = {'greenlight'}
+
+# Menu categories the parsers and the flower table understand
+CATEGORIES = {'flower'}
+
+# Budgets a site may override; each writer uses the ones that apply to it
+TIMING_KEYS = {'scroll_presses', 'scroll_pause', 'load_wait', 'age_gate_wait', 'implicit_wait', 'page_timeout'}
+
+SITE_KEYS = {'location', 'adapter', 'url', 'category', 'enabled', 'timing'}
+REGISTRY_KEYS = {'max_browsers', 'domain_concurrency', 'domain_rate', 'domain_burst', 'domains', 'sites'}
+# Limits a domain may set for itself under "domains"
+DOMAIN_KEYS = {'concurrency', 'rate', 'burst'}
+
+class RegistryError(ValueError):
+    pass
+
+class Site:
+    """ One store's menu and how to scrape it. """
+    __slots__ = ('location', 'adapter', 'url', 'category', 'enabled', 'timing')
+
+    def __init__(self, location, adapter, url, category='flower', enabled=True, timing=None):
+        self.location = location
+        self.adapter = adapter
+        self.url = url
+        self.category = category
+        self.enabled = enabled
+        self.timing = timing or {}
+
+    def __repr__(self):
+        return f"Site({self.location!r}, {self.adapter!r}, {self.url!r})"
+
+    @property
+    def domain(self):
+        return rate_limit.domain_of(self.url)
+
+class Registry:
+    """ The sites to scrape, how many browsers may load them at once, overall and per domain, and
+    how many requests per second each domain is sent.
+    """
+    def __init__(self, sites, max_browsers=1, domain_concurrency=1, domains=None,
+                 domain_rate=rate_limit.DEFAULT_RATE, domain_burst=rate_limit.DEFAULT_BURST):
+        self.sites = sites
+        self.max_browsers = max_browsers
+        self.domain_concurrency = domain_concurrency
+        self.domains = domains or {}
+        self.domain_rate = domain_rate
+        self.domain_burst = domain_burst
+
+    def subset(self, sites):
+        """ The same limits over only the given sites. """
+        return Registry(sites, self.max_browsers, self.domain_concurrency, self.domains, self.domain_rate,
+                        self.domain_burst)
+
+    def concurrency(self, domain):
+        return self.domains.get(domain, {}).get('concurrency', self.domain_concurrency)
+
+    def queue_limits(self):
+        """ The same limits as job_queue.claim arguments, so queue workers on any machine keep to them. """
+        return {
+            'max_leased': self.max_browsers,
+            'domain_concurrency': self.domain_concurrency,
+            'domain_limits': {domain: settings['concurrency'] for domain, settings in self.domains.items()
+                              if 'concurrency' in settings},
+        }
+
+    def enabled(self):
+        return [site for site in self.sites if site.enabled]
+
+def positive_number(value, integer=False):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0 and \
+        (not integer or isinstance(value, int))
+
+def site_problems(index, entry):
+    """ Everything wrong with one registry entry, as messages naming it. """
+    if not isinstance(entry, dict):
+        return [f"sites[{index}] must be an object"]
+    name = f"sites[{index}] ({entry.get('location', 'no location')})"
+    problems = [f"{name}: unknown key {key!r}" for key in sorted(set(entry) - SITE_KEYS)]
+    for key in ('location', 'adapter', 'url'):
+        if not isinstance(entry.get(key), str) or not entry.get(key).strip():
+            problems.append(f"{name}: {key} is required")
+    if 'adapter' in entry and entry['adapter'] not in ADAPTERS:
+        problems.append(f"{name}: adapter must be one of {', '.join(sorted(ADAPTERS))}, got {entry['adapter']!r}")
+    if isinstance(entry.get('url'), str):
+        url = urlsplit(entry['url'])
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            problems.append(f"{name}: url must be an http(s) URL, got {entry['url']!r}")
+    if entry.get('category', 'flower') not in CATEGORIES:
+        problems.append(f"{name}: category must be one of {', '.join(sorted(CATEGORIES))}, "
+                        f"got {entry['category']!r}")
+    if not isinstance(entry.get('enabled', True), bool):
+        problems.append(f"{name}: enabled must be true or false")
+
+    timing = entry.get('timing', {})
+    if not isinstance(timing, dict):
+        problems.append(f"{name}: timing must be an object")
+    else:
+        for key, value in timing.items():
+            if key not in TIMING_KEYS:
+                problems.append(f"{name}: unknown timing {key!r}, expected one of {', '.join(sorted(TIMING_KEYS))}")
+            elif not (value is None and key == 'page_timeout') and not positive_number(value):
+                problems.append(f"{name}: timing {key} must be a positive number")
+    return problems
+
+def parse_registry(data):
+    """ Validate a loaded registry and return a Registry, or raise RegistryError listing every problem. """
+    if not isinstance(data, dict) or not isinstance(data.get('sites'), list):
+        raise RegistryError("a site registry must be an object with a list of sites")
+    problems = [f"unknown key {key!r}" for key in sorted(set(data) - REGISTRY_KEYS)]
+    for key in ('max_browsers', 'domain_concurrency'):
+        if key in data and not positive_number(data[key], integer=True):
+            problems.append(f"{key} must be a positive whole number")
+    for key in ('domain_rate', 'domain_burst'):
+        if key in data and not positive_number(data[key]):
+            problems.append(f"{key} must be a positive number")
+    domains = data.get('domains', {})
+    if not isinstance(domains, dict) or not all(isinstance(limits, dict) for limits in domains.values()):
+        problems.append("domains must map each domain to an object of limits")
+    else:
+        for domain, limits in domains.items():
+            problems.extend(f"domains[{domain!r}]: unknown key {key!r}" for key in sorted(set(limits) - DOMAIN_KEYS))
+            if 'concurrency' in limits and not positive_number(limits['concurrency'], integer=True):
+                problems.append(f"domains[{domain!r}]: concurrency must be a positive whole number")
+            for key in ('rate', 'burst'):
+                if key in limits and not positive_number(limits[key]):
+                    problems.append(f"domains[{domain!r}]: {key} must be a positive number")
+
+    seen = set()
+    for index, entry in enumerate(data['sites']):
+        problems.extend(site_problems(index, entry))
+        location = entry.get('location') if isinstance(entry, dict) else None
+        if location in seen:
+            problems.append(f"sites[{index}]: location {location!r} is listed twice")
+        seen.add(location)
+    if problems:
+        raise RegistryError("invalid site registry:\n  " + "\n  ".join(problems))
+
+    return Registry([Site(**entry) for entry in data['sites']], data.get('max_browsers', 1),
+                    data.get('domain_concurrency', 1), domains, data.get('domain_rate', rate_limit.DEFAULT_RATE),
+                    data.get('domain_burst', rate_limit.DEFAULT_BURST))
+
+def load_registry(path=REGISTRY_PATH):
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        raise RegistryError(f"{path} is not valid JSON: {e}") from e
+    return parse_registry(data)
+
+def scrape_site(site, resume=False):
+    """ Scrape one site with its adapter's writer and the site's timing overrides. """
+    writer = importlib.import_module(ADAPTERS[site.adapter])
+    print(f"Running {site.adapter} scraper for {site.location}...")
+    if site.adapter in SINGLE_SITE_ADAPTERS:
+        writer.scrape_data(site.url, site.location, resume, site.timing)
+    else:
+        writer.scrape_data([(site.url, site.location)], resume, site.timing)
+
+def scrape_sites(registry, resume=False):
+    """ Scrape every enabled site in registry order, at most max_browsers at a time and no more
+    per domain than its concurrency allows. A site that fails is reported and the rest go on.
+    """
+    rate_limit.configure(registry.domains, registry.domain_rate, registry.domain_burst)
+    limits = {}
+    for site in registry.enabled():
+        limits.setdefault(site.domain, threading.BoundedSemaphore(registry.concurrency(site.domain)))
+
+    def run(site):
+        with limits[site.domain]:
+            try:
+                scrape_site(site, resume)
+            except Exception as e:
+                print(f"Error scraping {site.location}: {e}")
+                return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=registry.max_browsers) as pool:
+        results = list(pool.map(run, registry.enabled()))
+    print(f"Scraped {sum(results)} of {len(results)} enabled sites, "
+          f"{len(registry.sites) - len(results)} disabled.")
+    rate_limit.report()
+    return sum(results)
@@ -0,0 +1,179 @@
+import math
+import random
+import sqlite3
+import time
+
+from writers import alerts, changes, db_writer, ingest, matching, registry
+
+# Chance a menu has changed that a scrape is timed for: a menu changing about hourly is checked
+# about every 40 minutes, one changing weekly about every 5 days
+TARGET_CHANGE_PROBABILITY = 0.5
+# Bounds on how often one site is scraped, and the interval used before it has any history
+MIN_INTERVAL = 30 * 60
+MAX_INTERVAL = 7 * 24 * 3600
+DEFAULT_INTERVAL = 6 * 3600
+# Retry delay after a scrape that did not finish, doubled after each further failure in a row
+# up to MAX_INTERVAL, so a site that stays broken is not retried every few minutes forever
+RETRY_INTERVAL = 15 * 60
+# Each interval is moved by up to this fraction either way so sites do not fall into lockstep
+JITTER = 0.1
+# Checks of a location the change rate is estimated from
+HISTORY_CHECKS = 20
+# Seconds between looks at the queue when nothing is due
+POLL_SECONDS = 60
+
+# Create the table holding every site's place in the queue
+def create_schedule_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_schedule (
+            Location TEXT PRIMARY KEY,
+            ChangeRate REAL,
+            IntervalSeconds REAL,
+            LastRunAt REAL,
+            NextRunAt REAL,
+            Failures INTEGER DEFAULT 0
+        )
+    ''')
+
+def change_rate(checks):
+    """ Estimate a menu's changes per second from its recent checks, or None without enough history.
+
+    checks is [(checked at, changed)] oldest first. A check only says whether the menu changed at
+    least once since the one before, so the Poisson estimator -ln((n - X + 0.5) / (n + 0.5)) / I is
+    used instead of X / (n I), which undercounts menus changing more often than they are checked.
+    """
+    if len(checks) < 2:
+        return None
+    gaps = len(checks) - 1
+    changed = sum(flag for _, flag in checks[1:])
+    mean_gap = (checks[-1][0] - checks[0][0]) / gaps
+    if mean_gap <= 0:
+        return None
+    return -math.log((gaps - changed + 0.5) / (gaps + 0.5)) / mean_gap
+
+def interval_for(rate):
+    """ Seconds until a menu changing at rate has TARGET_CHANGE_PROBABILITY of having changed. """
+    if rate is None:
+        return DEFAULT_INTERVAL
+    if rate <= 0:
+        return MAX_INTERVAL
+    return min(max(-math.log(1 - TARGET_CHANGE_PROBABILITY) / rate, MIN_INTERVAL), MAX_INTERVAL)
+
+def jittered(seconds):
+    return seconds * random.uniform(1 - JITTER, 1 + JITTER)
+
+def priority(rate, last_run_at, now):
+    """ Probability the menu has changed since it was last scraped; never scraped sites come first. """
+    if last_run_at is None:
+        return 1.0
+    return 1 - math.exp(-(rate if rate is not None else 1 / DEFAULT_INTERVAL) * (now - last_run_at))
+
+def retry_interval(failures):
+    """ Seconds before retrying a site whose last scrapes failed failures times in a row. """
+    return min(RETRY_INTERVAL * 2 ** failures, MAX_INTERVAL)
+
+def recent_checks(cursor, location):
+    return cursor.execute('''
+        SELECT CheckedAt, Changed FROM menu_checks WHERE Location = ? ORDER BY CheckedAt DESC LIMIT ?
+    ''', (location, HISTORY_CHECKS)).fetchall()[::-1]
+
+def queue(sites, db_path=ingest.DB_PATH, now=None):
+    """ Return [(site, next run at, priority, interval, rate)] for every enabled site, due ones first and
+    the most likely to have changed first among those.
+    """
+    now = now or time.time()
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        create_schedule_table(cursor)
+        schedule = {row[0]: row[1:] for row in cursor.execute('''
+            SELECT Location, ChangeRate, IntervalSeconds, LastRunAt, NextRunAt FROM scrape_schedule
+        ''')}
+    finally:
+        conn.close()
+
+    entries = []
+    for site in sites.enabled():
+        rate, interval, last_run_at, next_run_at = schedule.get(site.location, (None, None, None, None))
+        entries.append((site, next_run_at or now, priority(rate, last_run_at, now), interval, rate))
+    entries.sort(key=lambda entry: (entry[1] > now, -entry[2] if entry[1] <= now else entry[1]))
+    return entries
+
+def reschedule(locations, started, db_path=ingest.DB_PATH):
+    """ Work out each scraped location's change rate again and give it its next run time.
+
+    A location with no check since started did not finish and is retried sooner, backing off
+    with each failure in a row.
+    """
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+        create_schedule_table(cursor)
+        changes.create_changes_table(cursor)
+        now = time.time()
+        for location in locations:
+            checks = recent_checks(cursor, location)
+            if not checks or checks[-1][0] < started:
+                failures = cursor.execute('SELECT Failures FROM scrape_schedule WHERE Location = ?',
+                                          (location,)).fetchone()
+                failures = (failures[0] or 0) if failures else 0
+                cursor.execute('''
+                    INSERT INTO scrape_schedule (Location, NextRunAt, Failures) VALUES (?, ?, ?)
+                    ON CONFLICT (Location) DO UPDATE SET NextRunAt = excluded.NextRunAt, Failures = excluded.Failures
+                ''', (location, now + jittered(retry_interval(failures)), failures + 1))
+                continue
+            rate = change_rate(checks)
+            interval = interval_for(rate)
+            cursor.execute('''
+                INSERT OR REPLACE INTO scrape_schedule
+                    (Location, ChangeRate, IntervalSeconds, LastRunAt, NextRunAt, Failures)
+                VALUES (?, ?, ?, ?, ?, 0)
+            ''', (location, rate, interval, checks[-1][0], now + jittered(interval)))
+        conn.commit()
+    finally:
+        conn.close()
+
+def run_wave(sites, due, resume=False):
+    """ Scrape the due sites as one run, within the registry's browser budget and domain limits. """
+    started = time.time()
+    run_id = ingest.start_run(resume)
+    registry.scrape_sites(sites.subset(due), resume)
+    db_writer.close()
+    ingest.finish_run(run_id)
+
+    matching.match_new_products()
+    alerts.evaluate_changes()
+    reschedule([site.location for site in due], started)
+
+def run_forever(registry_path=registry.REGISTRY_PATH, max_wave=None):
+    """ Scrape sites as they come due, until interrupted.
+
+    The registry is read again before every wave, so sites can be added, disabled or retimed
+    without a restart. A wave takes at most max_wave due sites, twice the browser budget by
+    default, so sites coming due meanwhile are not stuck behind a long queue. A wave that fails,
+    e.g. on an invalid registry or a locked database, is reported and tried again after
+    POLL_SECONDS.
+    """
+    while True:
+        try:
+            sites = registry.load_registry(registry_path)
+            now = time.time()
+            entries = queue(sites, now=now)
+            due = [site for site, next_run_at, *_ in entries if next_run_at <= now]
+            if not due:
+                waits = [next_run_at - now for _, next_run_at, *_ in entries]
+                time.sleep(min(waits + [POLL_SECONDS]))
+                continue
+            run_wave(sites, due[:max_wave or 2 * sites.max_browsers])
+        except Exception as e:
+            print(f"Error running a scrape wave: {e}")
+            time.sleep(POLL_SECONDS)
+
+def print_queue(registry_path=registry.REGISTRY_PATH, db_path=ingest.DB_PATH):
+    now = time.time()
+    print(f"{'Location':<24} {'Due in':>9} {'Priority':>8} {'Interval':>9} {'Changes/day':>11}")
+    for site, next_run_at, chance, interval, rate in queue(registry.load_registry(registry_path), db_path, now):
+        due_in = max(next_run_at - now, 0) / 3600
+        print(f"{site.location:<24} {due_in:>8.1f}h {chance:>8.2f} "
+              f"{(interval or DEFAULT_INTERVAL) / 3600:>8.1f}h "
+              f"{'-' if rate is None else f'{rate * 86400:.1f}':>11}")
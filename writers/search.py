@@ -0,0 +1,86 @@
+import re
+
+# Token prefixes FTS5 keeps its own index for, so short autocomplete prefixes are a single lookup
+PREFIX_INDEX = "prefix='1 2 3'"
+
+TOKEN = re.compile(r'\w+')
+
+# Create the full-text index over every published variant and the index of distinct names
+# used for autocomplete
+def create_search_tables(cursor):
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'flower_fts'").fetchone()
+
+    # Indexes the flower view's text; flower_rows triggers keep it in step with every publish
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS flower_fts USING fts5(
+            Product, Brand, content='flower', content_rowid='id', {PREFIX_INDEX}
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS flower_rows_fts_insert AFTER INSERT ON flower_rows
+        BEGIN
+            INSERT INTO flower_fts (rowid, Product, Brand)
+            VALUES (NEW.id, NEW.Product, (SELECT Name FROM brand_dict WHERE Code = NEW.BrandId));
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS flower_rows_fts_delete AFTER DELETE ON flower_rows
+        BEGIN
+            INSERT INTO flower_fts (flower_fts, rowid, Product, Brand)
+            VALUES ('delete', OLD.id, OLD.Product, (SELECT Name FROM brand_dict WHERE Code = OLD.BrandId));
+        END
+    ''')
+
+    # One row per distinct (product, brand), so a one-letter prefix does not match every variant
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS product_names_fts USING fts5(
+            Product, Brand, Listings UNINDEXED, {PREFIX_INDEX}
+        )
+    ''')
+
+    if not exists:
+        cursor.execute("INSERT INTO flower_fts (flower_fts) VALUES ('rebuild')")
+        rebuild_names(cursor)
+
+def rebuild_names(cursor):
+    """ Rebuild the autocomplete names from the published rows.
+
+    Names are inserted most listed first, so rowid order is popularity order and FTS5, which
+    returns matches in rowid order, can stop after the first few instead of sorting them all.
+    """
+    cursor.execute('DELETE FROM product_names_fts')
+    cursor.execute('''
+        INSERT INTO product_names_fts (Product, Brand, Listings)
+        SELECT Product, Brand, COUNT(*) AS Listings FROM flower WHERE Product IS NOT NULL
+        GROUP BY Product, Brand ORDER BY Listings DESC, Product
+    ''')
+
+def match_expression(text, prefix_last=False):
+    """ Turn what a user typed into an FTS5 query matching every word, or None when there are no words.
+
+    Words are quoted so FTS5 operators and punctuation in the input are taken literally. With
+    prefix_last the final word may be incomplete, as it is while typing.
+    """
+    words = TOKEN.findall(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if prefix_last:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_query(text, limit=20):
+    """ Return (sql, params) for variants matching text, best match first. """
+    return ('''
+        SELECT f.id, f.Product, f.Brand, f.Potency, f.Weight, f.Price, f.PricePerGram, f.StrainType, f.Location,
+               bm25(flower_fts) AS Score
+        FROM flower_fts JOIN flower f ON f.id = flower_fts.rowid
+        WHERE flower_fts MATCH ? ORDER BY rank LIMIT ?
+    ''', (match_expression(text), limit))
+
+def autocomplete_query(prefix, limit=10):
+    """ Return (sql, params) for product names completing prefix, the most listed first. """
+    return ('''
+        SELECT Product, Brand, Listings FROM product_names_fts
+        WHERE product_names_fts MATCH ? ORDER BY rowid LIMIT ?
+    ''', (match_expression(prefix, prefix_last=True), limit))
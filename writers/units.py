@@ -0,0 +1,29 @@
+# Weight is stored in grams; menu labels in ounces are converted when they are parsed
+OUNCE_IN_GRAMS = 28.0
+
+# Sizes sold as fractions of an ounce, by their weight in grams
+WEIGHT_BUCKETS = {
+    3.5: '1/8 oz',
+    7.0: '1/4 oz',
+    14.0: '1/2 oz',
+    28.0: '1 oz',
+}
+
+def grams(weight):
+    """ Stored Weight value -> grams, or None when the weight is missing. """
+    if not weight:
+        return None
+    return weight
+
+def price_per_gram(price, weight):
+    """ Price divided by the weight in grams, or None when either is missing. """
+    weight_in_grams = grams(weight)
+    if price is None or not weight_in_grams:
+        return None
+    return price / weight_in_grams
+
+def weight_bucket(weight):
+    """ Label of the menu size a stored Weight value belongs to, e.g. '1/8 oz' or '56g'. """
+    if weight is None:
+        return 'unknown'
+    return WEIGHT_BUCKETS.get(weight) or f"{weight:g}g"